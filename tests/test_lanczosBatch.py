@@ -0,0 +1,39 @@
+import numpy as np
+from PIL import Image
+import lanczosBatch
+import resizeCommon
+
+
+def soft_alpha_image(size=(900, 1350)):
+    """Colour noise under a gradient alpha, mostly semi-transparent."""
+    rng = np.random.default_rng(0)
+    width, height = size
+    pixels = rng.integers(0, 256, (height, width, 4), dtype=np.uint8)
+    pixels[..., 3] = np.linspace(0, 64, width, dtype=np.uint8)[None, :]
+    return Image.fromarray(pixels, 'RGBA')
+
+
+def max_difference(a, b):
+    return int(np.abs(np.asarray(a, dtype=np.int16) - np.asarray(b, dtype=np.int16)).max())
+
+
+def test_rgb_within_tolerance():
+    img = soft_alpha_image().convert('RGB')
+    assert lanczosBatch.compare(img, (600, 900))[0] <= lanczosBatch.TOLERANCE
+
+
+def test_semi_transparent_images_match_pillow(tmp_path):
+    img = soft_alpha_image()
+    assert lanczosBatch.resize(img, (600, 900)) is None
+    resizeCommon.set_resampler('numpy')
+    try:
+        for mode in ('RGBA', 'LA'):
+            source = img.convert(mode)
+            for size in ((600, 900), (1200, 1800)):
+                expected = source.resize(size, Image.LANCZOS)
+                assert max_difference(resizeCommon.lanczos_resize(source, size), expected) == 0
+    finally:
+        resizeCommon.set_resampler(None)
+    img.save(tmp_path / 'soft.png')
+    img.convert('RGB').save(tmp_path / 'opaque.png')
+    assert lanczosBatch.check_folder(str(tmp_path), 600)
@@ -0,0 +1,57 @@
+import io
+import os
+import pytest
+from PIL import Image
+from PIL.PngImagePlugin import PngInfo
+import benchmarkResize
+import metadataCatalog
+
+
+def save_png(path, size, prompt):
+    info = PngInfo()
+    info.add_text('Description', prompt)
+    Image.new('RGB', size, (40, 90, 160)).save(path, pnginfo=info)
+
+
+@pytest.mark.parametrize('pipeline', [None, (2, 4)])
+def test_catalog_records_passthrough_outputs(tmp_path, pipeline):
+    input_folder, output_folder = tmp_path / 'in', tmp_path / 'out'
+    input_folder.mkdir()
+    # Already the target width, so it is copied instead of resized
+    save_png(input_folder / 'passed.png', (1200, 600), 'a passthrough whale --ar 2:1')
+    save_png(input_folder / 'resized.png', (1600, 800), 'a resized whale --ar 2:1')
+    variant = benchmarkResize.load_variant(benchmarkResize.find_variants(['o3mini-high-q1'])['o3mini-high-q1'])
+    variant.process_images(str(input_folder), str(output_folder), catalog=True, pipeline=pipeline)
+
+    catalog = metadataCatalog.Catalog(str(output_folder / metadataCatalog.CATALOG_NAME))
+    try:
+        rows = {os.path.basename(path).split('-')[0]: (kind, width, prompt)
+                for path, kind, width, _, _, prompt in catalog.find('whale')}
+    finally:
+        catalog.close()
+    assert rows == {
+        'passed': ('output', 1200, 'a passthrough whale --ar 2:1'),
+        'resized': ('output', 1200, 'a resized whale --ar 2:1'),
+    }
+
+
+class RecordingFile(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.sizes = []
+
+    def read(self, size=-1):
+        self.sizes.append(size)
+        return super().read(size)
+
+
+@pytest.mark.parametrize('segment', [
+    b'\xff\xe1\x00\x01Exif\0\0',        # length below 2
+    b'\xff\xfe\x00\x00comment',         # length 0
+    b'\xff\xfe\xff\xf0short comment',   # length past the end of the file
+    b'\xff\xc0\x00\x04\x08\x00',        # frame header too short for its dimensions
+])
+def test_read_jpeg_stops_at_malformed_segment_length(segment):
+    f = RecordingFile(b'\xff\xd8' + segment + b'\0' * 64)
+    assert metadataCatalog.read_jpeg(f) == {'format': 'JPEG', 'text': {}}
+    assert all(size is not None and 0 <= size <= 5 for size in f.sizes[1:])
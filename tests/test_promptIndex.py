@@ -0,0 +1,18 @@
+from promptIndex import PromptIndex
+
+
+def test_add_file_indexes_last_line_without_newline(tmp_path):
+    prompts = tmp_path / 'prompts.txt'
+    prompts.write_bytes(b'a cat on a roof --ar 16:9\na dog in the snow --ar 2:3')
+    index = PromptIndex(str(tmp_path / 'index.sqlite'))
+    try:
+        assert index.add_file(str(prompts)) == 2
+        assert [p for _, p in index.search(terms=['dog'])] == ['a dog in the snow --ar 2:3']
+        # Adding again reads nothing; an append is indexed once
+        assert index.add_file(str(prompts)) == 0
+        with open(prompts, 'ab') as f:
+            f.write(b'\na bird over the sea\n')
+        assert index.add_file(str(prompts)) == 1
+        assert index.count() == 3
+    finally:
+        index.close()
@@ -0,0 +1,61 @@
+import pytest
+from promptParser import parse_prompt
+
+
+def codes(prompt):
+    return [code for code, _ in parse_prompt(prompt).errors]
+
+
+def test_image_url_containing_dashes():
+    parsed = parse_prompt("https://s.mj.run/ab--cdEF12 a whale --ar 16:9")
+    assert parsed.image_urls == ["https://s.mj.run/ab--cdEF12"]
+    assert parsed.text == "a whale"
+    assert parsed.params == {'aspect_ratio': '16:9'}
+    assert parsed.valid
+
+
+def test_several_image_prompts():
+    parsed = parse_prompt("https://s.mj.run/one https://s.mj.run/t--wo http://example.com/3.png "
+                          "two whales --iw 1.5 --v 6.1")
+    assert parsed.image_urls == ["https://s.mj.run/one", "https://s.mj.run/t--wo", "http://example.com/3.png"]
+    assert parsed.text == "two whales"
+    assert parsed.params == {'image_weight': 1.5, 'version': '6.1'}
+    assert parsed.valid
+
+
+def test_image_prompt_without_text():
+    parsed = parse_prompt("https://s.mj.run/ab--cd --ar 2:3")
+    assert parsed.image_urls == ["https://s.mj.run/ab--cd"]
+    assert parsed.text == ""
+    assert parsed.params == {'aspect_ratio': '2:3'}
+
+
+def test_dashes_inside_words_and_parameter_urls():
+    parsed = parse_prompt("a well--known whale --sref https://s.mj.run/x--y::2 123::-0.5 --stylize 250")
+    assert parsed.text == "a well--known whale"
+    assert parsed.params == {'style_reference': ["https://s.mj.run/x--y::2", "123::-0.5"], 'stylize': 250}
+    assert parsed.valid
+
+
+def test_weights():
+    parsed = parse_prompt("space:: ship::2 --p l2vlr4v::0.5 abc123 --sref random::3")
+    assert parsed.text == "space:: ship::2"
+    assert parsed.params == {'personalization': ['l2vlr4v::0.5', 'abc123'], 'style_reference': ['random::3']}
+    assert parsed.valid
+
+
+@pytest.mark.parametrize('prompt, code', [
+    ("poppies--ar 2:3", 'no-space-before-dashes'),
+    ("https://s.mj.run/ab--cd poppies--ar 2:3", 'no-space-before-dashes'),
+    ("poppies - - ar 2:3", 'space-in-dashes'),
+    ("poppies -- ar 2:3", 'space-in-dashes'),
+    ("California --ar 2:3 poppies", 'text-after-parameters'),
+    ("poppies --ar 2:3,", 'punctuation'),
+    ("poppies --xyz 2", 'unknown-parameter'),
+    ("poppies --ar 2:3 --aspect 3:2", 'duplicate-parameter'),
+    ("poppies --ar 2.5:3", 'invalid-value'),
+    ("poppies --stylize 5000", 'out-of-range'),
+    ("poppies --chaos many", 'invalid-value'),
+])
+def test_errors(prompt, code):
+    assert code in codes(prompt)
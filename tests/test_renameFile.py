@@ -0,0 +1,22 @@
+import os
+import pytest
+import renameFile
+
+
+def test_file_removed_after_planning_rolls_back(tmp_path):
+    names = ['alpha.png', 'beta.png', 'gamma.png']
+    for name in names:
+        (tmp_path / name).write_bytes(b'png')
+    renames, _ = renameFile.plan_renames(str(tmp_path), '01012026')
+    os.remove(tmp_path / 'gamma.png')
+    with pytest.raises(renameFile.RenameError):
+        renameFile.apply_renames(str(tmp_path), renames)
+    assert sorted(os.listdir(tmp_path)) == ['alpha.png', 'beta.png']
+
+
+def test_dry_run_renames_nothing(tmp_path, capsys):
+    (tmp_path / 'alpha.png').write_bytes(b'png')
+    stats = renameFile.rename_png_files(str(tmp_path), '01012026', dry_run=True, show=5)
+    assert stats['renames'] == 1
+    assert os.listdir(tmp_path) == ['alpha.png']
+    assert "'alpha.png' -> 'alpha_001_01012026.png'" in capsys.readouterr().out
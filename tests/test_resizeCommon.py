@@ -0,0 +1,62 @@
+import os
+import re
+from PIL import Image
+import benchmarkResize
+
+
+def run_variant(tmp_path, images, **options):
+    input_folder, output_folder = tmp_path / 'in', tmp_path / 'out'
+    input_folder.mkdir()
+    for name, size in images.items():
+        Image.new('RGB', size, (200, 120, 40)).save(input_folder / name)
+    variant = benchmarkResize.load_variant(benchmarkResize.find_variants(['o3mini-high-q1'])['o3mini-high-q1'])
+    variant.process_images(str(input_folder), str(output_folder), **options)
+    outputs = {}
+    for name in os.listdir(output_folder):
+        if not name.startswith('.'):
+            with Image.open(output_folder / name) as img:
+                outputs[re.sub(r'-DONE-\d{8}-\d{6}', '', name)] = img.size
+    return outputs
+
+
+def test_split_grid_splits_a_grid(tmp_path):
+    outputs = run_variant(tmp_path, {'grid.png': (2912, 1632)}, split_grid=True)
+    assert outputs == {f'grid_{n}.png': (1200, 672) for n in range(1, 5)}
+
+
+def test_split_grid_resizes_a_single_image_whole(tmp_path):
+    outputs = run_variant(tmp_path, {'upscale.png': (1456, 816), 'square.png': (1024, 1024)}, split_grid=True)
+    assert outputs == {'upscale.png': (1200, 672), 'square.png': (1200, 1200)}
+
+
+def test_manifest_read_error_fails_the_file(tmp_path, monkeypatch):
+    class UnreadableManifest:
+        def lookup(self, path, name):
+            raise OSError("cannot read")
+
+        def record(self, *args):
+            raise AssertionError("nothing to record without a key")
+
+    input_folder, output_folder = tmp_path / 'in', tmp_path / 'out'
+    input_folder.mkdir()
+    output_folder.mkdir()
+    Image.new('RGB', (64, 64)).save(input_folder / 'a.png')
+    variant = benchmarkResize.load_variant(benchmarkResize.find_variants(['o3mini-high-q1'])['o3mini-high-q1'])
+    monkeypatch.setattr(variant, 'open_manifest', lambda folder: UnreadableManifest())
+    assert variant.process_file('a.png', str(input_folder), str(output_folder), manifest=True) == 'failed'
+    assert os.listdir(input_folder / 'failed') == ['a.png']
+
+
+def test_dedupe_looks_up_animated_gifs(tmp_path):
+    input_folder, output_folder = tmp_path / 'in', tmp_path / 'out'
+    input_folder.mkdir()
+    frames = [Image.linear_gradient('L').convert('RGB'), Image.radial_gradient('L').convert('RGB')]
+    for name in ('a.gif', 'b.gif'):
+        frames[0].save(input_folder / name, save_all=True, append_images=frames[1:], duration=100, loop=0)
+    variant = benchmarkResize.load_variant(benchmarkResize.find_variants(['o3mini-high-q1'])['o3mini-high-q1'])
+    variant.process_images(str(input_folder), str(output_folder), dedupe='mark')
+    names = sorted(re.sub(r'-DONE-\d{8}-\d{6}', '', name) for name in os.listdir(output_folder)
+                   if not name.startswith('.'))
+    assert names in (['a.gif', 'b_dup.gif'], ['a_dup.gif', 'b.gif'])
+    with Image.open(output_folder / next(name for name in os.listdir(output_folder) if '_dup' in name)) as img:
+        assert img.n_frames == 2
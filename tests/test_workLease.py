@@ -0,0 +1,72 @@
+import json
+import os
+import workLease
+
+
+def write_lease(path, owner, heartbeat):
+    record = {'owner': owner, 'original': 'x.png', 'path': 'x.png', 'heartbeat': heartbeat}
+    with open(path, 'w') as f:
+        json.dump(record, f)
+    return record
+
+
+def test_take_over_puts_back_a_renewed_lease(tmp_path):
+    path = str(tmp_path / 'x.png.lease')
+    stale = write_lease(path, 'other', 0)
+    renewed = write_lease(path, 'other', 10 ** 10)
+    assert not workLease.take_over(path, stale)
+    assert workLease.read_lease(path) == renewed
+    assert os.listdir(tmp_path) == ['x.png.lease']
+
+
+def test_put_back_never_overwrites_a_new_lease(tmp_path, monkeypatch):
+    path = str(tmp_path / 'x.png.lease')
+    stale = write_lease(path, 'old', 0)
+    read_lease = workLease.read_lease
+    fresh = {}
+
+    def racing_read(lease_path):
+        # Another process takes the lease while it is moved aside
+        if lease_path != path and not fresh:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'owner': 'new', 'heartbeat': 10 ** 10}, f)
+            fresh.update(read_lease(path))
+            return {'owner': 'renewed'}
+        return read_lease(lease_path)
+
+    monkeypatch.setattr(workLease, 'read_lease', racing_read)
+    assert not workLease.take_over(path, stale)
+    assert read_lease(path) == fresh
+    assert os.listdir(tmp_path) == ['x.png.lease']
+
+
+def crash(lease):
+    """Leave lease behind as a process dying now would, already expired."""
+    workLease._held.pop(lease.lease_path, None)
+    record = workLease.read_lease(lease.lease_path)
+    record['heartbeat'] = 0
+    with open(lease.lease_path, 'w') as f:
+        json.dump(record, f)
+
+
+def test_crash_after_done_move_is_not_undone(tmp_path):
+    import resizeCommon
+    (tmp_path / 'done').mkdir()
+    (tmp_path / 'a.jpg').write_bytes(b'jpeg')
+    lease = workLease.claim(str(tmp_path / 'a.jpg'))
+    resizeCommon.move_file(str(tmp_path / 'a.jpg'), str(tmp_path / 'done' / 'a.jpg'))
+    crash(lease)
+    assert workLease.recover(str(tmp_path)) == 1
+    assert os.listdir(tmp_path / 'done') == ['a.jpg']
+    assert not (tmp_path / 'a.jpg').exists()
+
+
+def test_crash_while_processing_renames_back(tmp_path):
+    import resizeCommon
+    (tmp_path / 'b.jpg').write_bytes(b'jpeg')
+    lease = workLease.claim(str(tmp_path / 'b.jpg'))
+    resizeCommon.move_file(str(tmp_path / 'b.jpg'), str(tmp_path / 'b-PROCESSING-1.jpg'), claim=True)
+    crash(lease)
+    assert workLease.recover(str(tmp_path)) == 1
+    assert sorted(os.listdir(tmp_path)) == ['.leases', 'b.jpg']
@@ -0,0 +1,80 @@
+"""
+Frame-by-frame writing of animated GIFs.
+
+img.resize() only sees the current frame of an animated GIF, and
+img.save(save_all=True) keeps every frame in memory while it encodes. Here
+frames are read one at a time with ImageSequence and each one is written out
+as soon as it is ready, so memory stays around one source frame and one
+output frame no matter how many frames the animation has.
+
+Pillow composites every source frame onto the ones before it, so each output
+frame is a full canvas and no frame offsets are needed. Duration, loop count
+and each frame's disposal method are copied from the source.
+
+PIL is imported where it is used, as this module is loaded at startup of
+every resize script.
+"""
+
+# Palette index used for transparent pixels; the other 255 hold the colours
+TRANSPARENT_INDEX = 255
+# Resized pixels with less alpha than this become fully transparent
+ALPHA_THRESHOLD = 128
+
+
+def is_animated_gif(img):
+    """True for an opened GIF with more than one frame."""
+    return img.format == 'GIF' and getattr(img, 'is_animated', False)
+
+
+def frames(img):
+    """
+    Yields (frame, duration, disposal) for every frame of img, frame being the
+    composited canvas as an RGBA image.
+    """
+    from PIL import ImageSequence
+    for frame in ImageSequence.Iterator(img):
+        yield frame.convert('RGBA'), frame.info.get('duration', 0), getattr(frame, 'disposal_method', 0)
+
+
+def quantize_frame(frame):
+    """
+    Turns an RGBA frame into a palette image for the GIF encoder.
+    Returns (image, transparency index or None).
+    """
+    alpha = frame.getchannel('A')
+    if alpha.getextrema()[0] >= ALPHA_THRESHOLD:
+        return frame.convert('RGB').quantize(256), None
+    quantized = frame.convert('RGB').quantize(255)
+    quantized.paste(TRANSPARENT_INDEX, mask=alpha.point(lambda a: 255 if a < ALPHA_THRESHOLD else 0))
+    return quantized, TRANSPARENT_INDEX
+
+
+class GifWriter:
+    """Writes an animated GIF to a binary file object, one frame at a time."""
+
+    def __init__(self, fp, loop=None):
+        self.fp = fp
+        self.loop = loop
+        self.frame_count = 0
+
+    def add_frame(self, frame, duration=0, disposal=0):
+        """Quantize and append an RGBA frame; all frames must have the same size."""
+        from PIL import GifImagePlugin
+        image, transparency = quantize_frame(frame)
+        if self.frame_count == 0:
+            # The first frame's palette becomes the global colour table
+            info = {'duration': duration}
+            if self.loop is not None:
+                info['loop'] = self.loop
+            header, _ = GifImagePlugin.getheader(image, None, info)
+            for chunk in header:
+                self.fp.write(chunk)
+        params = {'duration': duration, 'disposal': disposal, 'include_color_table': self.frame_count > 0}
+        if transparency is not None:
+            params['transparency'] = transparency
+        for chunk in GifImagePlugin.getdata(image, **params):
+            self.fp.write(chunk)
+        self.frame_count += 1
+
+    def close(self):
+        self.fp.write(b';')  # GIF trailer
@@ -0,0 +1,313 @@
+"""
+Benchmarks the imageResize-* variants against a reproducible synthetic corpus.
+
+The corpus mixes PNG, JPEG, GIF and BMP files at typical Midjourney sizes and
+is generated from a seed, so every run (and every machine) sees the same
+images. It is cached in --corpus and only regenerated when the settings
+change.
+
+Each variant runs in its own subprocess on a fresh copy of the corpus, so the
+peak RSS figure belongs to that variant alone. Reported per variant:
+images/sec, p50/p95 per-image latency, peak RSS and bytes written to the
+output folder. Results are written as JSON; pass an older result file with
+--baseline to flag throughput regressions.
+
+--io-latency adds a fixed delay to every file open, rename and link the
+variant makes, to see how a run behaves on network storage (e.g. with and
+without --pipeline).
+
+Usage:
+    python benchmarkResize.py --out results.json
+    python benchmarkResize.py --baseline results.json --variants o3mini-high qwen25max
+    python benchmarkResize.py --variants qwen25max --io-latency 20 --pipeline
+"""
+
+import os
+import io
+import sys
+import glob
+import json
+import time
+import random
+import shutil
+import platform
+import argparse
+import builtins
+import tempfile
+import subprocess
+import contextlib
+import importlib.util
+from PIL import Image, ImageChops
+import resizePipeline
+from resizeMetrics import percentile
+
+TOOLS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+# Typical Midjourney output sizes: v6 grids/upscales and the 2x/4096 upscales
+MIDJOURNEY_SIZES = [
+    (1024, 1024), (1456, 816), (816, 1456), (1232, 928), (896, 1344),
+    (1344, 896), (2048, 2048), (2912, 1632), (1632, 2912), (4096, 4096),
+]
+CORPUS_FORMATS = ['.png', '.jpg', '.png', '.jpg', '.gif', '.bmp']
+
+
+def make_image(rng, size):
+    """A deterministic, non-trivial test image: a fractal over colour gradients."""
+    width, height = size
+    x0 = rng.uniform(-2.2, -0.8)
+    y0 = rng.uniform(-1.2, -0.2)
+    span = rng.uniform(0.3, 2.5)
+    fractal = Image.effect_mandelbrot(size, (x0, y0, x0 + span, y0 + span * height / width), rng.randint(20, 120))
+    red = Image.linear_gradient('L').resize(size)
+    green = Image.radial_gradient('L').resize(size)
+    blue = ImageChops.multiply(fractal, Image.linear_gradient('L').rotate(rng.choice([90, 180, 270])).resize(size))
+    return Image.merge('RGB', (ImageChops.add(red, fractal, 2), green, blue))
+
+
+def make_corpus(folder, count, seed):
+    """Create count images in folder, unless an identical corpus is already there."""
+    settings = {'count': count, 'seed': seed, 'sizes': MIDJOURNEY_SIZES, 'formats': CORPUS_FORMATS}
+    settings_path = os.path.join(folder, 'corpus.json')
+    if os.path.exists(settings_path):
+        with open(settings_path) as f:
+            if json.load(f) == json.loads(json.dumps(settings)):
+                return
+        shutil.rmtree(folder)
+
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed)
+    for i in range(count):
+        size = MIDJOURNEY_SIZES[i % len(MIDJOURNEY_SIZES)]
+        ext = CORPUS_FORMATS[rng.randrange(len(CORPUS_FORMATS))]
+        img = make_image(rng, size)
+        if ext == '.gif':
+            img = img.quantize(256)
+        img.save(os.path.join(folder, f"mj_{i:04d}{ext}"), quality=90)
+    with open(settings_path, 'w') as f:
+        json.dump(settings, f)
+
+
+def find_variants(names=None):
+    """Map variant name (e.g. 'o3mini-high') to its script path."""
+    variants = {}
+    for path in sorted(glob.glob(os.path.join(TOOLS_FOLDER, 'imageResize-*.py'))):
+        name = os.path.basename(path)[len('imageResize-'):-len('.py')]
+        if not names or name in names:
+            variants[name] = path
+    return variants
+
+
+def load_variant(path):
+    """Import a variant script; the file names contain dashes, so not via import."""
+    if TOOLS_FOLDER not in sys.path:
+        sys.path.insert(0, TOOLS_FOLDER)
+    name = os.path.basename(path)[:-len('.py')].replace('-', '_')
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def peak_rss_bytes():
+    # On Linux ru_maxrss survives fork and exec, so a --run-one child would
+    # report the parent's peak when it is higher; VmHWM is this process's own
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def folder_bytes(folder):
+    total = 0
+    for root, _, files in os.walk(folder):
+        for filename in files:
+            total += os.path.getsize(os.path.join(root, filename))
+    return total
+
+
+@contextlib.contextmanager
+def simulated_latency(seconds):
+    """Sleep for seconds before every file open, rename and link, as on a slow share."""
+    if not seconds:
+        yield
+        return
+    originals = {(builtins, 'open'): builtins.open}
+    for name in ('open', 'rename', 'replace', 'link'):
+        originals[(os, name)] = getattr(os, name)
+
+    def delayed(func):
+        def call(*args, **kwargs):
+            time.sleep(seconds)
+            return func(*args, **kwargs)
+        return call
+
+    for (module, name), func in originals.items():
+        setattr(module, name, delayed(func))
+    try:
+        yield
+    finally:
+        for (module, name), func in originals.items():
+            setattr(module, name, func)
+
+
+def run_variant(path, input_folder, output_folder, options):
+    """
+    Run one variant's process_images in this process and return its metrics.
+    Per-image latency is taken around each process_file call by wrapping the
+    variant's run_jobs; with a worker pool only the totals are measured.
+    """
+    module = load_variant(path)
+    latencies = []
+    run_jobs = module.run_jobs
+
+    def timed_run_jobs(func, items, args=(), kwargs=None, workers=1, **rest):
+        if workers and workers != 1:
+            return run_jobs(func, items, args, kwargs, workers, **rest)
+
+        def timed(item, *call_args, **call_kwargs):
+            start = time.perf_counter()
+            try:
+                return func(item, *call_args, **call_kwargs)
+            finally:
+                latencies.append(time.perf_counter() - start)
+        return run_jobs(timed, items, args, kwargs, workers, **rest)
+
+    module.run_jobs = timed_run_jobs
+    images = len([f for f in os.listdir(input_folder) if os.path.isfile(os.path.join(input_folder, f))])
+    latency = options.pop('io_latency', 0) / 1000
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()) as log, simulated_latency(latency):
+        module.process_images(input_folder, output_folder, **options)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'images': images,
+        'seconds': elapsed,
+        'images_per_sec': images / elapsed if elapsed else None,
+        # Not measured with a worker pool
+        'latency_p50': percentile(latencies, 0.50) if latencies else None,
+        'latency_p95': percentile(latencies, 0.95) if latencies else None,
+        'peak_rss_bytes': peak_rss_bytes(),
+        'bytes_written': folder_bytes(output_folder),
+        'errors': log.getvalue().count('Error'),
+    }
+
+
+def benchmark_variant(path, corpus_folder, options):
+    """Copy the corpus to a scratch folder and run one variant in a subprocess."""
+    with tempfile.TemporaryDirectory(prefix='resize-bench-') as scratch:
+        input_folder = os.path.join(scratch, 'in')
+        output_folder = os.path.join(scratch, 'out')
+        shutil.copytree(corpus_folder, input_folder, ignore=shutil.ignore_patterns('corpus.json'))
+        command = [sys.executable, os.path.abspath(__file__), '--run-one', path,
+                   input_folder, output_folder, json.dumps(options)]
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        if result.returncode != 0:
+            return {'error': f"exit status {result.returncode}"}
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def print_table(results):
+    print(f"{'variant':18} {'img/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'RSS MB':>8} {'out MB':>8} {'errors':>6}")
+    for name, r in results.items():
+        if 'error' in r:
+            print(f"{name:18} {r['error']}")
+            continue
+        ms = lambda v: f"{v * 1000:8.1f}" if v is not None else f"{'-':>8}"
+        mb = lambda v: f"{v / 2**20:8.1f}" if v is not None else f"{'-':>8}"
+        print(f"{name:18} {r['images_per_sec']:8.2f} {ms(r['latency_p50'])} {ms(r['latency_p95'])} "
+              f"{mb(r['peak_rss_bytes'])} {mb(r['bytes_written'])} {r['errors']:6d}")
+
+
+def compare(results, baseline, tolerance):
+    """Print throughput changes against a baseline; return False on a regression."""
+    ok = True
+    for name, r in results.items():
+        before = baseline.get('results', {}).get(name)
+        if not before or 'error' in r or 'error' in before:
+            continue
+        change = r['images_per_sec'] / before['images_per_sec'] - 1
+        flag = ''
+        if change < -tolerance:
+            flag = '  REGRESSION'
+            ok = False
+        print(f"{name:18} {before['images_per_sec']:8.2f} -> {r['images_per_sec']:8.2f} img/s ({change:+.1%}){flag}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the imageResize variants on a synthetic corpus.')
+    parser.add_argument('--corpus', default=os.path.join(tempfile.gettempdir(), 'imageResize-corpus'),
+                        help='Folder for the cached synthetic corpus')
+    parser.add_argument('--count', type=int, default=40, help='Number of corpus images (default: 40)')
+    parser.add_argument('--seed', type=int, default=6, help='Corpus seed (default: 6)')
+    parser.add_argument('--variants', nargs='*', help='Variant names to run (default: all)')
+    parser.add_argument('--workers', type=int, default=1, help='Passed to process_images')
+    parser.add_argument('--fast-decode', action='store_true', help='Passed to process_images')
+    parser.add_argument('--resampler', choices=('pillow', 'numpy'), default=None, help='Passed to process_images')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Passed to process_images, with the default queue depths')
+    parser.add_argument('--io-latency', type=float, default=0, metavar='MS',
+                        help='Delay added to every file open, rename and link (default: 0)')
+    parser.add_argument('--out', default='benchmark-results.json', help='Where to write the JSON results')
+    parser.add_argument('--baseline', help='Earlier results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help='Allowed throughput drop against the baseline (default: 0.10)')
+    args = parser.parse_args()
+
+    make_corpus(args.corpus, args.count, args.seed)
+    options = {'workers': args.workers}
+    if args.fast_decode:
+        options['fast_decode'] = True
+    if args.resampler:
+        options['resampler'] = args.resampler
+    if args.pipeline:
+        options['pipeline'] = [resizePipeline.DEFAULT_READ_AHEAD, resizePipeline.DEFAULT_WRITE_BEHIND]
+    if args.io_latency:
+        options['io_latency'] = args.io_latency
+
+    results = {}
+    for name, path in find_variants(args.variants).items():
+        print(f"Running {name}...", flush=True)
+        results[name] = benchmark_variant(path, args.corpus, options)
+
+    print()
+    print_table(results)
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'corpus': {'count': args.count, 'seed': args.seed},
+        'options': options,
+        'results': results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print()
+        if not compare(results, baseline, args.tolerance):
+            exit(1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 6 and sys.argv[1] == '--run-one':
+        _, _, script, input_folder, output_folder, options = sys.argv
+        print(json.dumps(run_variant(script, input_folder, output_folder, json.loads(options))))
+    else:
+        main()
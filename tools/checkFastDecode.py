@@ -0,0 +1,81 @@
+"""
+Compares the --fast-decode resize path of the imageResize scripts against the
+regular full-resolution decode.
+
+Every image in the folder is resized to the target width both ways, in memory,
+and the two results are compared by PSNR and by the largest per-channel pixel
+difference. The script exits with status 1 if any image falls below --min-psnr,
+so it can be used as a quality gate before turning --fast-decode on.
+"""
+
+import os
+import math
+import time
+import argparse
+from PIL import Image, ImageChops, ImageStat
+from tqdm import tqdm
+from resizeCommon import AnimatedResize, resize_to
+
+ALLOWED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp', '.gif'}
+
+def compare_images(a, b):
+    """Return (psnr, max_diff) between two images of the same size."""
+    mode = 'RGBA' if 'A' in a.getbands() or 'A' in b.getbands() else 'RGB'
+    diff = ImageChops.difference(a.convert(mode), b.convert(mode))
+    max_diff = max(high for _, high in diff.getextrema())
+    stat = ImageStat.Stat(diff)
+    mse = sum(stat.sum2) / (len(stat.sum2) * diff.width * diff.height)
+    if mse == 0:
+        return math.inf, max_diff
+    return 10 * math.log10(255 ** 2 / mse), max_diff
+
+def resize_timed(path, target_width, fast_decode):
+    start = time.perf_counter()
+    with Image.open(path) as img:
+        width, height = img.size
+        new_height = int(height * target_width / width)
+        resized = resize_to(img, (target_width, new_height), fast_decode)
+        if isinstance(resized, AnimatedResize):
+            # Animated GIFs are compared on their first frame
+            resized = resized.still()
+    return resized, time.perf_counter() - start
+
+def check_folder(input_folder, target_width=1200, min_psnr=40.0):
+    filenames = sorted(
+        f for f in os.listdir(input_folder)
+        if os.path.splitext(f)[1].lower() in ALLOWED_EXTENSIONS
+    )
+    rows = []
+    for filename in tqdm(filenames, desc="Comparing"):
+        path = os.path.join(input_folder, filename)
+        try:
+            full, full_time = resize_timed(path, target_width, fast_decode=False)
+            fast, fast_time = resize_timed(path, target_width, fast_decode=True)
+        except Exception as e:
+            print(f"Error processing {filename}: {e}")
+            continue
+        psnr, max_diff = compare_images(full, fast)
+        rows.append((filename, psnr, max_diff, full_time, fast_time))
+
+    print(f"{'file':40} {'PSNR dB':>8} {'maxdiff':>8} {'full s':>8} {'fast s':>8}")
+    for filename, psnr, max_diff, full_time, fast_time in rows:
+        print(f"{filename[:40]:40} {psnr:8.2f} {max_diff:8d} {full_time:8.3f} {fast_time:8.3f}")
+
+    if not rows:
+        return True
+    total_full = sum(row[3] for row in rows)
+    total_fast = sum(row[4] for row in rows)
+    worst = min(row[1] for row in rows)
+    print(f"\nWorst PSNR: {worst:.2f} dB, speedup: {total_full / max(total_fast, 1e-9):.2f}x")
+    return worst >= min_psnr
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Check the quality of --fast-decode against the full decode.')
+    parser.add_argument('input_folder', help='Folder with sample images')
+    parser.add_argument('--width', type=int, default=1200, help='Target width (default: 1200)')
+    parser.add_argument('--min-psnr', type=float, default=40.0,
+                        help='Fail if any image is below this PSNR in dB (default: 40)')
+    args = parser.parse_args()
+
+    if not check_folder(args.input_folder, args.width, args.min_psnr):
+        exit(1)
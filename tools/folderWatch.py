@@ -0,0 +1,191 @@
+"""
+Watches a folder for newly arrived files, for the --watch mode of the
+imageResize scripts.
+
+On Linux the folder is watched with inotify (through ctypes, no extra
+packages). Elsewhere, or if inotify is unavailable, the folder is polled: the
+folder's own mtime is checked every poll interval and the folder is only
+listed again when it changed, against an index of name -> (size, mtime).
+
+A file is handed out once its size and mtime have not changed for
+settle_time seconds, so images that are still being downloaded or copied are
+not picked up half-written.
+"""
+
+import os
+import sys
+import stat
+import time
+import select
+import struct
+import ctypes
+from collections import OrderedDict
+
+# inotify event masks, see <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+EVENT_HEADER = struct.Struct('iIII')
+
+# How many handed-out files to remember, see watch_folder
+RECENT_LIMIT = 100000
+
+
+class InotifySource:
+    """Reports names changed in a folder using Linux inotify."""
+
+    def __init__(self, folder):
+        libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {folder}")
+
+    def changes(self, timeout):
+        """
+        Wait up to timeout seconds and return the set of changed names, or None
+        if events were lost and the folder has to be listed again.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        names = set()
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return names
+            offset = 0
+            while offset < len(data):
+                _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                if mask & IN_Q_OVERFLOW:
+                    return None
+                if length:
+                    name = data[offset:offset + length].rstrip(b'\0')
+                    names.add(os.fsdecode(name))
+                offset += length
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingSource:
+    """Reports names changed in a folder by checking the folder's mtime."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.folder_mtime = None
+        self.index = {}
+
+    def changes(self, timeout):
+        time.sleep(timeout)
+        try:
+            folder_mtime = os.stat(self.folder).st_mtime_ns
+        except OSError:
+            return set()
+        if folder_mtime == self.folder_mtime:
+            return set()
+        self.folder_mtime = folder_mtime
+
+        names = set()
+        index = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                index[entry.name] = (st.st_size, st.st_mtime_ns)
+                if self.index.get(entry.name) != index[entry.name]:
+                    names.add(entry.name)
+        self.index = index
+        return names
+
+    def close(self):
+        pass
+
+
+def open_source(folder):
+    """Return an inotify source where available, else a polling source."""
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifySource(folder)
+        except (OSError, AttributeError):
+            pass
+    return PollingSource(folder)
+
+
+def file_signature(path):
+    """Return (size, mtime_ns) of a regular file, or None if it is not one."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+
+def watch_folder(folder, accept, settle_time=0.5, poll_interval=0.2):
+    """
+    Yields names of files in folder for which accept(name) is true, first the
+    ones already present and then new arrivals, each once it stopped changing.
+    Runs until the consumer stops iterating.
+
+    A file that comes back with the same size and mtime it had when it was
+    handed out (e.g. a script renaming it back after a failure) is not handed
+    out again; a new file with the same name is.
+    """
+    source = open_source(folder)
+    pending = {}
+    recent = OrderedDict()
+
+    def consider(name):
+        if not accept(name):
+            return
+        signature = file_signature(os.path.join(folder, name))
+        if signature is None or recent.get(name) == signature:
+            return
+        if name not in pending or pending[name][0] != signature:
+            pending[name] = (signature, time.monotonic())
+
+    def rescan():
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                consider(entry.name)
+
+    try:
+        rescan()
+        while True:
+            changed = source.changes(poll_interval)
+            if changed is None:
+                rescan()
+            else:
+                for name in changed:
+                    consider(name)
+
+            now = time.monotonic()
+            for name, (signature, since) in list(pending.items()):
+                current = file_signature(os.path.join(folder, name))
+                if current is None:
+                    del pending[name]
+                elif current != signature:
+                    pending[name] = (current, now)
+                elif now - since >= settle_time:
+                    del pending[name]
+                    recent[name] = signature
+                    recent.move_to_end(name)
+                    if len(recent) > RECENT_LIMIT:
+                        recent.popitem(last=False)
+                    yield name
+    finally:
+        source.close()
@@ -0,0 +1,431 @@
+"""
+Near-duplicate detection for the output library with perceptual hashes.
+
+Every image gets a 64-bit hash of its downscaled grayscale thumbnail:
+
+    phash  the signs of the lowest 8x8 DCT coefficients of a 32x32 thumbnail
+           against their median (robust to rescaling, recompression and small
+           colour changes; the default)
+    dhash  whether each pixel of a 9x8 thumbnail is brighter than its right
+           neighbour (cheaper, more sensitive to edits)
+
+Both are computed with NumPy for a whole batch of thumbnails at once. In the
+resize scripts the thumbnail is made from the image that was just resized,
+so --dedupe costs no extra decode.
+
+Hashes are kept in a multi-index hash table: the 64 bits are split into
+four 16-bit bands. Two hashes within Hamming distance k agree on at least
+one band up to k // 4 bits (pigeonhole), so a query looks up the few band
+values within that distance of the query's bands and checks the full
+distance only for the rows found. The table is a SQLite file in the output
+folder; queries run on a copy of it in NumPy arrays, one sorted array per
+band, that is loaded when the index is opened and picks up the rows other
+processes add.
+
+Usage:
+    python imageDedupe.py D:/Midjourney/output add
+    python imageDedupe.py D:/Midjourney/output query new_image.png --distance 8
+    python imageDedupe.py D:/Midjourney/output benchmark --count 1000000
+"""
+
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import itertools
+from functools import lru_cache
+import numpy as np
+from PIL import Image
+
+INDEX_NAME = '.dedupe-index.sqlite'
+
+# Hashes within this Hamming distance (of 64 bits) count as near-duplicates
+DEFAULT_DISTANCE = 6
+BANDS = 4
+BAND_BITS = 64 // BANDS
+# Thumbnail size per hash kind, (width, height)
+THUMBNAIL_SIZES = {'phash': (32, 32), 'dhash': (9, 8)}
+# Rows added since the band arrays were last sorted, see HashIndex.merge()
+TAIL_SIZE = 4096
+# Images decoded per batch when adding a folder
+BATCH_SIZE = 256
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp', '.gif', '.bmp', '.avif'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hashes (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    hash INTEGER NOT NULL
+);
+"""
+
+# One index per process and folder, see open_index
+_indexes = {}
+
+
+@lru_cache(maxsize=None)
+def dct_matrix(n):
+    """Orthonormal DCT-II matrix, so dct(x) = D @ x @ D.T for an n x n block."""
+    k = np.arange(n)[:, None]
+    matrix = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix.astype(np.float32)
+
+
+def thumbnail(img, kind='phash'):
+    """The grayscale thumbnail a hash is computed from, as a float32 array."""
+    if img.mode not in ('L', 'RGB'):
+        img = img.convert('RGB')
+    # reducing_gap shrinks with a fast box reduce first; what is left for the
+    # filter is a few times the thumbnail size
+    small = img.resize(THUMBNAIL_SIZES[kind], Image.BILINEAR, reducing_gap=2.0).convert('L')
+    return np.asarray(small, dtype=np.float32)
+
+
+def pack_bits(bits):
+    """(N, 64) booleans -> N unsigned 64-bit ints, first bit most significant."""
+    return np.packbits(bits, axis=1).view('>u8').ravel()
+
+
+def phash_batch(thumbnails):
+    """pHashes of an (N, 32, 32) array of thumbnails."""
+    dct = dct_matrix(thumbnails.shape[1])
+    coefficients = np.einsum('ij,njk,lk->nil', dct, thumbnails, dct)[:, :8, :8].reshape(len(thumbnails), 64)
+    # The DC term is the mean brightness; leave it out of the median
+    median = np.median(coefficients[:, 1:], axis=1, keepdims=True)
+    return pack_bits(coefficients > median)
+
+
+def dhash_batch(thumbnails):
+    """dHashes of an (N, 8, 9) array of thumbnails."""
+    return pack_bits((thumbnails[:, :, 1:] > thumbnails[:, :, :-1]).reshape(len(thumbnails), 64))
+
+
+HASH_FUNCTIONS = {'phash': phash_batch, 'dhash': dhash_batch}
+
+
+def image_hashes(images, kind='phash'):
+    """Hashes of a list of opened images, as Python ints."""
+    if not images:
+        return []
+    thumbnails = np.stack([thumbnail(img, kind) for img in images])
+    return [int(h) for h in HASH_FUNCTIONS[kind](thumbnails)]
+
+
+def bands(value):
+    """The four 16-bit bands of a hash, most significant first."""
+    mask = (1 << BAND_BITS) - 1
+    return [(value >> (BAND_BITS * (BANDS - 1 - i))) & mask for i in range(BANDS)]
+
+
+@lru_cache(maxsize=None)
+def flip_masks(radius):
+    """Every BAND_BITS-bit mask with at most radius bits set."""
+    masks = []
+    for count in range(radius + 1):
+        for positions in itertools.combinations(range(BAND_BITS), count):
+            masks.append(sum(1 << p for p in positions))
+    return masks
+
+
+def band_array(hashes, i):
+    """Band i of an array of hashes, see bands()."""
+    return ((hashes >> np.uint64(BAND_BITS * (BANDS - 1 - i))) & np.uint64((1 << BAND_BITS) - 1)).astype(np.uint16)
+
+
+def popcount(values):
+    """Set bits of each unsigned 64-bit value."""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    return np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def to_signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+class HashIndex:
+    """
+    The hashes table of an index file with an in-memory copy for queries.
+    Each band of the loaded hashes is kept as a sorted array, so the rows
+    with a given band value are found with a binary search; rows added since
+    the last merge are in a short tail that is checked in full.
+    """
+
+    def __init__(self, path, kind=None):
+        self.path = path
+        # Several worker processes share the file, as with the manifest
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'kind'").fetchone()
+        if row:
+            if kind and kind != row[0]:
+                raise ValueError(f"{path} holds {row[0]} hashes, not {kind}")
+            self.kind = row[0]
+        else:
+            self.kind = kind or 'phash'
+            with self.db:
+                self.db.execute("INSERT OR IGNORE INTO meta VALUES ('kind', ?)", (self.kind,))
+        self.loaded_id = 0
+        self.ids = np.empty(0, dtype=np.int64)
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.orders = [self.ids] * BANDS
+        self.sorted_bands = [np.empty(0, dtype=np.uint16)] * BANDS
+        self.tail_ids = []
+        self.tail_hashes = []
+
+    def hash_images(self, images):
+        return image_hashes(images, self.kind)
+
+    def add(self, entries):
+        """Store (path, hash) pairs; a path that is already indexed gets the new hash."""
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO hashes (path, hash) VALUES (?, ?)",
+                [(path, to_signed(value)) for path, value in entries]
+            )
+
+    def refresh(self):
+        """Load the rows added since the last call, by this or another process."""
+        rows = self.db.execute("SELECT id, hash FROM hashes WHERE id > ? ORDER BY id", (self.loaded_id,)).fetchall()
+        if not rows:
+            return
+        self.loaded_id = rows[-1][0]
+        self.tail_ids.extend(row[0] for row in rows)
+        self.tail_hashes.extend(to_unsigned(row[1]) for row in rows)
+        if len(self.tail_ids) > TAIL_SIZE:
+            self.merge()
+
+    def merge(self):
+        """Move the tail into the sorted band arrays."""
+        self.ids = np.concatenate([self.ids, np.array(self.tail_ids, dtype=np.int64)])
+        self.hashes = np.concatenate([self.hashes, np.array(self.tail_hashes, dtype=np.uint64)])
+        self.tail_ids = []
+        self.tail_hashes = []
+        for i in range(BANDS):
+            band = band_array(self.hashes, i)
+            self.orders[i] = np.argsort(band, kind='stable')
+            self.sorted_bands[i] = band[self.orders[i]]
+
+    def query(self, value, distance=DEFAULT_DISTANCE, limit=None):
+        """(distance, path, hash) of the indexed images within distance of value, closest first."""
+        self.refresh()
+        masks = np.array(flip_masks(distance // BANDS), dtype=np.uint16)
+        positions = []
+        for i, band in enumerate(bands(value)):
+            wanted = np.unique(np.uint16(band) ^ masks)
+            starts = np.searchsorted(self.sorted_bands[i], wanted, 'left')
+            ends = np.searchsorted(self.sorted_bands[i], wanted, 'right')
+            positions += [self.orders[i][start:end] for start, end in zip(starts, ends) if end > start]
+        candidates = [self.tail_ids, self.tail_hashes]
+        if positions:
+            positions = np.unique(np.concatenate(positions))
+            candidates = [np.concatenate([self.ids[positions], np.array(self.tail_ids, dtype=np.int64)]),
+                          np.concatenate([self.hashes[positions], np.array(self.tail_hashes, dtype=np.uint64)])]
+        ids, hashes = (np.asarray(candidates[0], dtype=np.int64), np.asarray(candidates[1], dtype=np.uint64))
+        distances = popcount(hashes ^ np.uint64(value))
+        close = distances <= distance
+        if not close.any():
+            return []
+        # Paths come from the table; ids of rows replaced since loading drop out
+        found = dict(zip(ids[close].tolist(), distances[close].tolist()))
+        placeholders = ','.join('?' * len(found))
+        matches = sorted((found[row_id], path, to_unsigned(other)) for row_id, path, other in self.db.execute(
+            f"SELECT id, path, hash FROM hashes WHERE id IN ({placeholders})", list(found)))
+        return matches[:limit] if limit else matches
+
+    def paths(self):
+        return {row[0] for row in self.db.execute("SELECT path FROM hashes")}
+
+    def count(self):
+        return self.db.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+
+    def close(self):
+        self.db.close()
+
+
+def open_index(folder):
+    """Return this process's HashIndex for folder, opening it on first use."""
+    folder = os.path.abspath(folder)
+    if folder not in _indexes:
+        _indexes[folder] = HashIndex(os.path.join(folder, INDEX_NAME))
+    return _indexes[folder]
+
+
+def check_duplicate(img, output_path, mode, distance=DEFAULT_DISTANCE):
+    """
+    --dedupe for the resize scripts: looks img (the resized image) up in the
+    index of output_path's folder. Returns (path to write or None to skip it,
+    the closest indexed image or None). A near-duplicate is written with
+    _dup appended to its name in 'mark' mode and not written in 'skip' mode.
+    Whatever is written is added to the index.
+    """
+    index = open_index(os.path.dirname(output_path) or '.')
+    value = index.hash_images([img])[0]
+    matches = index.query(value, distance, limit=1)
+    duplicate_of = matches[0][1] if matches else None
+    if duplicate_of:
+        if mode == 'skip':
+            return None, duplicate_of
+        base, ext = os.path.splitext(output_path)
+        output_path = f"{base}_dup{ext}"
+    index.add([(os.path.basename(output_path), value)])
+    return output_path, duplicate_of
+
+
+def open_thumbnail_source(path, kind):
+    """Opens path decoded at a reduced scale where the format allows it."""
+    img = Image.open(path)
+    # JPEG decodes at 1/8 scale at the most; nothing else is needed for 32x32
+    img.draft(None, tuple(8 * side for side in THUMBNAIL_SIZES[kind]))
+    return img
+
+
+def scan_library(folder):
+    """Image files under folder, as paths relative to it."""
+    for root, dirs, files in os.walk(folder):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for name in files:
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS and not name.startswith('.'):
+                yield os.path.relpath(os.path.join(root, name), folder)
+
+
+def add_folder(index, folder, distance=DEFAULT_DISTANCE, report=True):
+    """
+    Hashes the images under folder that are not indexed yet, in batches, and
+    adds them. Returns (added, duplicates), duplicates being (path, duplicate
+    of) for each new image with an earlier near-duplicate.
+    """
+    known = index.paths()
+    new_paths = (path for path in scan_library(folder) if path not in known)
+    added = 0
+    duplicates = []
+    while True:
+        batch = list(itertools.islice(new_paths, BATCH_SIZE))
+        if not batch:
+            break
+        images = []
+        paths = []
+        for path in batch:
+            try:
+                img = open_thumbnail_source(os.path.join(folder, path), index.kind)
+                img.load()
+            except Exception as e:
+                print(f"Error reading {path}: {e}")
+                continue
+            images.append(img)
+            paths.append(path)
+        # One pass over the batch with NumPy
+        values = index.hash_images(images)
+        for img in images:
+            img.close()
+        for path, value in zip(paths, values):
+            # Checked one by one, so duplicates within the batch are found too
+            matches = index.query(value, distance, limit=1)
+            if matches:
+                duplicates.append((path, matches[0][1]))
+                if report:
+                    print(f"{path}: near-duplicate of {matches[0][1]} (distance {matches[0][0]})")
+            index.add([(path, value)])
+        added += len(paths)
+    return added, duplicates
+
+
+def benchmark(index_path, count, distance, queries=1000, seed=0):
+    """Fills a fresh index with count random hashes and times queries against it."""
+    rng = random.Random(seed)
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    index = HashIndex(index_path)
+    started = time.perf_counter()
+    values = [rng.getrandbits(64) for _ in range(count)]
+    for start in range(0, count, 100000):
+        index.add((f"random/{i}", values[i]) for i in range(start, min(count, start + 100000)))
+    print(f"Indexed {count} hashes in {time.perf_counter() - started:.1f}s")
+    index.close()
+
+    # What opening an existing index costs before the first query
+    started = time.perf_counter()
+    index = HashIndex(index_path)
+    index.refresh()
+    print(f"Loaded the index in {time.perf_counter() - started:.2f}s")
+
+    timings = []
+    for _ in range(queries):
+        # A stored hash with a few bits flipped, as a near-duplicate would be
+        value = values[rng.randrange(count)]
+        for bit in rng.sample(range(64), rng.randint(0, distance)):
+            value ^= 1 << bit
+        start = time.perf_counter()
+        matches = index.query(value, distance)
+        timings.append(time.perf_counter() - start)
+        assert matches, 'a stored hash within the distance was not found'
+    timings.sort()
+    print(f"{queries} queries at distance <= {distance}: "
+          f"p50 {timings[len(timings) // 2] * 1000:.3f} ms, p99 {timings[int(len(timings) * 0.99)] * 1000:.3f} ms")
+    index.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find near-duplicate images with perceptual hashes.')
+    parser.add_argument('folder', help='Image library; the index is kept in it as ' + INDEX_NAME)
+    # --distance goes after the command, like its other options
+    distance = argparse.ArgumentParser(add_help=False)
+    distance.add_argument('--distance', type=int, default=DEFAULT_DISTANCE,
+                          help=f'Largest Hamming distance (of 64 bits) that counts as a duplicate '
+                               f'(default: {DEFAULT_DISTANCE})')
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', parents=[distance],
+                              help='Hash and index the images not indexed yet, reporting near-duplicates')
+    add.add_argument('--hash', choices=sorted(HASH_FUNCTIONS), default=None,
+                     help='Hash for a new index (default: phash)')
+    query = commands.add_parser('query', parents=[distance], help='List the indexed near-duplicates of images')
+    query.add_argument('images', nargs='+')
+    bench = commands.add_parser('benchmark', parents=[distance], help='Time queries on an index of random hashes')
+    bench.add_argument('--count', type=int, default=1000000)
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.folder):
+        print(f"Error: Folder '{args.folder}' does not exist.")
+        sys.exit(1)
+    if args.command == 'benchmark':
+        benchmark(os.path.join(args.folder, '.dedupe-benchmark.sqlite'), args.count, args.distance)
+        return
+
+    index = HashIndex(os.path.join(args.folder, INDEX_NAME), getattr(args, 'hash', None))
+    try:
+        if args.command == 'add':
+            started = time.perf_counter()
+            added, duplicates = add_folder(index, args.folder, args.distance)
+            print(f"Indexed {added} new images in {time.perf_counter() - started:.2f}s, "
+                  f"{len(duplicates)} near-duplicates; {index.count()} in the index")
+        else:
+            index.refresh()
+            for path in args.images:
+                with open_thumbnail_source(path, index.kind) as img:
+                    value = index.hash_images([img])[0]
+                started = time.perf_counter()
+                matches = index.query(value, args.distance)
+                seconds = time.perf_counter() - started
+                print(f"{path}: {len(matches)} matches in {seconds * 1000:.2f} ms")
+                for distance, match, _ in matches:
+                    print(f"  {distance:2d}  {match}")
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,19 @@
 # from deepseek r1
 import os
 import time
-import shutil
-import tempfile
-from PIL import Image
-from tqdm import tqdm
+import argparse
+from resizeCommon import (
+    DEFAULT_SIZES, add_resize_arguments, resize_options, resize_to, find_images, run_jobs,
+    main_output_path, save_sizes, move_file, image_cost,
+    passthrough_size, copy_output, save_grid, open_source, source_path,
+)
+from resizeManifest import open_manifest
 
 SUPPORTED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp', '.gif'}
 
-def process_images(input_folder, output_folder):
+def process_images(input_folder, output_folder, workers=1, watch=False, metrics=None, prometheus=None,
+                   memory_budget=None, dedupe=None, catalog=False, resampler=None, pipeline=None,
+                   **options):
     # Create required directories
     os.makedirs(output_folder, exist_ok=True)
     done_folder = os.path.join(input_folder, 'done')
@@ -16,78 +21,89 @@ def process_images(input_folder, output_folder):
     os.makedirs(done_folder, exist_ok=True)
     os.makedirs(failed_folder, exist_ok=True)
 
-    # Identify files already being processed or completed
-    all_files = os.listdir(input_folder)
-    processing_files = set()
-    for f in all_files:
+    # Files being processed by another run are skipped through their lease
+    # (see workLease); marker files left by older versions are not images to process
+    def is_valid_file(f):
         if '-PROCESSING-' in f or '-DONE-' in f:
-            base_part = f.split('-PROCESSING-')[0].split('-DONE-')[0]
-            original_name = f"{base_part}{os.path.splitext(f)[1]}"
-            processing_files.add(original_name)
+            return False
+        return os.path.splitext(f)[1].lower() in SUPPORTED_EXTENSIONS
 
-    # Filter valid files (supported extensions and not in processing)
-    valid_files = [
-        f for f in all_files
-        if os.path.splitext(f)[1].lower() in SUPPORTED_EXTENSIONS
-        and f not in processing_files
-    ]
+    valid_files = find_images(input_folder, is_valid_file, watch)
 
     # Process files with progress tracking
-    for filename in tqdm(valid_files, desc="Processing Images", unit="image"):
-        original_path = os.path.join(input_folder, filename)
-        base_name, ext = os.path.splitext(filename)
-        timestamp = int(time.time())
-        
-        # Create processing lock file
-        processing_filename = f"{base_name}-PROCESSING-{timestamp}{ext}"
-        processing_path = os.path.join(input_folder, processing_filename)
-        try:
-            open(processing_path, 'w').close()
-        except:
-            continue  # Skip if lock creation fails
+    run_jobs(process_file, valid_files, args=(input_folder, output_folder), kwargs=options, workers=workers,
+             desc="Processing Images", unit="image", metrics=metrics, prometheus=prometheus,
+             memory_budget=memory_budget, cost=image_cost(input_folder), dedupe=dedupe,
+             catalog=catalog, resampler=resampler, pipeline=pipeline, source=source_path(input_folder),
+             claim_folder=input_folder)
+
+def process_file(filename, input_folder, output_folder, fast_decode=False, manifest=False, sizes=None,
+                 profile=None, split_grid=False):
+    done_folder = os.path.join(input_folder, 'done')
+    failed_folder = os.path.join(input_folder, 'failed')
+    original_path = os.path.join(input_folder, filename)
+    base_name, ext = os.path.splitext(filename)
+    timestamp = int(time.time())
+    sizes = sizes or DEFAULT_SIZES
 
-        temp_path = None
-        try:
-            # Copy original to temp file
-            with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as temp_file:
-                temp_path = temp_file.name
-                with open(original_path, 'rb') as src:
-                    temp_file.write(src.read())
+    # The file is leased to this run by run_jobs, which replaces the old
+    # -PROCESSING- lock file
+    manifest_db = open_manifest(output_folder) if manifest else None
+    source_key = None
+    if manifest_db:
+        source_key, previous_output = manifest_db.lookup(original_path, filename)
+        if previous_output:
+            # Same content was resized before; just move the original to done
+            move_file(original_path, os.path.join(done_folder, filename))
+            return "skipped"
 
-            # Process image
-            try:
-                with Image.open(temp_path) as img:
+    # Process image, reading the original directly; it is only moved
+    # after it has been closed again
+    try:
+        output_filename = f"{base_name}-DONE-{timestamp}{ext}"
+        output_path = main_output_path(os.path.join(output_folder, output_filename), sizes)
+        # Images within 50px of the target width are passed on unchanged
+        output_size = None if split_grid else passthrough_size(original_path, sizes, tolerance=50)
+        if output_size:
+            copy_output(original_path, output_path)
+        else:
+            with open_source(original_path) as img:
+                if split_grid:
+                    output_size = save_grid(img, output_path, sizes[0][0], sizes, fast_decode,
+                                            quality=95, profile=profile)
+                if not output_size:
                     width, height = img.size
-                    # Resize only if within specified width range
-                    if 1150 <= width <= 1250:
-                        new_width = 1200
-                        new_height = int((new_width / width) * height)
-                        img = img.resize((new_width, new_height), Image.LANCZOS)
-                    
+                    new_width = sizes[0][0]
+                    new_height = int((new_width / width) * height)
+                    img = resize_to(img, (new_width, new_height), fast_decode)
+            
                     # Save processed image
-                    output_filename = f"{base_name}-DONE-{timestamp}{ext}"
-                    output_path = os.path.join(output_folder, output_filename)
-                    img.save(output_path, quality=95)
-                
-                # Move original to done folder
-                shutil.move(original_path, os.path.join(done_folder, filename))
-
-            except Exception as e:
-                # Create failed marker and move original
-                output_filename = f"{base_name}-FAILED-{timestamp}{ext}"
-                output_path = os.path.join(output_folder, output_filename)
-                open(output_path, 'w').close()
-                shutil.move(original_path, os.path.join(failed_folder, filename))
-                print(f"Error processing {filename}: {str(e)}")
+                    save_sizes(img, output_path, sizes, quality=95, profile=profile)
+                    output_size = img.size
+        if manifest_db:
+            manifest_db.record(source_key, "done", output_path, output_size)
+        
+        # Move original to done folder
+        move_file(original_path, os.path.join(done_folder, filename))
+        return "done"
 
-        finally:
-            # Cleanup temporary and lock files
-            if temp_path and os.path.exists(temp_path):
-                os.remove(temp_path)
-            if os.path.exists(processing_path):
-                os.remove(processing_path)
+    except Exception as e:
+        # Create failed marker and move original
+        output_filename = f"{base_name}-FAILED-{timestamp}{ext}"
+        output_path = os.path.join(output_folder, output_filename)
+        open(output_path, 'w').close()
+        if manifest_db:
+            manifest_db.record(source_key, "failed")
+        move_file(original_path, os.path.join(failed_folder, filename))
+        print(f"Error processing {filename}: {str(e)}")
+        return "failed"
 
 if __name__ == "__main__":
-    input_folder = r"D:\Picture\playGround\01"
-    output_folder = r"D:\Picture\playGround\02"
-    process_images(input_folder, output_folder)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Resize images to 1200px width and move originals to done/failed.')
+    parser.add_argument('input_folder', nargs='?', default=r"D:\Picture\playGround\01",
+                        help='Path to the input folder containing images')
+    parser.add_argument('output_folder', nargs='?', default=r"D:\Picture\playGround\02",
+                        help='Path to the output folder for resized images')
+    add_resize_arguments(parser)
+    args = parser.parse_args()
+    process_images(args.input_folder, args.output_folder, **resize_options(args))
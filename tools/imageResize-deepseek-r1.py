@@ -1,78 +1,111 @@
 import os
 import argparse
 import time
-from PIL import Image
-from tqdm import tqdm
+from resizeCommon import (
+    DEFAULT_SIZES, add_resize_arguments, resize_options, resize_to, find_images, run_jobs,
+    main_output_path, save_sizes, move_file, image_cost,
+    passthrough_size, copy_output, save_grid, open_source, source_path,
+)
+from resizeManifest import open_manifest
 
 ALLOWED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp', '.gif'}
 
-def process_images(input_folder, output_folder):
+def is_image_file(filename):
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in ALLOWED_EXTENSIONS:
+        return False
+    
+    if '-PROCESSING-' in filename or '-DONE-' in filename:
+        return False
+    
+    return True
+
+def process_images(input_folder, output_folder, workers=1, watch=False, metrics=None, prometheus=None,
+                   memory_budget=None, dedupe=None, catalog=False, resampler=None, pipeline=None,
+                   **options):
     os.makedirs(output_folder, exist_ok=True)
 
     if os.path.abspath(input_folder) == os.path.abspath(output_folder):
         print("Error: Input and output folders must be different.")
         return
 
-    valid_files = []
-    for filename in os.listdir(input_folder):
-        file_path = os.path.join(input_folder, filename)
-        if not os.path.isfile(file_path):
-            continue
-        
-        ext = os.path.splitext(filename)[1].lower()
-        if ext not in ALLOWED_EXTENSIONS:
-            continue
-        
-        if '-PROCESSING-' in filename or '-DONE-' in filename:
-            continue
-        
-        valid_files.append(filename)
+    valid_files = find_images(input_folder, is_image_file, watch)
+
+    run_jobs(process_file, valid_files, args=(input_folder, output_folder), kwargs=options, workers=workers,
+             desc="Processing images", metrics=metrics, prometheus=prometheus,
+             memory_budget=memory_budget, cost=image_cost(input_folder), dedupe=dedupe,
+             catalog=catalog, resampler=resampler, pipeline=pipeline, source=source_path(input_folder),
+             claim_folder=input_folder)
 
-    for filename in tqdm(valid_files, desc="Processing images"):
-        original_path = os.path.join(input_folder, filename)
-        timestamp = time.strftime("%Y%m%d-%H%M%S")
-        base, ext = os.path.splitext(filename)
-        
-        # Create processing filename
-        processing_filename = f"{base}-PROCESSING-{timestamp}{ext}"
-        processing_path = os.path.join(input_folder, processing_filename)
-        
-        try:
-            os.rename(original_path, processing_path)
-        except FileNotFoundError:
-            continue
+def process_file(filename, input_folder, output_folder, fast_decode=False, manifest=False, sizes=None,
+                 profile=None, split_grid=False):
+    original_path = os.path.join(input_folder, filename)
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    base, ext = os.path.splitext(filename)
+    sizes = sizes or DEFAULT_SIZES
+    
+    # Create processing filename
+    processing_filename = f"{base}-PROCESSING-{timestamp}{ext}"
+    processing_path = os.path.join(input_folder, processing_filename)
+    
+    try:
+        move_file(original_path, processing_path, claim=True)
+    except FileNotFoundError:
+        return "skipped"
 
-        try:
-            with Image.open(processing_path) as img:
-                width = 1200
-                original_width, original_height = img.size
-                if original_width != width:
+    manifest_db = open_manifest(output_folder) if manifest else None
+    source_key = None
+    try:
+        if manifest_db:
+            source_key, previous_output = manifest_db.lookup(processing_path, filename)
+            if previous_output:
+                # Same content was resized before; just mark it as done
+                return "skipped"
+        # Create output filename with timestamp
+        output_filename = processing_filename.replace("-PROCESSING-", "-")
+        output_path = main_output_path(os.path.join(output_folder, output_filename), sizes)
+        # A grid is never passed on whole
+        output_size = None if split_grid else passthrough_size(processing_path, sizes)
+        if output_size:
+            # Already the target width: pass the file on instead of re-encoding it
+            copy_output(processing_path, output_path)
+        else:
+            with open_source(processing_path) as img:
+                width = sizes[0][0]
+                if split_grid:
+                    output_size = save_grid(img, output_path, width, sizes, fast_decode,
+                                            quality=95, optimize=True, profile=profile)
+                if not output_size:
+                    original_width, original_height = img.size
                     ratio = width / original_width
                     new_height = int(original_height * ratio)
-                    img = img.resize((width, new_height), Image.LANCZOS)
-                
-                # Create output filename with timestamp
-                output_filename = processing_filename.replace("-PROCESSING-", "-")
-                output_path = os.path.join(output_folder, output_filename)
-                img.save(output_path, quality=95, optimize=True)
-        except Exception as e:
-            print(f"\nError processing {filename}: {str(e)}")
-            continue
-        finally:
-            # Create DONE filename
-            done_filename = processing_filename.replace("-PROCESSING-", "-DONE-")
-            done_path = os.path.join(input_folder, done_filename)
-            if os.path.exists(processing_path):
-                os.rename(processing_path, done_path)
+                    img = resize_to(img, (width, new_height), fast_decode)
+                    save_sizes(img, output_path, sizes, quality=95, optimize=True, profile=profile)
+                    output_size = img.size
+        if manifest_db:
+            manifest_db.record(source_key, "done", output_path, output_size)
+        return "done"
+    except Exception as e:
+        print(f"\nError processing {filename}: {str(e)}")
+        if manifest_db and source_key:
+            manifest_db.record(source_key, "failed")
+        return "failed"
+    finally:
+        # Create DONE filename
+        done_filename = processing_filename.replace("-PROCESSING-", "-DONE-")
+        done_path = os.path.join(input_folder, done_filename)
+        if os.path.exists(processing_path):
+            move_file(processing_path, done_path)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Resize images to 1200px width while preserving aspect ratio.')
     parser.add_argument('input_folder', help='Path to the input folder containing images')
     parser.add_argument('output_folder', help='Path to the output folder for resized images')
+    add_resize_arguments(parser)
     args = parser.parse_args()
 
     if not os.path.exists(args.input_folder):
         print(f"Error: Input folder '{args.input_folder}' does not exist.")
         exit(1)
 
-    process_images(args.input_folder, args.output_folder)
\ No newline at end of file
+    process_images(args.input_folder, args.output_folder, **resize_options(args))
\ No newline at end of file
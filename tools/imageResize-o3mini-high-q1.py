@@ -3,101 +3,144 @@ import os
 import argparse
 import time
 import shutil
-from PIL import Image
-from tqdm import tqdm
+from resizeCommon import (
+    DEFAULT_SIZES, add_resize_arguments, resize_options, resize_to, find_images, run_jobs,
+    save_sizes, move_file, image_cost,
+    passthrough_size, copy_output, save_grid, open_source, source_path,
+)
+from resizeManifest import open_manifest
 
 ALLOWED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp', '.gif'}
 
-def process_images(input_folder, output_folder):
+def is_image_file(filename):
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in ALLOWED_EXTENSIONS:
+        return False
+    if any(tag in filename for tag in ["-PROCESSING-", "-DONE-", "-FAILED-"]):
+        return False
+    return True
+
+def process_images(input_folder, output_folder, workers=1, watch=False, metrics=None, prometheus=None,
+                   memory_budget=None, dedupe=None, catalog=False, resampler=None, pipeline=None,
+                   **options):
     os.makedirs(output_folder, exist_ok=True)
     if os.path.abspath(input_folder) == os.path.abspath(output_folder):
         print("Error: Input and output folders must be different.")
         return
 
-    valid_files = []
-    for filename in os.listdir(input_folder):
-        file_path = os.path.join(input_folder, filename)
-        if not os.path.isfile(file_path):
-            continue
-        ext = os.path.splitext(filename)[1].lower()
-        if ext not in ALLOWED_EXTENSIONS:
-            continue
-        if any(tag in filename for tag in ["-PROCESSING-", "-DONE-", "-FAILED-"]):
-            continue
-        valid_files.append(filename)
+    valid_files = find_images(input_folder, is_image_file, watch)
 
-    for filename in tqdm(valid_files, desc="Processing images"):
-        original_path = os.path.join(input_folder, filename)
-        timestamp = time.strftime("%Y%m%d-%H%M%S")
-        base, ext = os.path.splitext(filename)
-        
-        # Create a temporary copy of the original file.
-        tmp_path = os.path.join(input_folder, filename + ".tmp")
-        try:
-            shutil.copy2(original_path, tmp_path)
-        except Exception as e:
-            print(f"Error copying file {filename} to tmp: {e}")
-            continue
-        
-        # Rename the tmp file to include the PROCESSING tag.
-        processing_filename = f"{base}-PROCESSING-{timestamp}{ext}"
-        processing_path = os.path.join(input_folder, processing_filename)
+    run_jobs(process_file, valid_files, args=(input_folder, output_folder), kwargs=options, workers=workers,
+             desc="Processing images", metrics=metrics, prometheus=prometheus,
+             memory_budget=memory_budget, cost=image_cost(input_folder), dedupe=dedupe,
+             catalog=catalog, resampler=resampler, pipeline=pipeline, source=source_path(input_folder),
+             claim_folder=input_folder)
+
+def process_file(filename, input_folder, output_folder, fast_decode=False, manifest=False, sizes=None,
+                 profile=None, split_grid=False):
+    original_path = os.path.join(input_folder, filename)
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    base, ext = os.path.splitext(filename)
+    sizes = sizes or DEFAULT_SIZES
+    # The resized file keeps the source format unless --sizes names another one.
+    output_ext = sizes[0][1] or ext
+
+    # Skip content that was already resized, even under another name.
+    manifest_db = open_manifest(output_folder) if manifest else None
+    source_key = None
+    read_error = None
+    if manifest_db:
         try:
-            os.rename(tmp_path, processing_path)
+            source_key, previous_output = manifest_db.lookup(original_path, filename)
         except Exception as e:
-            print(f"Error renaming tmp file for {filename}: {e}")
-            continue
+            # Could not be read to hash it: fails below like any other read error
+            read_error = e
+            previous_output = None
+        if previous_output:
+            dest_folder = os.path.join(input_folder, "done")
+            os.makedirs(dest_folder, exist_ok=True)
+            move_file(original_path, os.path.join(dest_folder, filename))
+            return "skipped"
+    
+    # Rename the original to include the PROCESSING tag. This marks it as taken
+    # without copying it; it gets its original name back when it is moved to
+    # the done/failed folder.
+    processing_filename = f"{base}-PROCESSING-{timestamp}{ext}"
+    processing_path = os.path.join(input_folder, processing_filename)
+    try:
+        move_file(original_path, processing_path, claim=True)
+    except Exception as e:
+        print(f"Error marking {filename} as processing: {e}")
+        return "skipped"
 
-        resize_success = False
-        try:
-            with Image.open(processing_path) as img:
-                width = 1200
-                original_width, original_height = img.size
-                if original_width != width:
+    resize_success = False
+    new_filename = f"{base}-DONE-{timestamp}{output_ext}"
+    new_processing_path = os.path.join(output_folder, new_filename)
+    try:
+        if read_error:
+            raise read_error
+        output_size = None if split_grid else passthrough_size(processing_path, sizes)
+        if output_size:
+            # Already the target width: pass the file on instead of re-encoding it
+            copy_output(processing_path, new_processing_path)
+        else:
+            with open_source(processing_path) as img:
+                if split_grid:
+                    output_size = save_grid(img, new_processing_path, sizes[0][0], sizes, fast_decode,
+                                            quality=95, optimize=True, profile=profile)
+                if not output_size:
+                    width = sizes[0][0]
+                    original_width, original_height = img.size
                     ratio = width / original_width
                     new_height = int(original_height * ratio)
-                    resized_img = img.resize((width, new_height), Image.LANCZOS)
-                else:
-                    resized_img = img.copy()
-            # At this point, the Image object is closed; save the resized image.
-            resized_img.save(processing_path, quality=95, optimize=True)
-            resize_success = True
-        except Exception as e:
-            print(f"Error processing {filename}: {e}")
-            resize_success = False
+                    resized_img = resize_to(img, (width, new_height), fast_decode)
+                    # Save the resized image straight into the output folder. This
+                    # happens before the source is closed, as the frames of an
+                    # animated GIF are read while saving.
+                    save_sizes(resized_img, new_processing_path, sizes, quality=95, optimize=True, profile=profile)
+                    output_size = resized_img.size
+        resize_success = True
+    except Exception as e:
+        print(f"Error processing {filename}: {e}")
+        resize_success = False
 
-        # Set tag and subfolder name based on the resize result.
-        if resize_success:
-            new_tag = "DONE"
-            subfolder = "done"
-        else:
-            new_tag = "FAILED"
-            subfolder = "failed"
-        new_filename = f"{base}-{new_tag}-{timestamp}{ext}"
+    # Set subfolder name based on the resize result. A failed image is copied
+    # to the output folder unchanged, tagged FAILED.
+    if resize_success:
+        subfolder = "done"
+    else:
+        subfolder = "failed"
+        new_filename = f"{base}-FAILED-{timestamp}{ext}"
         new_processing_path = os.path.join(output_folder, new_filename)
         try:
-            os.rename(processing_path, new_processing_path)
+            shutil.copy2(processing_path, new_processing_path)
         except Exception as e:
-            print(f"Error moving processed file {filename} to output: {e}")
-            continue
+            print(f"Error copying failed file {filename} to output: {e}")
+    if manifest_db and source_key:
+        if resize_success:
+            manifest_db.record(source_key, "done", new_processing_path, output_size)
+        else:
+            manifest_db.record(source_key, "failed")
 
-        # Create the destination subfolder inside the input folder and move the original file.
-        dest_folder = os.path.join(input_folder, subfolder)
-        os.makedirs(dest_folder, exist_ok=True)
-        dest_original_path = os.path.join(dest_folder, filename)
-        try:
-            os.rename(original_path, dest_original_path)
-        except Exception as e:
-            print(f"Error moving original file {filename} to {subfolder} folder: {e}")
+    # Create the destination subfolder inside the input folder and move the original file.
+    dest_folder = os.path.join(input_folder, subfolder)
+    os.makedirs(dest_folder, exist_ok=True)
+    dest_original_path = os.path.join(dest_folder, filename)
+    try:
+        move_file(processing_path, dest_original_path)
+    except Exception as e:
+        print(f"Error moving original file {filename} to {subfolder} folder: {e}")
+    return subfolder
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Resize images to 1200px width while preserving aspect ratio.')
     parser.add_argument('input_folder', help='Path to the input folder containing images')
     parser.add_argument('output_folder', help='Path to the output folder for resized images')
+    add_resize_arguments(parser)
     args = parser.parse_args()
 
     if not os.path.exists(args.input_folder):
         print(f"Error: Input folder '{args.input_folder}' does not exist.")
         exit(1)
 
-    process_images(args.input_folder, args.output_folder)
+    process_images(args.input_folder, args.output_folder, **resize_options(args))
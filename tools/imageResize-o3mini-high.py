@@ -12,17 +12,27 @@ Script to process all image files in an input folder:
          "-PROCESSING-" part removed (i.e. {original name}-{timestamp}.{ext}).
       4. Renames the original file (in the input folder) to have "-DONE-{timestamp}".
   - Displays a progress bar using tqdm.
+  - With --workers N, spreads the per-file work over N processes.
+  - Leases each file before renaming it (see workLease.py), so several runs, also
+    on other machines, can drain one input folder; a -PROCESSING- file left by a
+    run that died gets its original name back once its lease expires.
 """
 
 import os
 import re
 import datetime
 import argparse
-from PIL import Image
-from tqdm import tqdm
+from resizeCommon import (
+    add_resize_arguments, resize_options, resize_to, find_images, run_jobs,
+    main_output_path, save_sizes, move_file, image_cost,
+    passthrough_size, copy_output, save_grid, open_source, source_path,
+)
+from resizeManifest import open_manifest
 
 # Allowed image extensions
 ALLOWED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp', '.gif'}
+# -PROCESSING-/-DONE- marker at the end of the base name
+MARKER_PATTERN = re.compile(r"-(PROCESSING|DONE)-\d{14}$")
 
 def is_image_file(filename):
     """Return True if the file has an allowed image extension and is not already processed."""
@@ -30,62 +40,105 @@ def is_image_file(filename):
     if ext.lower() not in ALLOWED_EXTENSIONS:
         return False
     # Skip files that already have the -PROCESSING- or -DONE- pattern at the end of the base name.
-    if re.search(r"-(PROCESSING|DONE)-\d{14}$", base):
+    if MARKER_PATTERN.search(base):
         return False
     return True
 
-def resize_image(input_path, output_path, target_width=1200):
+def resize_image(input_path, output_path, target_width=1200, fast_decode=False, sizes=None, profile=None,
+                 split_grid=False):
     """
     Opens an image from input_path, resizes it to target_width while preserving the
     aspect ratio, and saves it to output_path using a high-quality LANCZOS filter.
+    With fast_decode, large sources are first decoded at a reduced scale.
+    sizes (from --sizes) replaces target_width and also writes the smaller
+    sizes next to output_path. profile (from --profile) picks the encoder settings.
+    An image that already has the target width is hardlinked or copied as is.
+    With split_grid, a 2x2 grid is saved as four images instead (see save_grid).
+    Returns the size of the resized image.
     """
-    with Image.open(input_path) as img:
+    sizes = sizes or [(target_width, None)]
+    output_size = None if split_grid else passthrough_size(input_path, sizes)
+    if output_size:
+        copy_output(input_path, output_path)
+        return output_size
+    with open_source(input_path) as img:
+        if split_grid:
+            output_size = save_grid(img, output_path, sizes[0][0], sizes, fast_decode, profile=profile)
+            if output_size:
+                return output_size
         orig_width, orig_height = img.size
         # Calculate new dimensions
-        new_width = target_width
+        new_width = sizes[0][0]
         new_height = int(orig_height * new_width / orig_width)
         # Resize using LANCZOS for high quality
-        img_resized = img.resize((new_width, new_height), Image.LANCZOS)
-        img_resized.save(output_path)
+        img_resized = resize_to(img, (new_width, new_height), fast_decode)
+        save_sizes(img_resized, output_path, sizes, profile=profile)
+        return img_resized.size
 
-def process_images(input_folder, output_folder):
+def process_images(input_folder, output_folder, workers=1, watch=False, metrics=None, prometheus=None,
+                   memory_budget=None, dedupe=None, catalog=False, resampler=None, pipeline=None,
+                   **options):
     # Create the output folder if it doesn't exist
     os.makedirs(output_folder, exist_ok=True)
 
-    # List all files in the input folder and filter by image files
-    all_files = os.listdir(input_folder)
-    image_files = [f for f in all_files if os.path.isfile(os.path.join(input_folder, f)) and is_image_file(f)]
+    # Stream the image files in the input folder; processing starts while the
+    # folder is still being listed
+    image_files = find_images(input_folder, is_image_file, watch)
 
-    for filename in tqdm(image_files, desc="Processing images"):
-        # Full path for the original file
-        original_path = os.path.join(input_folder, filename)
-        name_without_ext, ext = os.path.splitext(filename)
-        # Generate a timestamp string (e.g. 20250201123045)
-        timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+    run_jobs(process_file, image_files, args=(input_folder, output_folder), kwargs=options, workers=workers,
+             desc="Processing images", metrics=metrics, prometheus=prometheus,
+             memory_budget=memory_budget, cost=image_cost(input_folder), dedupe=dedupe,
+             catalog=catalog, resampler=resampler, pipeline=pipeline, source=source_path(input_folder),
+             claim_folder=input_folder)
 
-        # Build the new processing filename and full path
-        processing_filename = f"{name_without_ext}-PROCESSING-{timestamp}{ext}"
-        processing_path = os.path.join(input_folder, processing_filename)
-        
-        # Rename original file to mark as "processing"
-        os.rename(original_path, processing_path)
+def process_file(filename, input_folder, output_folder, fast_decode=False, manifest=False, sizes=None,
+                 profile=None, split_grid=False):
+    # Full path for the original file
+    original_path = os.path.join(input_folder, filename)
+    name_without_ext, ext = os.path.splitext(filename)
+    # Generate a timestamp string (e.g. 20250201123045)
+    timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
 
-        try:
-            # Build the output filename by removing the "-PROCESSING-" part.
-            # The output file will be: {original name}-{timestamp}.{extension}
-            output_filename = f"{name_without_ext}-{timestamp}{ext}"
-            output_path = os.path.join(output_folder, output_filename)
-            
+    # Build the new processing filename and full path
+    processing_filename = f"{name_without_ext}-PROCESSING-{timestamp}{ext}"
+    processing_path = os.path.join(input_folder, processing_filename)
+    
+    # Rename original file to mark as "processing"
+    move_file(original_path, processing_path, claim=True)
+
+    manifest_db = open_manifest(output_folder) if manifest else None
+    source_key = None
+    try:
+        # Build the output filename by removing the "-PROCESSING-" part.
+        # The output file will be: {original name}-{timestamp}.{extension}
+        output_filename = f"{name_without_ext}-{timestamp}{ext}"
+        output_path = main_output_path(os.path.join(output_folder, output_filename), sizes or [(1200, None)])
+
+        # Content that was already resized, even under another name, is only
+        # marked as done.
+        previous_output = None
+        if manifest_db:
+            source_key, previous_output = manifest_db.lookup(processing_path, filename)
+        if previous_output:
+            status = "skipped"
+        else:
             # Resize the image and save the result in the output folder
-            resize_image(processing_path, output_path, target_width=1200)
-        except Exception as e:
-            print(f"Error processing {processing_path}: {e}")
-            continue
+            new_size = resize_image(processing_path, output_path, target_width=1200, fast_decode=fast_decode, sizes=sizes,
+                                    profile=profile, split_grid=split_grid)
+            status = "done"
+            if manifest_db:
+                manifest_db.record(source_key, "done", output_path, new_size)
+    except Exception as e:
+        print(f"Error processing {processing_path}: {e}")
+        if manifest_db and source_key:
+            manifest_db.record(source_key, "failed")
+        return "failed"
 
-        # Rename the processed file to mark it as done.
-        done_filename = f"{name_without_ext}-DONE-{timestamp}{ext}"
-        done_path = os.path.join(input_folder, done_filename)
-        os.rename(processing_path, done_path)
+    # Rename the processed file to mark it as done.
+    done_filename = f"{name_without_ext}-DONE-{timestamp}{ext}"
+    done_path = os.path.join(input_folder, done_filename)
+    move_file(processing_path, done_path)
+    return status
 
 def main():
     parser = argparse.ArgumentParser(
@@ -93,9 +146,10 @@ def main():
     )
     parser.add_argument("input_folder", type=str, help="Path to the input folder containing images.")
     parser.add_argument("output_folder", type=str, help="Path to the output folder for resized images.")
+    add_resize_arguments(parser)
     args = parser.parse_args()
 
-    process_images(args.input_folder, args.output_folder)
+    process_images(args.input_folder, args.output_folder, **resize_options(args))
 
 if __name__ == "__main__":
     main()
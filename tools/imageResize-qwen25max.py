@@ -1,65 +1,110 @@
 import os
 import time
-from PIL import Image
-from tqdm import tqdm
+import argparse
+from resizeCommon import (
+    DEFAULT_SIZES, add_resize_arguments, resize_options, resize_to, find_images, run_jobs,
+    main_output_path, save_sizes, move_file, image_cost,
+    passthrough_size, copy_output, save_grid, open_source, source_path,
+)
+from resizeManifest import open_manifest
 
 # Supported image extensions
 SUPPORTED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp', '.gif'}
 
-def process_images(input_folder, output_folder):
+def is_image_file(filename):
+    # Only supported image files
+    if os.path.splitext(filename)[1].lower() not in SUPPORTED_EXTENSIONS:
+        return False
+    # Exclude files with "-PROCESSING-" or "-DONE-" in their names
+    return '-PROCESSING-' not in filename and '-DONE-' not in filename
+
+def process_images(input_folder, output_folder, workers=1, watch=False, metrics=None, prometheus=None,
+                   memory_budget=None, dedupe=None, catalog=False, resampler=None, pipeline=None,
+                   **options):
     # Create the output folder if it doesn't exist
     os.makedirs(output_folder, exist_ok=True)
 
-    # Get all files in the input folder
-    all_files = os.listdir(input_folder)
-    
-    # Filter out only supported image files
-    image_files = [f for f in all_files if os.path.splitext(f)[1].lower() in SUPPORTED_EXTENSIONS]
-
-    # Exclude files with "-PROCESSING-" or "-DONE-" in their names
-    image_files = [f for f in image_files if '-PROCESSING-' not in f and '-DONE-' not in f]
+    # Stream the supported image files in the input folder
+    image_files = find_images(input_folder, is_image_file, watch)
 
     # Process each image file with a progress bar
-    for filename in tqdm(image_files, desc="Processing Images", unit="image"):
-        original_path = os.path.join(input_folder, filename)
-        name, ext = os.path.splitext(filename)
-        timestamp = int(time.time())
-        
-        # Rename the file to indicate processing has started
-        processing_filename = f"{name}-PROCESSING-{timestamp}{ext}"
-        processing_path = os.path.join(input_folder, processing_filename)
-        os.rename(original_path, processing_path)
+    run_jobs(process_file, image_files, args=(input_folder, output_folder), kwargs=options, workers=workers,
+             desc="Processing Images", unit="image", metrics=metrics, prometheus=prometheus,
+             memory_budget=memory_budget, cost=image_cost(input_folder), dedupe=dedupe,
+             catalog=catalog, resampler=resampler, pipeline=pipeline, source=source_path(input_folder),
+             claim_folder=input_folder)
 
-        try:
-            # Open the image using Pillow
-            with Image.open(processing_path) as img:
-                # Calculate new dimensions while preserving aspect ratio
-                width, height = img.size
-                new_width = 1200
-                new_height = int((new_width / width) * height)
+def process_file(filename, input_folder, output_folder, fast_decode=False, manifest=False, sizes=None,
+                 profile=None, split_grid=False):
+    original_path = os.path.join(input_folder, filename)
+    name, ext = os.path.splitext(filename)
+    timestamp = int(time.time())
+    sizes = sizes or DEFAULT_SIZES
+    
+    # Rename the file to indicate processing has started
+    processing_filename = f"{name}-PROCESSING-{timestamp}{ext}"
+    processing_path = os.path.join(input_folder, processing_filename)
+    move_file(original_path, processing_path, claim=True)
+
+    manifest_db = open_manifest(output_folder) if manifest else None
+    source_key = None
+    previous_output = None
+    try:
+        # Content that was already resized, even under another name, is only
+        # marked as done
+        if manifest_db:
+            source_key, previous_output = manifest_db.lookup(processing_path, filename)
+        if not previous_output:
+            output_filename = f"{name}-{timestamp}{ext}"  # Include timestamp in output filename
+            output_path = main_output_path(os.path.join(output_folder, output_filename), sizes)
+            # Images that already have the target width are passed on unchanged
+            output_size = None if split_grid else passthrough_size(processing_path, sizes)
+            if output_size:
+                copy_output(processing_path, output_path)
+            else:
+                # Open the image using Pillow
+                with open_source(processing_path) as img:
+                    if split_grid:
+                        output_size = save_grid(img, output_path, sizes[0][0], sizes, fast_decode,
+                                                quality=95, profile=profile)
+                    if not output_size:
+                        # Calculate new dimensions while preserving aspect ratio
+                        width, height = img.size
+                        new_width = sizes[0][0]
+                        new_height = int((new_width / width) * height)
 
-                # Resize the image using LANCZOS filter
-                resized_img = img.resize((new_width, new_height), Image.LANCZOS)
+                        # Resize the image using LANCZOS filter
+                        resized_img = resize_to(img, (new_width, new_height), fast_decode)
 
-                # Save the resized image to the output folder with a timestamp
-                output_filename = f"{name}-{timestamp}{ext}"  # Include timestamp in output filename
-                output_path = os.path.join(output_folder, output_filename)
-                resized_img.save(output_path, quality=95)
+                        # Save the resized image to the output folder with a timestamp
+                        save_sizes(resized_img, output_path, sizes, quality=95, profile=profile)
+                        output_size = resized_img.size
+            if manifest_db:
+                manifest_db.record(source_key, "done", output_path, output_size)
 
-            # Rename the processing file to indicate completion
-            done_filename = f"{name}-DONE-{timestamp}{ext}"
-            done_path = os.path.join(input_folder, done_filename)
-            os.rename(processing_path, done_path)
+        # Rename the processing file to indicate completion
+        done_filename = f"{name}-DONE-{timestamp}{ext}"
+        done_path = os.path.join(input_folder, done_filename)
+        move_file(processing_path, done_path)
+        return "skipped" if previous_output else "done"
 
-        except Exception as e:
-            # If an error occurs, revert the filename back to its original name
-            os.rename(processing_path, original_path)
-            print(f"Error processing {filename}: {e}")
+    except Exception as e:
+        # If an error occurs, revert the filename back to its original name
+        move_file(processing_path, original_path)
+        print(f"Error processing {filename}: {e}")
+        if manifest_db and source_key:
+            manifest_db.record(source_key, "failed")
+        return "failed"
 
 if __name__ == "__main__":
     # Specify the input and output folders
-    input_folder = r"D:\Picture\playGround\01"   # update to your source folder
-    output_folder = r"D:\Picture\playGround\02"  # update to your destination folder
-
+    parser = argparse.ArgumentParser(description='Resize images to 1200px width while preserving aspect ratio.')
+    parser.add_argument('input_folder', nargs='?', default=r"D:\Picture\playGround\01",   # update to your source folder
+                        help='Path to the input folder containing images')
+    parser.add_argument('output_folder', nargs='?', default=r"D:\Picture\playGround\02",  # update to your destination folder
+                        help='Path to the output folder for resized images')
+    add_resize_arguments(parser)
+    args = parser.parse_args()
+    
     # Call the function to process images
-    process_images(input_folder, output_folder)
\ No newline at end of file
+    process_images(args.input_folder, args.output_folder, **resize_options(args))
@@ -0,0 +1,237 @@
+"""
+LANCZOS resampling with NumPy, for --resampler numpy in the resize scripts.
+
+Midjourney images come in a few fixed sizes (1456x816 for --ar 16:9,
+896x1344 for --ar 2:3, ...) and are all resized to the same width, so the
+same (source, target) shapes come up again and again. Pillow computes the
+filter coefficients on every resize() call; here they are computed once per
+shape pair, as weight matrices, and kept in an LRU cache together with the
+float buffers a resize of that shape needs.
+
+The separable filter is applied as matrix multiplies: a horizontal pass
+(rows times the transposed width weights) and a vertical pass (height
+weights times the result). The weight matrices are banded, each output
+pixel reads about 2 * 3 * scale source pixels, so they are split into tiles
+of TILE outputs, each multiplying only the source columns (or rows) its
+outputs read. That keeps the work close to Pillow's and the operands in
+cache. As in Pillow, the horizontal pass is rounded to 8 bits before the
+vertical one.
+
+Same-shape images are resized as a batch, one colour plane after another
+through the shape's cached buffers (see resize_batch). Stacking a whole batch
+into one array was measured slower: the working set falls out of the cache.
+
+Output matches Image.resize(size, Image.LANCZOS) within TOLERANCE per
+channel value; modes other than the 8-bit ones below are left to Pillow.
+That includes RGBA and LA: Pillow resizes them premultiplied and divides by
+the alpha afterwards, which turns a difference of one level at alpha 8 into
+32 levels, so only a bit-exact resize would stay within TOLERANCE there.
+
+Usage:
+    python lanczosBatch.py check D:/Midjourney/downloads --width 1200
+    python lanczosBatch.py benchmark --count 24
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+from functools import lru_cache
+import numpy as np
+from PIL import Image
+
+# Largest difference to Pillow's LANCZOS in any channel value (0-255)
+TOLERANCE = 2
+# Output pixels per weight tile
+TILE = 16
+# Filter support of LANCZOS (a = 3), in source pixels at scale 1
+SUPPORT = 3.0
+# Modes resized here, one band at a time
+PLAIN_MODES = {'L', 'RGB', 'CMYK', 'YCbCr', 'LAB', 'HSV'}
+# (source, target) shapes whose weights and buffers are kept
+CACHE_SIZE = 16
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp', '.bmp'}
+
+
+def lanczos(x):
+    """The LANCZOS kernel sinc(x) * sinc(x / 3) on |x| < 3."""
+    return np.where(np.abs(x) < SUPPORT, np.sinc(x) * np.sinc(x / SUPPORT), 0.0)
+
+
+def weights(source, target):
+    """
+    (target, source) matrix of the normalized filter weights of each output
+    pixel, computed as Pillow's precompute_coeffs does.
+    """
+    scale = source / target
+    filter_scale = max(scale, 1.0)
+    support = SUPPORT * filter_scale
+    matrix = np.zeros((target, source))
+    for i in range(target):
+        center = (i + 0.5) * scale
+        first = max(int(center - support + 0.5), 0)
+        last = min(int(center + support + 0.5), source)
+        row = lanczos((np.arange(first, last) - center + 0.5) / filter_scale)
+        total = row.sum()
+        matrix[i, first:last] = row / total if total else row
+    return matrix
+
+
+def weight_tiles(source, target):
+    """
+    The weights split into tiles of TILE outputs: (first output, end output,
+    first source, end source, tile weights) with only the sources the tile reads.
+    """
+    matrix = weights(source, target)
+    tiles = []
+    for first in range(0, target, TILE):
+        end = min(target, first + TILE)
+        used = np.flatnonzero(matrix[first:end].any(axis=0))
+        low, high = used[0], used[-1] + 1
+        tiles.append((first, end, low, high, np.ascontiguousarray(matrix[first:end, low:high], dtype=np.float32)))
+    return tiles
+
+
+class Resampler:
+    """Cached weights and buffers for one (source, target) shape pair."""
+
+    def __init__(self, source_size, target_size):
+        (width, height), (target_width, target_height) = source_size, target_size
+        # The horizontal pass multiplies by the transposed tiles
+        self.columns = [(first, end, low, high, np.ascontiguousarray(tile.T))
+                        for first, end, low, high, tile in weight_tiles(width, target_width)]
+        self.rows = weight_tiles(height, target_height)
+        self.source = np.empty((height, width), np.float32)
+        self.middle = np.empty((height, target_width), np.float32)
+        self.target = np.empty((target_height, target_width), np.float32)
+
+    def plane(self, band):
+        """Resize one 8-bit band (an 'L' image) and return it as an 'L' image."""
+        source, middle, target = self.source, self.middle, self.target
+        source[...] = np.asarray(band)
+        for first, end, low, high, tile in self.columns:
+            np.matmul(source[:, low:high], tile, out=middle[:, first:end])
+        # Rounded half up and clipped to 8 bits between the passes, like Pillow
+        middle += 0.5
+        np.floor(middle, out=middle)
+        np.clip(middle, 0, 255, out=middle)
+        for first, end, low, high, tile in self.rows:
+            np.matmul(tile, middle[low:high], out=target[first:end])
+        target += 0.5
+        np.clip(target, 0, 255, out=target)
+        # The cast truncates, which completes rounding half up
+        return Image.fromarray(target.astype(np.uint8))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def resampler(source_size, target_size):
+    """The cached Resampler of a shape pair. Buffers are reused: one thread per process."""
+    return Resampler(source_size, target_size)
+
+
+def supports(img):
+    """Whether img's mode is resized here (others go to Pillow)."""
+    return img.mode in PLAIN_MODES
+
+
+def resize(img, size):
+    """img.resize(size, Image.LANCZOS) for a supported mode, or None."""
+    if not supports(img):
+        return None
+    return resize_batch([img], size)[0]
+
+
+def resize_batch(images, size):
+    """
+    Resize images (of supported modes) to size. Images of the same shape share
+    one Resampler and are resized one after another. Returns the images in
+    their order, each with the info of its source.
+    """
+    results = [None] * len(images)
+    groups = {}
+    for index, img in enumerate(images):
+        groups.setdefault(img.size, []).append(index)
+    for source_size, indexes in groups.items():
+        engine = resampler(source_size, tuple(size))
+        for index in indexes:
+            img = images[index]
+            img.load()
+            resized = Image.merge(img.mode, [engine.plane(band) for band in img.split()])
+            resized.info = dict(img.info)
+            results[index] = resized
+    return results
+
+
+def compare(img, size):
+    """(largest difference, share of differing values) against Pillow's LANCZOS."""
+    expected = np.asarray(img.resize(size, Image.LANCZOS), dtype=np.int16)
+    actual = np.asarray(resize(img, size), dtype=np.int16)
+    difference = np.abs(expected - actual)
+    return int(difference.max()), float((difference > 0).mean())
+
+
+def check_folder(folder, width):
+    """Compare every supported image in folder with Pillow; returns False if one is over TOLERANCE."""
+    ok = True
+    for name in sorted(os.listdir(folder)):
+        if os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS:
+            continue
+        with Image.open(os.path.join(folder, name)) as img:
+            if not supports(img):
+                print(f"{name}: mode {img.mode} is left to Pillow")
+                continue
+            size = (width, max(1, int(img.height * width / img.width)))
+            largest, share = compare(img, size)
+        flag = '' if largest <= TOLERANCE else '  OVER TOLERANCE'
+        ok = ok and not flag
+        print(f"{name}: {img.width}x{img.height} -> {size[0]}x{size[1]}, "
+              f"max difference {largest}, {share:.3%} of values differ{flag}")
+    return ok
+
+
+def benchmark(count, width, seed=0):
+    """images/sec of Pillow's per-image resize and of resize_batch() on Midjourney shapes."""
+    from benchmarkResize import make_image, MIDJOURNEY_SIZES
+    rng = random.Random(seed)
+    print(f"{'shape':>11} {'Pillow img/s':>13} {'NumPy img/s':>12} {'speedup':>8} {'max diff':>9}")
+    for shape in MIDJOURNEY_SIZES:
+        images = [make_image(rng, shape) for _ in range(count)]
+        size = (width, max(1, int(shape[1] * width / shape[0])))
+        # Warm up: the first batch of a shape computes its weights
+        resize_batch(images[:1], size)
+        started = time.perf_counter()
+        expected = [img.resize(size, Image.LANCZOS) for img in images]
+        pillow = count / (time.perf_counter() - started)
+        started = time.perf_counter()
+        actual = resize_batch(images, size)
+        batched = count / (time.perf_counter() - started)
+        largest = max(int(np.abs(np.asarray(a, dtype=np.int16) - np.asarray(e, dtype=np.int16)).max())
+                      for a, e in zip(actual, expected))
+        print(f"{shape[0]:>5}x{shape[1]:<5} {pillow:13.1f} {batched:12.1f} {batched / pillow:7.2f}x {largest:9d}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LANCZOS resampling with cached NumPy weight matrices.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    check = commands.add_parser('check', help=f'Compare with Pillow on a folder of images (tolerance {TOLERANCE})')
+    check.add_argument('folder')
+    check.add_argument('--width', type=int, default=1200)
+    bench = commands.add_parser('benchmark', help='images/sec against Pillow on synthetic Midjourney sizes')
+    bench.add_argument('--count', type=int, default=12, help='Images per shape (default: 12)')
+    bench.add_argument('--width', type=int, default=1200)
+    args = parser.parse_args()
+
+    if args.command == 'benchmark':
+        benchmark(args.count, args.width)
+        return
+    if not os.path.isdir(args.folder):
+        print(f"Error: Folder '{args.folder}' does not exist.")
+        sys.exit(1)
+    if not check_folder(args.folder, args.width):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,435 @@
+"""
+Catalog of the prompt metadata embedded in Midjourney images.
+
+Midjourney PNGs carry the prompt and job ID in a "Description" text chunk
+("<prompt> Job ID: <uuid>") and in XMP; JPEGs carry them in EXIF
+ImageDescription, XMP or a comment. This module reads those fields straight
+from the file structure: PNG chunks are walked with a seek over every chunk
+that is not text, JPEG markers up to the frame header. No pixel data is
+read or decoded, so a scan of a folder costs a few small reads per file.
+
+The catalog is a SQLite file with one row per image: path, size and mtime
+(unchanged files are skipped on the next scan), format, dimensions, prompt,
+parameters (parsed with promptParser), job ID and author. Rows are marked
+'source' for scanned files and 'output' for files written by the resize
+scripts with --catalog, so an output can be traced back to its prompt by
+job ID even after renameFile.py has shortened its name.
+
+The resize scripts also carry the metadata into their outputs, see
+output_metadata().
+
+Usage:
+    python metadataCatalog.py catalog.sqlite scan D:/Midjourney/downloads
+    python metadataCatalog.py catalog.sqlite find "humpback whale"
+    python metadataCatalog.py catalog.sqlite find --job 0f1e2d3c-...
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import struct
+import sqlite3
+import argparse
+
+CATALOG_NAME = '.metadata-catalog.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    size INTEGER,
+    mtime_ns INTEGER,
+    format TEXT,
+    width INTEGER,
+    height INTEGER,
+    job_id TEXT,
+    prompt TEXT,
+    params TEXT,
+    author TEXT
+);
+CREATE INDEX IF NOT EXISTS images_job_id ON images (job_id);
+"""
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+JOB_ID_RE = re.compile(r'\s*Job ID:\s*([0-9a-fA-F-]{36})\s*$')
+XMP_JOB_ID_RE = re.compile(r'DigImageGUID(?:>|=")([0-9a-fA-F-]{36})')
+XMP_DESCRIPTION_RE = re.compile(r'<dc:description>.*?<rdf:li[^>]*>(.*?)</rdf:li>', re.DOTALL)
+XMP_CREATOR_RE = re.compile(r'<dc:creator>.*?<rdf:li[^>]*>(.*?)</rdf:li>', re.DOTALL)
+# EXIF tags read from IFD0
+EXIF_DESCRIPTION = 0x010E
+EXIF_ARTIST = 0x013B
+# JPEG start-of-frame markers, which hold the dimensions
+JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg'}
+
+# Rows written per transaction while scanning
+BATCH_SIZE = 2000
+
+# One catalog per process and output folder, see open_catalog
+_catalogs = {}
+
+
+def read_png(f):
+    """Text chunks, XMP and dimensions of a PNG, seeking over everything else."""
+    if f.read(8) != PNG_SIGNATURE:
+        return None
+    fields = {'format': 'PNG', 'text': {}}
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            break
+        length, chunk_type = struct.unpack('>I4s', header)
+        if chunk_type == b'IHDR':
+            fields['width'], fields['height'] = struct.unpack('>II', f.read(8))
+            f.seek(length - 8 + 4, 1)
+        elif chunk_type in (b'tEXt', b'iTXt', b'zTXt'):
+            key, value = decode_png_text(chunk_type, f.read(length))
+            if key:
+                fields['text'][key] = value
+            f.seek(4, 1)
+        elif chunk_type == b'IEND':
+            break
+        else:
+            # Text may follow the image data, so the walk goes on to IEND
+            f.seek(length + 4, 1)
+    return fields
+
+
+def decode_png_text(chunk_type, data):
+    """(keyword, text) of a tEXt, zTXt or iTXt chunk; (None, None) if it is malformed."""
+    key, _, rest = data.partition(b'\0')
+    key = key.decode('latin-1')
+    try:
+        if chunk_type == b'tEXt':
+            return key, rest.decode('latin-1')
+        if chunk_type == b'zTXt':
+            return key, zlib.decompress(rest[1:]).decode('latin-1')
+        compressed = rest[0]
+        # compression method, language tag, translated keyword, text
+        _, _, rest = rest[2:].partition(b'\0')
+        _, _, text = rest.partition(b'\0')
+        return key, (zlib.decompress(text) if compressed else text).decode('utf-8')
+    except (zlib.error, UnicodeDecodeError, IndexError):
+        return None, None
+
+
+def read_jpeg(f):
+    """EXIF, XMP, comment and dimensions of a JPEG, reading markers up to the frame header."""
+    if f.read(2) != b'\xff\xd8':
+        return None
+    fields = {'format': 'JPEG', 'text': {}}
+    size = f.seek(0, 2)
+    f.seek(2)
+    while True:
+        # Marker and segment length in one read; fill bytes (0xFF runs) are rare
+        header = f.read(4)
+        while header[:2] == b'\xff\xff':
+            header = header[1:] + f.read(1)
+        if len(header) < 4 or header[0] != 0xFF:
+            break
+        marker = header[1]
+        if marker == 0xDA or marker == 0xD9:
+            # Start of scan: only pixel data follows
+            break
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            # No length: the next marker starts in the two bytes read
+            f.seek(-2, 1)
+            continue
+        length = struct.unpack('>H', header[2:])[0] - 2
+        if length < 0 or f.tell() + length > size:
+            # A malformed header: a negative length would read the whole
+            # file, and what follows a wrong one is not a marker
+            break
+        if marker == 0xE1 or marker == 0xFE:
+            data = f.read(length)
+            if marker == 0xFE:
+                fields['comment'] = data.decode('utf-8', 'replace')
+            elif data.startswith(b'Exif\0\0'):
+                fields['exif'] = read_exif(data[6:])
+            elif data.startswith(b'http://ns.adobe.com/xap/1.0/\0'):
+                fields['xmp'] = data[29:].decode('utf-8', 'replace')
+        elif marker in JPEG_SOF:
+            if length < 5:
+                break
+            _, fields['height'], fields['width'] = struct.unpack('>BHH', f.read(5))
+            # APPn and comment segments come before the frame; the tables
+            # between it and the scan hold no metadata
+            break
+        else:
+            f.seek(length, 1)
+    return fields
+
+
+def read_exif(data):
+    """The ASCII tags of IFD0 of a TIFF-structured EXIF block, by tag number."""
+    tags = {}
+    try:
+        order = '<' if data[:2] == b'II' else '>'
+        offset = struct.unpack(order + 'I', data[4:8])[0]
+        count = struct.unpack(order + 'H', data[offset:offset + 2])[0]
+        for i in range(count):
+            entry = data[offset + 2 + 12 * i:offset + 14 + 12 * i]
+            tag, kind, length = struct.unpack(order + 'HHI', entry[:8])
+            if kind != 2:  # ASCII
+                continue
+            value = entry[8:8 + length] if length <= 4 else \
+                data[struct.unpack(order + 'I', entry[8:])[0]:][:length]
+            tags[tag] = value.rstrip(b'\0').decode('utf-8', 'replace')
+    except (struct.error, IndexError):
+        pass
+    return tags
+
+
+def read_metadata(path):
+    """Header fields of the PNG or JPEG at path, or None for other files."""
+    with open(path, 'rb') as f:
+        head = f.read(8)
+        f.seek(0)
+        if head == PNG_SIGNATURE:
+            return read_png(f)
+        if head[:2] == b'\xff\xd8':
+            return read_jpeg(f)
+    return None
+
+
+def describe(fields):
+    """(prompt, job ID, author) from the fields of read_metadata() or info_fields()."""
+    text = fields.get('text', {})
+    exif = fields.get('exif', {})
+    xmp = fields.get('xmp') or text.get('XML:com.adobe.xmp', '')
+    description = text.get('Description') or fields.get('comment') or exif.get(EXIF_DESCRIPTION)
+    if not description and xmp:
+        match = XMP_DESCRIPTION_RE.search(xmp)
+        description = match and unescape_xml(match.group(1))
+    author = text.get('Author') or exif.get(EXIF_ARTIST)
+    if not author and xmp:
+        match = XMP_CREATOR_RE.search(xmp)
+        author = match and unescape_xml(match.group(1))
+
+    job_id = None
+    prompt = description or None
+    if description:
+        match = JOB_ID_RE.search(description)
+        if match:
+            job_id = match.group(1).lower()
+            prompt = description[:match.start()].strip()
+    if not job_id and xmp:
+        match = XMP_JOB_ID_RE.search(xmp)
+        job_id = match and match.group(1).lower()
+    return prompt, job_id, author
+
+
+def unescape_xml(text):
+    return (text.replace('&lt;', '<').replace('&gt;', '>').replace('&quot;', '"')
+            .replace('&apos;', "'").replace('&amp;', '&'))
+
+
+def info_fields(info):
+    """read_metadata() fields from the info dict of an opened or resized Pillow image."""
+    fields = {'text': {key: value for key, value in info.items() if isinstance(value, str)}}
+    if isinstance(info.get('comment'), bytes):
+        fields['comment'] = info['comment'].decode('utf-8', 'replace')
+    if isinstance(info.get('xmp'), bytes):
+        fields['xmp'] = info['xmp'].decode('utf-8', 'replace')
+    if isinstance(info.get('exif'), bytes):
+        exif = info['exif']
+        fields['exif'] = read_exif(exif[6:] if exif.startswith(b'Exif\0\0') else exif)
+    return fields
+
+
+def output_metadata(info, format):
+    """
+    save() options that carry the prompt metadata of a source (the info dict
+    Pillow copies onto every resized image) into an output of format. PNG
+    outputs get the text chunks, JPEG and WebP outputs the EXIF, with the
+    prompt in ImageDescription when it is not there yet; JPEGs also get the
+    full prompt as a UTF-8 comment, since EXIF text is ASCII.
+    """
+    fields = info_fields(info)
+    prompt, job_id, author = describe(fields)
+    if not prompt and not job_id:
+        return {}
+    description = fields['text'].get('Description') or \
+        (f"{prompt} Job ID: {job_id}" if job_id else prompt)
+    if format == 'PNG':
+        from PIL import PngImagePlugin
+        pnginfo = PngImagePlugin.PngInfo()
+        text = dict(fields['text'])
+        text.setdefault('Description', description)
+        if author:
+            text.setdefault('Author', author)
+        for key, value in text.items():
+            try:
+                value.encode('latin-1')
+                pnginfo.add_text(key, value)
+            except UnicodeEncodeError:
+                pnginfo.add_itxt(key, value)
+        return {'pnginfo': pnginfo}
+    if format in ('JPEG', 'WEBP'):
+        from PIL import Image
+        exif = Image.Exif()
+        if isinstance(info.get('exif'), bytes):
+            exif.load(info['exif'])
+        if EXIF_DESCRIPTION not in exif:
+            exif[EXIF_DESCRIPTION] = description
+        if author and EXIF_ARTIST not in exif:
+            exif[EXIF_ARTIST] = author
+        params = {'exif': exif.tobytes()}
+        if format == 'JPEG':
+            params['comment'] = description.encode('utf-8')
+        return params
+    return {}
+
+
+def row_for(path, kind, fields, size=None, mtime_ns=None):
+    """An images row for fields from read_metadata() or info_fields()."""
+    from promptParser import load_grammar
+    prompt, job_id, author = describe(fields)
+    params = json.dumps(load_grammar().parse(prompt).params) if prompt else None
+    return (path, kind, size, mtime_ns, fields.get('format'), fields.get('width'), fields.get('height'),
+            job_id, prompt, params, author)
+
+
+class Catalog:
+    def __init__(self, path):
+        self.path = path
+        # Several worker processes share the file, as with the manifest
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    def add_rows(self, rows):
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def record_outputs(self, paths, info=None, fields=None):
+        """
+        Catalog the outputs written from an image with Pillow info dict info,
+        or from a source whose read_metadata() fields are given instead (for
+        outputs that are copies of it). Format and dimensions come from each
+        output's header.
+        """
+        rows = []
+        for path in paths:
+            fields = dict(fields) if fields is not None else info_fields(info or {})
+            header = None
+            if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS:
+                header = read_metadata(path)
+            if header:
+                fields.update(format=header['format'], width=header.get('width'), height=header.get('height'))
+            else:
+                fields['format'] = os.path.splitext(path)[1].lstrip('.').upper()
+            rows.append(row_for(os.path.abspath(path), 'output', fields))
+        self.add_rows(rows)
+
+    def scan(self, folder):
+        """
+        Catalog the PNG and JPEG files under folder that are new or changed
+        since the last scan. Returns (files seen, files read).
+        """
+        known = {path: (size, mtime_ns) for path, size, mtime_ns in
+                 self.db.execute("SELECT path, size, mtime_ns FROM images WHERE kind = 'source'")}
+        seen = 0
+        rows = []
+        read = 0
+        for entry in scan_files(folder):
+            seen += 1
+            st = entry.stat()
+            path = os.path.abspath(entry.path)
+            if known.get(path) == (st.st_size, st.st_mtime_ns):
+                continue
+            try:
+                fields = read_metadata(entry.path)
+            except (OSError, struct.error) as e:
+                print(f"Error reading {entry.path}: {e}")
+                continue
+            if fields is None:
+                continue
+            rows.append(row_for(path, 'source', fields, st.st_size, st.st_mtime_ns))
+            read += 1
+            if len(rows) >= BATCH_SIZE:
+                self.add_rows(rows)
+                rows = []
+        self.add_rows(rows)
+        return seen, read
+
+    def find(self, text=None, job_id=None, path=None, limit=50):
+        """Rows matching a prompt substring, a job ID or an output/source path."""
+        if job_id:
+            where, args = "job_id = ?", [job_id.lower()]
+        elif path:
+            # Everything with the job ID of that file, or the file alone
+            where = "job_id = (SELECT job_id FROM images WHERE path = ?) OR path = ?"
+            args = [os.path.abspath(path)] * 2
+        else:
+            where, args = "prompt LIKE ?", [f"%{text or ''}%"]
+        return self.db.execute(
+            f"SELECT path, kind, width, height, job_id, prompt FROM images WHERE {where} "
+            f"ORDER BY job_id, kind DESC, path LIMIT ?", args + [limit]).fetchall()
+
+    def close(self):
+        self.db.close()
+
+
+def scan_files(folder):
+    """DirEntries of the PNG and JPEG files under folder."""
+    stack = [folder]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                    yield entry
+
+
+def open_catalog(folder):
+    """Return this process's Catalog for an output folder, opening it on first use."""
+    folder = os.path.abspath(folder)
+    if folder not in _catalogs:
+        _catalogs[folder] = Catalog(os.path.join(folder, CATALOG_NAME))
+    return _catalogs[folder]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Catalog the prompt metadata embedded in images.')
+    parser.add_argument('catalog', help=f'SQLite catalog file (the resize scripts write {CATALOG_NAME} '
+                                        'in their output folder)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    scan = commands.add_parser('scan', help='Read the metadata of the PNG and JPEG files under folders')
+    scan.add_argument('folders', nargs='+')
+    find = commands.add_parser('find', help='Look up images by prompt text, job ID or file')
+    find.add_argument('text', nargs='?', help='Text that appears in the prompt')
+    find.add_argument('--job', help='Midjourney job ID')
+    find.add_argument('--file', help='Find everything with the job ID of this file')
+    find.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args()
+
+    catalog = Catalog(args.catalog)
+    try:
+        if args.command == 'scan':
+            for folder in args.folders:
+                if not os.path.isdir(folder):
+                    print(f"Error: Folder '{folder}' does not exist.")
+                    sys.exit(1)
+                started = time.perf_counter()
+                seen, read = catalog.scan(folder)
+                seconds = time.perf_counter() - started
+                print(f"{folder}: {seen} images, {read} new or changed, in {seconds:.2f}s "
+                      f"({seen / seconds if seconds else 0:,.0f} files/s)")
+        else:
+            for path, kind, width, height, job_id, prompt in catalog.find(args.text, args.job, args.file,
+                                                                         args.limit):
+                dimensions = f"{width}x{height}" if width else '-'
+                print(f"{kind:6} {dimensions} {job_id or '-'} {path}\n       {prompt or ''}")
+    finally:
+        catalog.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Expands a base prompt into a grid of parameter variations.
+
+The last example_prompts in info/profileMoodboards.txt are a grid written by
+hand: the same text with different --p code combinations. Here the base
+prompt is given once, with axes for the parameters to vary:
+
+    --p        personalization code sets ("l2vlr4v xzmzxdw"; "none" for no --p)
+    --stylize  values or start:stop:step ranges
+    --sw       style weights (the base prompt needs an --sref)
+    --ar       aspect ratios
+    --raw      off, on or both for --style raw
+
+Axis values are put in canonical form and de-duplicated before expanding:
+code sets are sorted ("b a" is the same set as "a b"), aspect ratios are
+reduced (32:18 is 16:9). Distinct values on every axis make every point of
+the grid a distinct prompt, so no set of seen prompts is kept. Every value is
+checked with promptParser before anything is written.
+
+The grid is generated lazily. The full product is streamed point by point;
+--sample N picks N distinct points at random and --lhs N picks a Latin
+hypercube subset, in which every value of every axis occurs equally often.
+Both decode a point's number into one value per axis instead of building the
+product, so a grid of 10^6 or more points is never held in memory.
+
+Usage:
+    python promptGrid.py "An abstract piece of air --ar 16:9 --stylize 50" \\
+        --p "l2vlr4v xzmzxdw 8h3cnwa" --p "dg84cpz d1a6wbq" --p none \\
+        --stylize 0:1000:250 --raw both --out grid.jsonl
+    python promptGrid.py "..." --p ... --stylize 0:1000:10 --lhs 200 --seed 7 --out subset.txt
+"""
+
+import sys
+import json
+import math
+import random
+import argparse
+from promptParser import load_grammar
+
+# Axis name -> canonical parameter name, in the order the axes are written
+AXES = {
+    'ar': 'aspect_ratio',
+    'raw': 'raw_mode',
+    'p': 'personalization',
+    'sw': 'style_weight',
+    'stylize': 'stylize',
+}
+
+
+class GridError(Exception):
+    pass
+
+
+def parse_numbers(values):
+    """['50', '0:1000:250'] -> [50, 0, 250, 500, 750, 1000]"""
+    numbers = []
+    for value in values:
+        if ':' in value:
+            start, stop, step = (int(part) for part in value.split(':'))
+            if step <= 0:
+                raise GridError(f"step of '{value}' must be positive")
+            numbers.extend(range(start, stop + 1, step))
+        else:
+            numbers.append(int(value))
+    return numbers
+
+
+def reduce_ratio(value):
+    """'32:18' -> '16:9'"""
+    width, _, height = value.partition(':')
+    if not (width.isdigit() and height.isdigit()):
+        return value
+    divisor = math.gcd(int(width), int(height)) or 1
+    return f"{int(width) // divisor}:{int(height) // divisor}"
+
+
+def unique(values):
+    """values without repeats, in their first order"""
+    return list(dict.fromkeys(values))
+
+
+class Grid:
+    """
+    A base prompt with one list of parameter strings per axis, e.g.
+    [('--ar 16:9', '--ar 2:3'), ('', '--style raw')]. A point of the grid is
+    one index per axis.
+    """
+
+    def __init__(self, base, axes):
+        self.grammar = load_grammar()
+        self.text, self.fixed = self.split_base(base, {AXES[name] for name in axes})
+        self.names = list(axes)
+        self.values = [axes[name] for name in self.names]
+        self.size = math.prod(len(values) for values in self.values)
+
+    def split_base(self, base, varied):
+        """The prompt text and the parameters of base that no axis varies."""
+        parsed = self.grammar.parse(base)
+        if parsed.errors:
+            raise GridError('base prompt: ' + '; '.join(message for code, message in parsed.errors))
+        start = base.find('--')
+        if start < 0:
+            return base.strip(), []
+        fixed = []
+        for group in base[start + 2:].split(' --'):
+            name = self.grammar.parse_group(group)[0]
+            if name not in varied:
+                fixed.append('--' + group.strip())
+        if 'style_weight' in varied and 'style_reference' not in parsed.params:
+            raise GridError('--sw only has an effect with an --sref in the base prompt')
+        return base[:start].strip(), fixed
+
+    def prompt(self, point):
+        """The prompt string at point (one index per axis)."""
+        parts = [self.text] + self.fixed
+        for values, index in zip(self.values, point):
+            if values[index]:
+                parts.append(values[index])
+        return ' '.join(parts)
+
+    def point(self, number):
+        """Point number `number` of the product, in itertools.product order."""
+        point = []
+        for values in reversed(self.values):
+            number, index = divmod(number, len(values))
+            point.append(index)
+        return point[::-1]
+
+    def product(self):
+        for number in range(self.size):
+            yield self.prompt(self.point(number))
+
+    def sample(self, count, seed=None):
+        """count distinct points picked uniformly at random."""
+        # range() is sampled without being built, only the picks are stored
+        for number in random.Random(seed).sample(range(self.size), min(count, self.size)):
+            yield self.prompt(self.point(number))
+
+    def latin_hypercube(self, count, seed=None):
+        """
+        count points in which every value of an axis occurs count / len(values)
+        times (rounded), with the axes paired at random. Points that come out
+        twice are only written once.
+        """
+        rng = random.Random(seed)
+        columns = []
+        for values in self.values:
+            strata = list(range(count))
+            rng.shuffle(strata)
+            columns.append([stratum * len(values) // count for stratum in strata])
+        seen = set()
+        for point in zip(*columns):
+            if point not in seen:
+                seen.add(point)
+                yield self.prompt(point)
+
+
+def build_axes(args, grammar):
+    """Canonical, de-duplicated parameter strings per axis from the command line."""
+    axes = {}
+    if args.ar:
+        axes['ar'] = [f"--ar {ratio}" for ratio in unique(reduce_ratio(value) for value in args.ar)]
+    if args.raw != 'off':
+        axes['raw'] = {'on': ['--style raw'], 'both': ['', '--style raw']}[args.raw]
+    if args.p:
+        code_sets = unique(tuple(sorted(set(value.split()))) if value.lower() != 'none' else ()
+                           for value in args.p)
+        axes['p'] = [f"--p {' '.join(codes)}" if codes else '' for codes in code_sets]
+    if args.sw:
+        axes['sw'] = [f"--sw {value}" for value in unique(parse_numbers(args.sw))]
+    if args.stylize:
+        axes['stylize'] = [f"--stylize {value}" for value in unique(parse_numbers(args.stylize))]
+
+    # Check each value on its own; combining valid values keeps them valid
+    for name, values in axes.items():
+        for value in values:
+            if value:
+                errors = grammar.parse_group(value[2:])[3]
+                if errors:
+                    raise GridError('; '.join(message for code, message in errors))
+    return {name: axes[name] for name in AXES if name in axes}
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {value}")
+    return number
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Expand a base prompt into a grid of parameter variations.')
+    parser.add_argument('base', help='Base prompt; parameters that an axis varies are replaced')
+    parser.add_argument('--p', action='append', metavar='CODES',
+                        help='Personalization code set, space separated, or "none" (repeatable)')
+    parser.add_argument('--stylize', nargs='+', metavar='N', help='Stylize values or start:stop:step ranges')
+    parser.add_argument('--sw', nargs='+', metavar='N', help='Style weight values or start:stop:step ranges')
+    parser.add_argument('--ar', nargs='+', metavar='W:H', help='Aspect ratios')
+    parser.add_argument('--raw', choices=('off', 'on', 'both'), default='off', help='--style raw (default: off)')
+    subset = parser.add_mutually_exclusive_group()
+    subset.add_argument('--sample', type=positive_int, metavar='N', help='N distinct points picked at random')
+    subset.add_argument('--lhs', type=positive_int, metavar='N', help='N points of a Latin hypercube')
+    parser.add_argument('--seed', type=int, help='Seed for --sample and --lhs')
+    parser.add_argument('--out', help='Output file, JSONL if it ends in .jsonl (default: stdout)')
+    parser.add_argument('--count', action='store_true', help='Only print the size of the grid')
+    args = parser.parse_args()
+
+    try:
+        grid = Grid(args.base, build_axes(args, load_grammar()))
+    except (GridError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    axes = ' x '.join(f"{name} ({len(values)})" for name, values in zip(grid.names, grid.values))
+    print(f"Grid: {axes or 'no axes'} = {grid.size} prompts", file=sys.stderr)
+    if args.count:
+        return
+
+    if args.sample is not None:
+        prompts = grid.sample(args.sample, args.seed)
+    elif args.lhs is not None:
+        prompts = grid.latin_hypercube(args.lhs, args.seed)
+    else:
+        prompts = grid.product()
+    as_json = bool(args.out and args.out.endswith('.jsonl'))
+    out = open(args.out, 'w', encoding='utf-8') if args.out else sys.stdout
+    written = 0
+    try:
+        for prompt in prompts:
+            out.write((json.dumps({'prompt': prompt}, ensure_ascii=False) if as_json else prompt) + '\n')
+            written += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"Wrote {written} prompts", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
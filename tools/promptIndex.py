@@ -0,0 +1,315 @@
+"""
+Searchable on-disk index of prompt history.
+
+The index is a SQLite file. Every prompt is parsed with promptParser and
+stored once (keyed by a digest of the prompt string), together with:
+
+    terms     inverted postings: each lower-cased word of the prompt text
+    profiles  each --p / --profile code
+    refs      each --sref and --cref URL or code, and the image prompt URLs
+    prompts   the aspect ratio and the effective --stylize (the guide's
+              default when the prompt leaves it out), both indexed
+
+A search is one SQL query. The most selective posting list asked for (a
+profile code or URL, else the rarest word, by the per-word prompt counts in
+term_counts) is read newest first; the other words, codes and URLs are
+probed by primary key and the aspect ratio and stylize checked on the
+prompt row, until `limit` matches are found. A query like "profile l2vlr4v
+with --ar 16:9" therefore reads about as many rows as it returns.
+
+Adding is incremental. Prompts already in the index are skipped, and for
+each file added the byte offset that was reached is remembered, so adding an
+append-only log again only reads the lines written since.
+
+Usage:
+    python promptIndex.py history.sqlite add prompts.jsonl more_prompts.txt
+    python promptIndex.py history.sqlite add --examples
+    python promptIndex.py history.sqlite search --p l2vlr4v --ar 16:9
+    python promptIndex.py history.sqlite search whale ocean --stylize 0:100 --limit 5
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+from collections import Counter
+from promptParser import load_grammar, prompt_from_line, GRAMMAR_PATH
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prompts (
+    id INTEGER PRIMARY KEY,
+    digest BLOB NOT NULL UNIQUE,
+    prompt TEXT NOT NULL,
+    aspect_ratio TEXT,
+    stylize INTEGER,
+    added REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS prompts_aspect_ratio ON prompts (aspect_ratio);
+CREATE INDEX IF NOT EXISTS prompts_stylize ON prompts (stylize);
+CREATE TABLE IF NOT EXISTS terms (
+    term TEXT NOT NULL,
+    prompt_id INTEGER NOT NULL,
+    PRIMARY KEY (term, prompt_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS term_counts (
+    term TEXT PRIMARY KEY,
+    prompts INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS profiles (
+    code TEXT NOT NULL,
+    prompt_id INTEGER NOT NULL,
+    PRIMARY KEY (code, prompt_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS refs (
+    kind TEXT NOT NULL,
+    url TEXT NOT NULL,
+    prompt_id INTEGER NOT NULL,
+    PRIMARY KEY (kind, url, prompt_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    offset INTEGER NOT NULL
+);
+"""
+
+TERM_RE = re.compile(r"[0-9a-z]+")
+
+# Reference kinds in the refs table, by the parameter they come from
+REF_KINDS = {'style_reference': 'sref', 'character_reference': 'cref'}
+
+# Prompts inserted per transaction while adding a file
+BATCH_SIZE = 5000
+
+
+def prompt_digest(prompt):
+    return hashlib.blake2b(prompt.encode('utf-8'), digest_size=16).digest()
+
+
+def strip_weight(value):
+    """'URL::2' -> 'URL'; weights do not change which reference is used."""
+    return value.split('::', 1)[0]
+
+
+class PromptIndex:
+    def __init__(self, path, grammar_path=GRAMMAR_PATH):
+        self.path = path
+        self.grammar = load_grammar(grammar_path)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def add_prompts(self, prompts):
+        """Add an iterable of prompt strings; returns how many were new."""
+        added = 0
+        batch = []
+        for prompt in prompts:
+            batch.append(prompt)
+            if len(batch) >= BATCH_SIZE:
+                added += self._add_batch(batch)
+                batch = []
+        if batch:
+            added += self._add_batch(batch)
+        return added
+
+    def _add_batch(self, prompts):
+        added = 0
+        now = time.time()
+        term_counts = Counter()
+        with self.db:
+            for prompt in prompts:
+                prompt = prompt.strip()
+                if not prompt:
+                    continue
+                parsed = self.grammar.parse(prompt)
+                params = parsed.params
+                stylize = params.get('stylize')
+                if not isinstance(stylize, int):
+                    stylize = self.grammar.defaults['stylize']
+                cursor = self.db.execute(
+                    "INSERT OR IGNORE INTO prompts (digest, prompt, aspect_ratio, stylize, added) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (prompt_digest(prompt), prompt, params.get('aspect_ratio'), stylize, now)
+                )
+                if not cursor.rowcount:
+                    continue
+                prompt_id = cursor.lastrowid
+                added += 1
+                terms = set(TERM_RE.findall(parsed.text.lower()))
+                self.db.executemany("INSERT OR IGNORE INTO terms VALUES (?, ?)",
+                                    [(term, prompt_id) for term in terms])
+                term_counts.update(terms)
+                if isinstance(params.get('personalization'), list):
+                    self.db.executemany("INSERT OR IGNORE INTO profiles VALUES (?, ?)",
+                                        [(strip_weight(code), prompt_id) for code in params['personalization']])
+                refs = [('image', url, prompt_id) for url in parsed.image_urls]
+                for name, kind in REF_KINDS.items():
+                    if isinstance(params.get(name), list):
+                        refs += [(kind, strip_weight(url), prompt_id) for url in params[name]]
+                self.db.executemany("INSERT OR IGNORE INTO refs VALUES (?, ?, ?)", refs)
+            self.db.executemany("INSERT INTO term_counts VALUES (?, ?) "
+                                "ON CONFLICT (term) DO UPDATE SET prompts = prompts + excluded.prompts",
+                                term_counts.items())
+        return added
+
+    def add_file(self, path, field='prompt'):
+        """
+        Add the prompts of a JSONL file (objects with `field`, or JSON strings)
+        or a text file with one prompt per line, starting where the previous
+        add of the same file stopped. Returns how many prompts were new.
+        """
+        key = os.path.abspath(path)
+        row = self.db.execute("SELECT offset FROM sources WHERE path = ?", (key,)).fetchone()
+        offset = row[0] if row else 0
+        size = os.path.getsize(path)
+        if offset > size:
+            # The file was truncated or replaced; read it from the start
+            offset = 0
+
+        def read_prompts(f):
+            nonlocal offset
+            for line in f:
+                if not line.endswith(b'\n') and os.path.getsize(path) != size:
+                    # A last line without a newline is complete, unless the
+                    # file grew while it was read: then it is still being
+                    # written and picked up by the next add
+                    break
+                offset += len(line)
+                stripped = line.strip()
+                if stripped[:1] in (b'{', b'"'):
+                    try:
+                        yield prompt_from_line(stripped, field)
+                    except ValueError:
+                        continue
+                elif stripped:
+                    yield stripped.decode('utf-8', 'replace')
+
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            added = self.add_prompts(read_prompts(f))
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO sources VALUES (?, ?)", (key, offset))
+        return added
+
+    def search(self, terms=(), profiles=(), srefs=(), crefs=(), images=(), aspect_ratio=None,
+               stylize=None, limit=50):
+        """
+        Return (id, prompt) of the newest prompts that match every condition.
+        stylize is an inclusive (low, high) range.
+        """
+        # Each posting is (table, key columns, key values). The most selective
+        # one drives the query: its entries are read newest first, the others
+        # are probed by primary key, and reading stops after `limit` matches.
+        postings = []
+        words = {word for term in terms for word in TERM_RE.findall(term.lower())}
+        for word in sorted(words, key=self.term_count):
+            postings.append(('terms', ('term',), (word,)))
+        # Codes and references are far more selective than words
+        for kind, urls in (('image', images), ('cref', crefs), ('sref', srefs)):
+            for url in urls:
+                postings.insert(0, ('refs', ('kind', 'url'), (kind, strip_weight(url))))
+        for code in profiles:
+            postings.insert(0, ('profiles', ('code',), (code,)))
+
+        conditions = []
+        args = []
+        for table, columns, values in postings[1:]:
+            keys = ' AND '.join(f"{column} = ?" for column in columns)
+            conditions.append(f"EXISTS (SELECT 1 FROM {table} WHERE {keys} AND prompt_id = p.id)")
+            args += values
+        if aspect_ratio:
+            conditions.append("p.aspect_ratio = ?")
+            args.append(aspect_ratio)
+        if stylize:
+            conditions.append("p.stylize BETWEEN ? AND ?")
+            args += list(stylize)
+
+        if postings:
+            table, columns, values = postings[0]
+            keys = ' AND '.join(f"d.{column} = ?" for column in columns)
+            where = ' AND '.join([keys] + conditions)
+            sql = (f"SELECT p.id, p.prompt FROM {table} d JOIN prompts p ON p.id = d.prompt_id "
+                   f"WHERE {where} ORDER BY d.prompt_id DESC LIMIT ?")
+            args = list(values) + args
+        else:
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            sql = f"SELECT p.id, p.prompt FROM prompts p {where} ORDER BY p.id DESC LIMIT ?"
+        return self.db.execute(sql, args + [limit]).fetchall()
+
+    def term_count(self, term):
+        row = self.db.execute("SELECT prompts FROM term_counts WHERE term = ?", (term,)).fetchone()
+        return row[0] if row else 0
+
+    def count(self):
+        return self.db.execute("SELECT COUNT(*) FROM prompts").fetchone()[0]
+
+    def close(self):
+        self.db.close()
+
+
+def parse_stylize_range(text):
+    """'50:200' -> (50, 200); '50' -> (50, 50)"""
+    low, _, high = text.partition(':')
+    return int(low), int(high or low)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index prompt history and search it.')
+    parser.add_argument('index', help='SQLite index file (created if missing)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add = commands.add_parser('add', help='Add the prompts of JSONL or text files')
+    add.add_argument('files', nargs='*', help='JSONL files or text files with one prompt per line')
+    add.add_argument('--field', default='prompt', help='Prompt field of the JSONL objects (default: prompt)')
+    add.add_argument('--examples', action='store_true',
+                     help='Also add the example_prompts of info/profileMoodboards.txt')
+
+    search = commands.add_parser('search', help='Find prompts by words, profile codes, references, --ar and --stylize')
+    search.add_argument('terms', nargs='*', help='Words that must all appear in the prompt text')
+    search.add_argument('--p', '--profile', dest='profiles', action='append', default=[], metavar='CODE',
+                        help='Personalization code (repeatable)')
+    search.add_argument('--sref', dest='srefs', action='append', default=[], metavar='URL',
+                        help='Style reference URL or code (repeatable)')
+    search.add_argument('--cref', dest='crefs', action='append', default=[], metavar='URL',
+                        help='Character reference URL (repeatable)')
+    search.add_argument('--image', dest='images', action='append', default=[], metavar='URL',
+                        help='Image prompt URL (repeatable)')
+    search.add_argument('--ar', dest='aspect_ratio', help='Aspect ratio, e.g. 16:9')
+    search.add_argument('--stylize', type=parse_stylize_range, metavar='LOW:HIGH',
+                        help='Inclusive --stylize range; prompts without --stylize count as the default')
+    search.add_argument('--limit', type=int, default=20, help='Newest N matches to print (default: 20)')
+    args = parser.parse_args()
+
+    index = PromptIndex(args.index)
+    try:
+        if args.command == 'add':
+            started = time.perf_counter()
+            total = 0
+            if args.examples:
+                with open(GRAMMAR_PATH, encoding='utf-8') as f:
+                    examples = [example['prompt'] for example in json.load(f)['example_prompts']]
+                total += index.add_prompts(examples)
+            for path in args.files:
+                added = index.add_file(path, args.field)
+                print(f"{path}: {added} new prompts")
+                total += added
+            print(f"Added {total} prompts in {time.perf_counter() - started:.2f}s; "
+                  f"{index.count()} in the index")
+        else:
+            started = time.perf_counter()
+            rows = index.search(args.terms, args.profiles, args.srefs, args.crefs, args.images,
+                                args.aspect_ratio, args.stylize, args.limit)
+            seconds = time.perf_counter() - started
+            for prompt_id, prompt in rows:
+                print(f"{prompt_id}: {prompt}")
+            print(f"\n{len(rows)} matches in {seconds * 1000:.1f} ms", file=sys.stderr)
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
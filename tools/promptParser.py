@@ -0,0 +1,512 @@
+"""
+Parses and validates Midjourney prompts against the grammar in
+info/profileMoodboards.txt.
+
+The parameter names and their aliases come from the `controller` section,
+together with the ranges and values the guide gives: --stylize 0 to 1000,
+the --q values per model version, --sw from StyleReference, --sv and --cw
+from the reference sections. What the guide only says in prose (that --ar
+takes two whole numbers, that --seed is an integer, ...) is in VALUE_KINDS
+below. The tables are built once, so parsing a prompt is splitting off the
+image URLs at its start, a find() for the first '--' that starts a word, a
+split() of the parameter part and a dict lookup per parameter. A '--' inside
+a word is text ("well--known", or a short link like https://s.mj.run/ab--cd),
+unless a parameter name follows it ("poppies--ar").
+
+A parsed prompt has the prompt text, the image URLs at its start, the
+parameters by canonical name (aspect_ratio, stylize, personalization, ...)
+and a list of (code, message) errors for everything the usage_tips and the
+parameter ranges rule out:
+
+    no-space-before-dashes   "poppies--ar 2:3"
+    space-in-dashes          "poppies - - ar 2:3", "poppies -- ar 2:3"
+    text-after-parameters    "California --ar 2:3 poppies"
+    punctuation              "poppies --ar 2:3,"
+    unknown-parameter, duplicate-parameter, invalid-value, out-of-range
+
+Run on a JSONL file (one {"prompt": ...} object or JSON string per line) it
+lints the whole file, in several processes with --workers, and prints the
+invalid prompts and a summary. The exit status is 1 if any prompt is invalid.
+
+Usage:
+    python promptParser.py "vibrant California poppies --ar 2:3,"
+    python promptParser.py --jsonl prompts.jsonl --workers 8 --report errors.jsonl
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import itertools
+from collections import Counter
+from functools import lru_cache
+
+GRAMMAR_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            'info', 'profileMoodboards.txt')
+
+# The kind of value each parameter takes, by canonical name. A range of None
+# is read from the guide. Parameters that are not listed take no value.
+VALUE_KINDS = {
+    'aspect_ratio': ('ratio',),
+    'chaos': ('number', 0, 100, int),
+    'character_reference': ('urls',),
+    'character_weight': ('number', None, None, int),
+    'image_weight': ('number', 0, 3, float),
+    'niji': ('version',),
+    'no': ('words',),
+    'personalization': ('codes',),
+    'quality': ('quality',),
+    'repeat': ('number', 1, 40, int),
+    'seed': ('number', 0, 4294967295, int),
+    'stop': ('number', 10, 100, int),
+    'style_reference': ('srefs',),
+    'style_version': ('choice',),
+    'style_weight': ('number', None, None, int),
+    'stylize': ('number', None, None, int),
+    'version': ('version',),
+    'weird': ('number', 0, 3000, int),
+}
+
+# Characters that may not end a parameter value
+PUNCTUATION = ',.;!?'
+
+RATIO_RE = re.compile(r'(\d+):(\d+)$')
+# A parameter written with spaces between or after the dashes, e.g. "- - ar"
+SPACED_DASHES_RE = re.compile(r'(?:^|\s)-\s+-\s*[a-z]+|(?:^|\s)--\s+[a-z]+', re.IGNORECASE)
+# --sref and --p entries may carry a weight: URL::2, code::-0.5
+WEIGHT_RE = re.compile(r'::-?\d+(?:\.\d+)?$')
+
+# Parsed parameter groups ('ar 16:9', 'stylize 50') kept per process; a log
+# repeats the same few groups, so most prompts never reach parse_value()
+GROUP_CACHE_SIZE = 100000
+
+
+def parse_range(text):
+    """'0 to 1000' -> (0, 1000)"""
+    low, high = re.match(r'\s*(-?[\d.]+)\s+to\s+(-?[\d.]+)', text).groups()
+    return float(low), float(high)
+
+
+def parse_number(value, type):
+    try:
+        return type(value)
+    except ValueError:
+        return None
+
+
+class Grammar:
+    """Lookup tables built from the guide's JSON, see load_grammar()."""
+
+    def __init__(self, guide):
+        controller = guide['controller']['parameters']
+        # alias ('ar') -> canonical name ('aspect_ratio'); aliases with a fixed
+        # value ('--style raw') map (name, value) -> canonical name
+        self.aliases = {}
+        self.fixed_values = {}
+        for name, spec in controller.items():
+            for alias in spec.get('parameters', ()):
+                alias = alias.lstrip('-')
+                if ' ' in alias:
+                    alias, value = alias.split(None, 1)
+                    self.fixed_values[alias, value] = name
+                else:
+                    self.aliases[alias] = name
+
+        style = guide['StyleReference']['details']
+        self.aliases[style['StyleWeight']['Parameter'].lstrip('-')] = 'style_weight'
+        self.aliases[style['StyleReferenceVersions']['Parameter'].lstrip('-')] = 'style_version'
+        character_weights = guide['CharacterReference']['details']['CharacterWeight']['options']
+        self.aliases[next(iter(character_weights)).split()[0].lstrip('-')] = 'character_weight'
+
+        self.ranges = {
+            'stylize': parse_range(controller['stylize']['details']['range']),
+            'style_weight': parse_range(style['StyleWeight']['Range']),
+            'character_weight': tuple(sorted(float(option.split()[1]) for option in character_weights)),
+        }
+        # Values a prompt gets when it leaves the parameter out
+        self.defaults = {
+            'stylize': controller['stylize']['details']['default_value'],
+        }
+        self.choices = {
+            'style_version': {option.split()[1] for option in style['StyleReferenceVersions']['Versions']},
+        }
+
+        # 'version_6.1' -> ['6.1'], 'versions_6_5.2_niji_5' -> ['6', '5.2', 'niji 5']
+        self.quality_values = {}
+        available = controller['quality']['details']['default_and_available_options']['available_values']
+        for key, values in available.items():
+            parts = key.split('_')[1:]
+            i = 0
+            while i < len(parts):
+                if parts[i] == 'niji':
+                    self.quality_values[f"niji {parts[i + 1]}"] = set(values)
+                    i += 2
+                else:
+                    self.quality_values[parts[i]] = set(values)
+                    i += 1
+        self.all_quality_values = set().union(*self.quality_values.values())
+
+        # Names that start a parameter: 'ar', 'style' (of '--style raw'), ...
+        self.names = set(self.aliases) | {alias for alias, _ in self.fixed_values}
+        self.kinds = {name: VALUE_KINDS.get(name, ('flag',))
+                      for name in set(self.aliases.values()) | set(self.fixed_values.values())}
+        self.group_cache = {}
+
+    def parse(self, prompt):
+        """Parse one prompt string into a ParsedPrompt."""
+        errors = []
+        prompt = prompt.strip()
+        # Image URLs come first; they may contain '--' themselves
+        image_urls = []
+        while prompt.startswith(('https://', 'http://')):
+            end = prompt.find(' ')
+            if end < 0:
+                image_urls.append(prompt)
+                prompt = ''
+                break
+            image_urls.append(prompt[:end])
+            prompt = prompt[end:].lstrip()
+
+        start = prompt.find('--')
+        while start > 0 and not prompt[start - 1].isspace():
+            if self.starts_parameter(prompt[start + 2:]):
+                errors.append(('no-space-before-dashes', f"no space before '{prompt[start:start + 6]}'"))
+                break
+            # Part of a word
+            start = prompt.find('--', start + 2)
+        if start < 0:
+            text, tail = prompt, ''
+        else:
+            text, tail = prompt[:start].rstrip(), prompt[start:]
+        if ' -' in text or text.startswith('-'):
+            match = SPACED_DASHES_RE.search(text)
+            if match:
+                errors.append(('space-in-dashes', f"spaces between or after dashes: '{match.group().strip()}'"))
+
+        params = {}
+        if tail:
+            self.parse_parameters(tail, params, errors)
+        if 'quality' in params:
+            self.check_quality(params, errors)
+        return ParsedPrompt(text, image_urls, params, errors)
+
+    def starts_parameter(self, rest):
+        """Whether rest, the text after a '--', begins with a parameter name."""
+        words = rest.split(None, 1)
+        return bool(words) and not rest[0].isspace() and words[0].lower().rstrip(PUNCTUATION) in self.names
+
+    def parse_parameters(self, tail, params, errors):
+        cache = self.group_cache
+        for group in tail[2:].split(' --'):
+            result = cache.get(group)
+            if result is None:
+                result = self.parse_group(group)
+                if len(cache) >= GROUP_CACHE_SIZE:
+                    cache.clear()
+                cache[group] = result
+            name, written, value, group_errors = result
+            if group_errors:
+                errors.extend(group_errors)
+            if name is None:
+                continue
+            if name in params:
+                errors.append(('duplicate-parameter', f"'--{written}' given twice"))
+            # Cached lists are shared between prompts
+            params[name] = list(value) if type(value) is list else value
+
+    def parse_group(self, group):
+        """
+        Parse one parameter with its values, e.g. 'ar 2:3'. Returns (canonical
+        name or None, name as written, value, errors).
+        """
+        errors = []
+        if group[:1].isspace() or not group:
+            errors.append(('space-in-dashes', "space after '--'"))
+        tokens = group.split()
+        if not tokens:
+            return None, '', None, errors
+        written, values = tokens[0], tokens[1:]
+        alias = written.lower()
+        name = self.aliases.get(alias)
+        if name is None and values:
+            name = self.fixed_values.get((alias, values[0].lower()))
+            if name is not None:
+                values = values[1:]
+        if name is None:
+            stripped = alias.rstrip(PUNCTUATION)
+            if stripped != alias and (stripped in self.aliases or stripped == 'style'):
+                errors.append(('punctuation', f"punctuation in '--{written}'"))
+            elif alias == 'style':
+                errors.append(('invalid-value', f"unknown style '{' '.join(values[:1])}'"))
+            else:
+                errors.append(('unknown-parameter', f"unknown parameter '--{written}'"))
+            return None, written, None, errors
+        return name, written, self.parse_value(name, written, values, errors), errors
+
+    def parse_value(self, name, written, values, errors):
+        kind = self.kinds[name]
+        if kind[0] == 'words':
+            # --no takes a comma separated list; only a trailing comma is wrong
+            if values and values[-1][-1] in PUNCTUATION:
+                errors.append(('punctuation', f"'--{written}' list ends with '{values[-1][-1]}'"))
+            words = [word for word in ' '.join(values).replace(',', ' ').split() if word.strip(PUNCTUATION)]
+            if not words:
+                errors.append(('invalid-value', f"'--{written}' needs a list of words"))
+            return words
+
+        # Every other value is a list of tokens without trailing punctuation
+        for j, value in enumerate(values):
+            if value[-1] in PUNCTUATION:
+                errors.append(('punctuation', f"punctuation in '--{written} {value}'"))
+                values[j] = value.rstrip(PUNCTUATION)
+        values = [value for value in values if value]
+
+        if kind[0] == 'flag':
+            self.check_extra(values, 0, errors)
+            return True
+        if kind[0] in ('urls', 'srefs', 'codes'):
+            count = 0
+            for value in values:
+                if not self.is_list_item(kind[0], value):
+                    break
+                count += 1
+            if count == 0 and kind[0] != 'codes':
+                errors.append(('invalid-value', f"'--{written}' needs a URL" if kind[0] == 'urls'
+                               else f"'--{written}' needs URLs, style codes or 'random'"))
+            self.check_extra(values, count, errors)
+            return values[:count]
+        if kind[0] == 'version':
+            if not values:
+                # --niji on its own picks the current niji model
+                if name != 'niji':
+                    errors.append(('invalid-value', f"'--{written}' needs a version number"))
+                return True
+            self.check_extra(values, 1, errors)
+            if parse_number(values[0], float) is None:
+                errors.append(('invalid-value', f"'--{written} {values[0]}' is not a version number"))
+            return values[0]
+
+        # The rest take exactly one value
+        if not values:
+            errors.append(('invalid-value', f"'--{written}' needs a value"))
+            return None
+        self.check_extra(values, 1, errors)
+        value = values[0]
+        if kind[0] == 'ratio':
+            match = RATIO_RE.match(value)
+            if not match:
+                if '.' in value:
+                    errors.append(('invalid-value', f"'--{written} {value}' cannot contain decimals"))
+                else:
+                    errors.append(('invalid-value', f"'--{written} {value}' is not a ratio like 2:3"))
+            elif match.group(1) == '0' or match.group(2) == '0':
+                errors.append(('out-of-range', f"'--{written} {value}' has a zero side"))
+            return value
+        if kind[0] == 'choice':
+            if value not in self.choices[name]:
+                errors.append(('out-of-range', f"'--{written} {value}' is not one of "
+                                               f"{', '.join(sorted(self.choices[name]))}"))
+            return value
+        if kind[0] == 'quality':
+            number = parse_number(value, float)
+            if number is None:
+                errors.append(('invalid-value', f"'--{written} {value}' is not a number"))
+            elif number not in self.all_quality_values:
+                errors.append(('out-of-range', f"'--{written} {value}' is not one of "
+                                               f"{', '.join(f'{v:g}' for v in sorted(self.all_quality_values))}"))
+            return number
+
+        _, low, high, type = kind
+        if low is None:
+            low, high = self.ranges[name]
+        number = parse_number(value, type)
+        if number is None:
+            errors.append(('invalid-value', f"'--{written} {value}' is not {'a whole' if type is int else 'a'} number"))
+        elif not low <= number <= high:
+            errors.append(('out-of-range', f"'--{written} {value}' is outside {low:g} to {high:g}"))
+        return number
+
+    @staticmethod
+    def is_list_item(kind, value):
+        value = WEIGHT_RE.sub('', value) if '::' in value else value
+        if value.startswith(('https://', 'http://')):
+            return True
+        if kind == 'srefs':
+            return value == 'random' or value.isdigit()
+        if kind == 'codes':
+            return value.isalnum() or (value.startswith('@') and len(value) > 1)
+        return False
+
+    @staticmethod
+    def check_extra(values, count, errors):
+        if len(values) > count:
+            errors.append(('text-after-parameters', f"text after parameters: '{' '.join(values[count:])}'"))
+
+    def check_quality(self, params, errors):
+        """--q only takes the values of the model version it is used with."""
+        if params.get('niji') not in (None, True):
+            version = f"niji {params['niji']}"
+        else:
+            version = params.get('version')
+        allowed = self.quality_values.get(version)
+        if allowed and params['quality'] is not None and params['quality'] in self.all_quality_values \
+                and params['quality'] not in allowed:
+            errors.append(('out-of-range', f"--q {params['quality']:g} is not available with {version} "
+                                           f"(use {', '.join(f'{v:g}' for v in sorted(allowed))})"))
+
+
+class ParsedPrompt:
+    __slots__ = ('text', 'image_urls', 'params', 'errors')
+
+    def __init__(self, text, image_urls, params, errors):
+        self.text = text
+        self.image_urls = image_urls
+        self.params = params
+        self.errors = errors
+
+    @property
+    def valid(self):
+        return not self.errors
+
+    def to_dict(self):
+        return {'text': self.text, 'image_urls': self.image_urls, 'params': self.params,
+                'errors': [list(error) for error in self.errors]}
+
+
+@lru_cache(maxsize=None)
+def load_grammar(path=GRAMMAR_PATH):
+    with open(path, encoding='utf-8') as f:
+        return Grammar(json.load(f))
+
+
+def parse_prompt(prompt, grammar=None):
+    """Parse a prompt string with the grammar from info/profileMoodboards.txt."""
+    return (grammar or load_grammar()).parse(prompt)
+
+
+def prompt_from_line(line, field):
+    """The prompt of one JSONL line: an object with `field`, or a JSON string."""
+    value = json.loads(line)
+    if isinstance(value, dict):
+        value = value.get(field)
+    if not isinstance(value, str):
+        raise ValueError(f"no '{field}' string")
+    return value
+
+
+def lint_lines(first_line, lines, field, grammar_path=GRAMMAR_PATH):
+    """
+    Lint a batch of JSONL lines numbered from first_line. Returns (count,
+    invalid), invalid being a list of (line number, prompt, errors).
+    """
+    grammar = load_grammar(grammar_path)
+    count = 0
+    invalid = []
+    for number, line in enumerate(lines, first_line):
+        if not line.strip():
+            continue
+        count += 1
+        try:
+            prompt = prompt_from_line(line, field)
+        except ValueError as e:
+            invalid.append((number, None, [('unreadable-line', str(e))]))
+            continue
+        errors = grammar.parse(prompt).errors
+        if errors:
+            invalid.append((number, prompt, errors))
+    return count, invalid
+
+
+def batches(f, size):
+    """Yields (first line number, lines) in batches of size lines."""
+    first = 1
+    while True:
+        lines = list(itertools.islice(f, size))
+        if not lines:
+            return
+        yield first, lines
+        first += len(lines)
+
+
+def lint_jsonl(f, field='prompt', workers=1, batch_size=20000, grammar_path=GRAMMAR_PATH):
+    """
+    Lint every line of a binary file object. Yields (count, invalid) per batch
+    in file order; with workers > 1 batches are linted in a process pool with a
+    bounded number of batches in flight.
+    """
+    if workers <= 1:
+        for first, lines in batches(f, batch_size):
+            yield lint_lines(first, lines, field, grammar_path)
+        return
+
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for first, lines in batches(f, batch_size):
+            pending.append(executor.submit(lint_lines, first, lines, field, grammar_path))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parse and validate Midjourney prompts.')
+    parser.add_argument('prompts', nargs='*', help='Prompts to parse; the result is printed as JSON')
+    parser.add_argument('--jsonl', metavar='FILE', help="Lint a JSONL file of prompts ('-' for stdin)")
+    parser.add_argument('--field', default='prompt', help="Prompt field of the JSONL objects (default: prompt)")
+    parser.add_argument('--workers', type=int, default=1, help='Processes to lint with (default: 1)')
+    parser.add_argument('--report', metavar='FILE', help='Write the invalid prompts with their errors as JSONL')
+    parser.add_argument('--show', type=int, default=20, metavar='N',
+                        help='Print the first N invalid prompts (default: 20)')
+    parser.add_argument('--grammar', default=GRAMMAR_PATH, help='Guide JSON with the parameter grammar')
+    args = parser.parse_args()
+
+    if not args.jsonl:
+        if not args.prompts:
+            parser.error('give prompts or --jsonl')
+        grammar = load_grammar(args.grammar)
+        results = [grammar.parse(prompt) for prompt in args.prompts]
+        for result in results:
+            print(json.dumps(result.to_dict(), ensure_ascii=False))
+        sys.exit(0 if all(result.valid for result in results) else 1)
+
+    started = time.perf_counter()
+    total = 0
+    shown = 0
+    codes = Counter()
+    invalid_count = 0
+    report = open(args.report, 'w', encoding='utf-8') if args.report else None
+    f = sys.stdin.buffer if args.jsonl == '-' else open(args.jsonl, 'rb')
+    try:
+        for count, invalid in lint_jsonl(f, args.field, args.workers, grammar_path=args.grammar):
+            total += count
+            invalid_count += len(invalid)
+            for number, prompt, errors in invalid:
+                codes.update(code for code, message in errors)
+                if shown < args.show:
+                    print(f"line {number}: " + '; '.join(message for code, message in errors))
+                    shown += 1
+                if report:
+                    report.write(json.dumps({'line': number, 'prompt': prompt,
+                                             'errors': [list(error) for error in errors]},
+                                            ensure_ascii=False) + '\n')
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+        if report:
+            report.close()
+
+    seconds = time.perf_counter() - started
+    print(f"\n{total} prompts, {invalid_count} invalid, in {seconds:.2f}s "
+          f"({total / seconds if seconds else 0:,.0f} prompts/s)")
+    for code, n in codes.most_common():
+        print(f"  {code:24} {n}")
+    sys.exit(1 if invalid_count else 0)
+
+
+if __name__ == "__main__":
+    main()
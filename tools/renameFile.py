@@ -1,45 +1,257 @@
+"""
+Renames the .png files in a folder to {first 10 chars}_{counter}_{ddmmyyyy}.png.
+
+The whole rename is planned before anything is touched: one scandir pass
+collects the files, the target names are computed in sorted order, and the
+plan is rejected if a target would overwrite a file that is not itself being
+renamed. The counter grows past three digits when the folder has more than
+999 files.
+
+The renames then run in two phases: every file first gets a unique temporary
+name, then every temporary name is renamed to its target. Chains and cycles
+(a -> b while b -> a, e.g. when re-running on an already renamed folder with
+new files in it) therefore need no special ordering. Before the first rename
+a journal listing every (original, temporary, target) triple is written to
+the folder; its phase is updated between the two phases. If the run is
+interrupted, --resume finishes it and --rollback restores the original names.
+
+Usage:
+    python renameFile.py D:/Picture/playGround/0018 --dry-run
+    python renameFile.py D:/Picture/playGround/0018
+    python renameFile.py D:/Picture/playGround/0018 --resume
+"""
+
 import os
+import sys
+import json
+import uuid
+import argparse
 from datetime import datetime
 
-def rename_png_files(folder_path):
-    # Get today's date in ddmmyyyy format
-    today_date = datetime.now().strftime("%d%m%Y")
-    
-    # List all files in the folder
-    files = os.listdir(folder_path)
-    
-    # Filter only .png files
-    png_files = [f for f in files if f.lower().endswith('.png')]
-    
+JOURNAL_NAME = '.rename-journal.json'
+
+
+class RenameError(Exception):
+    pass
+
+
+def name_key(name):
+    # Names that only differ in case are the same file on Windows and macOS
+    if os.name == 'nt' or sys.platform == 'darwin':
+        return name.casefold()
+    return name
+
+
+def plan_renames(folder_path, date=None):
+    """
+    Computes the renames for folder_path without touching it.
+
+    Returns (renames, stats): renames is a list of (old name, new name) for
+    the files whose name changes; stats counts the files, unchanged names,
+    and renames that are part of a chain or a cycle.
+    Raises RenameError if a target name is taken by a file that stays.
+    """
+    date = date or datetime.now().strftime("%d%m%Y")
+    with os.scandir(folder_path) as entries:
+        names = []
+        png_files = []
+        for entry in entries:
+            names.append(entry.name)
+            if entry.name.lower().endswith('.png') and entry.is_file():
+                png_files.append(entry.name)
     # Sort the files to ensure consistent ordering
     png_files.sort()
-    
-    # Initialize the counter
-    counter = 1
-    
-    for png_file in png_files:
-        # Extract the first 10 characters from the original file name (without extension)
-        original_name = os.path.splitext(png_file)[0]
-        name_prefix = original_name[:10]
-        
-        # Format the counter with leading zeros (e.g., 001, 002, ...)
-        counter_str = f"{counter:03d}"
-        
-        # Create the new file name
-        new_file_name = f"{name_prefix}_{counter_str}_{today_date}.png"
-        
-        # Get full paths for the old and new file names
-        old_file_path = os.path.join(folder_path, png_file)
-        new_file_path = os.path.join(folder_path, new_file_name)
-        
-        # Rename the file
-        os.rename(old_file_path, new_file_path)
-        
-        print(f"Renamed '{png_file}' to '{new_file_name}'")
-        
-        # Increment the counter
-        counter += 1
-
-# Example usage
-folder_path = r"D:\Picture\playGround\0018"  # Replace this with the path to your folder
-rename_png_files(folder_path)
\ No newline at end of file
+    width = max(3, len(str(len(png_files))))
+
+    renames = []
+    targets = {}
+    for counter, png_file in enumerate(png_files, 1):
+        name_prefix = os.path.splitext(png_file)[0][:10]
+        new_file_name = f"{name_prefix}_{counter:0{width}d}_{date}.png"
+        targets[name_key(new_file_name)] = png_file
+        if new_file_name != png_file:
+            renames.append((png_file, new_file_name))
+
+    # A target may only be taken by a file that is renamed away (or by the
+    # file itself, e.g. a case-only rename)
+    moving = {name_key(old) for old, _ in renames}
+    for name in names:
+        key = name_key(name)
+        if key in targets and key not in moving and targets[key] != name:
+            raise RenameError(f"'{targets[key]}' would overwrite '{name}', which is not being renamed")
+
+    # A rename is chained when its target is another file's current name or
+    # its name is another file's target. Following the targets from every
+    # file finds each cycle once, when the walk comes back to itself.
+    next_name = {name_key(old): name_key(new) for old, new in renames}
+    target_keys = set(next_name.values())
+    chained = sum(1 for key, target in next_name.items() if target in next_name or key in target_keys)
+    cycles = 0
+    seen = set()
+    for start in next_name:
+        walk = set()
+        key = start
+        while key in next_name and key not in seen:
+            seen.add(key)
+            walk.add(key)
+            key = next_name[key]
+        if key in walk:
+            cycles += 1
+
+    stats = {
+        'files': len(png_files),
+        'renames': len(renames),
+        'unchanged': len(png_files) - len(renames),
+        'chained': chained,
+        'cycles': cycles,
+    }
+    return renames, stats
+
+
+def write_journal(folder_path, journal):
+    """Write the journal in one step and make sure it is on disk."""
+    path = os.path.join(folder_path, JOURNAL_NAME)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(journal, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    if hasattr(os, 'O_DIRECTORY'):
+        # Persist the directory entry too, so the journal survives a power loss
+        fd = os.open(folder_path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def read_journal(folder_path):
+    path = os.path.join(folder_path, JOURNAL_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def remove_journal(folder_path):
+    os.remove(os.path.join(folder_path, JOURNAL_NAME))
+
+
+def apply_renames(folder_path, renames):
+    """Run a plan from plan_renames() in two phases, journaled."""
+    if read_journal(folder_path):
+        raise RenameError(f"An unfinished rename is journaled in {folder_path}; use --resume or --rollback")
+    token = uuid.uuid4().hex[:8]
+    journal = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'phase': 'staging',
+        'renames': [(old, f".rename-{token}-{i}.tmp", new) for i, (old, new) in enumerate(renames)],
+    }
+    write_journal(folder_path, journal)
+    run_journal(folder_path, journal)
+
+
+def run_journal(folder_path, journal):
+    """
+    Bring every file in the journal to its target name. Works from any point
+    of an interrupted run: the phase says which names can exist, the file
+    system says how far each file got.
+    """
+    join = lambda name: os.path.join(folder_path, name)
+    if journal['phase'] == 'staging':
+        for old, temp, new in journal['renames']:
+            if not os.path.exists(join(temp)):
+                try:
+                    os.rename(join(old), join(temp))
+                except FileNotFoundError as e:
+                    # Removed or renamed since the plan was made: nothing is
+                    # renamed to its target yet, so put the staged files back
+                    rollback_journal(folder_path, journal)
+                    raise RenameError(f"'{old}' disappeared before it was renamed; "
+                                      f"the original names were restored") from e
+        journal['phase'] = 'renaming'
+        write_journal(folder_path, journal)
+
+    for old, temp, new in journal['renames']:
+        if os.path.exists(join(temp)):
+            if os.path.exists(join(new)):
+                raise RenameError(f"'{new}' appeared while renaming; resolve it and use --resume or --rollback")
+            os.rename(join(temp), join(new))
+    remove_journal(folder_path)
+
+
+def rollback_journal(folder_path, journal):
+    """Give every file in the journal its original name back."""
+    join = lambda name: os.path.join(folder_path, name)
+    if journal['phase'] == 'renaming':
+        # Files that reached their target go back to their temporary name
+        # first; a target can be another file's original name
+        for old, temp, new in journal['renames']:
+            if not os.path.exists(join(temp)) and os.path.exists(join(new)):
+                os.rename(join(new), join(temp))
+        journal['phase'] = 'staging'
+        write_journal(folder_path, journal)
+
+    for old, temp, new in journal['renames']:
+        if os.path.exists(join(temp)):
+            os.rename(join(temp), join(old))
+    remove_journal(folder_path)
+
+
+def rename_png_files(folder_path, date=None, dry_run=False, show=0):
+    """
+    Plan and run the rename of folder_path; returns the plan's stats. With
+    dry_run nothing is renamed and the first `show` planned renames are printed.
+    """
+    renames, stats = plan_renames(folder_path, date)
+    if dry_run:
+        for old, new in renames[:show]:
+            print(f"'{old}' -> '{new}'")
+        if len(renames) > show:
+            print(f"... and {len(renames) - show} more")
+    elif renames:
+        apply_renames(folder_path, renames)
+    return stats
+
+
+def print_stats(stats, dry_run):
+    verb = "Would rename" if dry_run else "Renamed"
+    print(f"{verb} {stats['renames']} of {stats['files']} .png files "
+          f"({stats['unchanged']} already named, {stats['chained']} in chains, {stats['cycles']} cycles)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rename .png files to {prefix}_{counter}_{ddmmyyyy}.png, crash-safely.')
+    parser.add_argument('folder_path', nargs='?', default=r"D:\Picture\playGround\0018",  # Replace this with the path to your folder
+                        help='Folder with the .png files')
+    parser.add_argument('--date', help='Date part of the new names (default: today as ddmmyyyy)')
+    parser.add_argument('--dry-run', action='store_true', help='Only print what would be renamed')
+    parser.add_argument('--show', type=int, default=10, metavar='N',
+                        help='With --dry-run, list the first N renames (default: 10)')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--resume', action='store_true', help='Finish an interrupted rename')
+    group.add_argument('--rollback', action='store_true', help='Undo an interrupted rename')
+    args = parser.parse_args()
+
+    try:
+        if args.resume or args.rollback:
+            journal = read_journal(args.folder_path)
+            if not journal:
+                print(f"No unfinished rename in {args.folder_path}")
+            elif args.resume:
+                run_journal(args.folder_path, journal)
+                print(f"Finished {len(journal['renames'])} renames")
+            else:
+                rollback_journal(args.folder_path, journal)
+                print(f"Restored {len(journal['renames'])} original names")
+        else:
+            stats = rename_png_files(args.folder_path, args.date, args.dry_run, args.show)
+            print_stats(stats, args.dry_run)
+    except RenameError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
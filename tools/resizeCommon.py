@@ -0,0 +1,931 @@
+"""
+Helpers shared by the imageResize-* scripts.
+
+Each script keeps its own marker/rename scheme in a per-file function; the code
+here only deals with the parts that are identical across variants, such as
+driving that function over a folder of images.
+"""
+
+import io
+import os
+import sys
+import math
+import time
+import uuid
+import shutil
+import itertools
+import importlib.util
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+import resizeMetrics
+import animatedGif
+import metadataCatalog
+import resizePipeline
+import workLease
+from folderWatch import watch_folder
+
+def lazy_import(name):
+    """
+    Returns the module name, but only imports it on first attribute access.
+    PIL is imported this way so that --help, dry runs and empty folders do
+    not pay for it.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+Image = lazy_import('PIL.Image')
+
+# Output widths and formats used when --sizes is not given: 1200px, source format
+DEFAULT_SIZES = [(1200, None)]
+
+# save() options per output format for --profile. Without a profile each
+# script's own options (e.g. quality=95, optimize=True) are used as given.
+ENCODER_PROFILES = {
+    'fast': {
+        'JPEG': {'quality': 85, 'subsampling': '4:2:0'},
+        'PNG': {'compress_level': 1},
+        'WEBP': {'quality': 80, 'method': 0},
+        'AVIF': {'quality': 60, 'speed': 10},
+        'GIF': {'optimize': False},
+    },
+    'balanced': {
+        'JPEG': {'quality': 90, 'optimize': True, 'subsampling': '4:2:0'},
+        'PNG': {'compress_level': 6},
+        'WEBP': {'quality': 85, 'method': 4},
+        'AVIF': {'quality': 70, 'speed': 6},
+        'GIF': {'optimize': False},
+    },
+    'smallest': {
+        'JPEG': {'quality': 82, 'optimize': True, 'progressive': True, 'subsampling': '4:2:0'},
+        'PNG': {'optimize': True},
+        'WEBP': {'quality': 75, 'method': 6},
+        'AVIF': {'quality': 60, 'speed': 4},
+        'GIF': {'optimize': True},
+    },
+}
+
+# Working set of one resize relative to the decoded source: the decoded pixels
+# plus the LANCZOS intermediate and output, which are at most as large again
+WORKING_SET_FACTOR = 2
+# Source pixels per band when an image over the memory budget is resized in strips
+STRIP_PIXELS = 1 << 20
+
+# Sizes of the single images in a Midjourney (v5 / v6) 2x2 grid, per aspect
+# ratio: 1:1, 16:9, 4:3, 3:2, 5:4, 21:9 and their portrait forms
+GRID_TILE_SIZES = {
+    (1024, 1024), (1456, 816), (816, 1456), (1232, 928), (928, 1232),
+    (1344, 896), (896, 1344), (1120, 896), (896, 1120), (1680, 720), (720, 1680),
+}
+
+# Set per process by run_jobs(), see set_memory_budget(), set_dedupe(),
+# set_catalog() and set_resampler()
+_memory_budget = None
+_dedupe = None
+_catalog = False
+_resampler = None
+# Whether the --profile note of save_animation() was printed in this process
+_profile_noted = False
+
+
+def add_resize_arguments(parser):
+    """Add the options shared by every resize script to an argparse parser."""
+    parser.add_argument(
+        '--workers', type=int, default=1,
+        help='Number of worker processes to use (default: 1, no pool). '
+             'Use 0 for one worker per CPU core.'
+    )
+    parser.add_argument(
+        '--fast-decode', action='store_true',
+        help='Decode at a reduced scale (JPEG draft / reduce) before the LANCZOS '
+             'resize. Faster on large sources; check quality with checkFastDecode.py.'
+    )
+    parser.add_argument(
+        '--sizes', default=None,
+        help='Comma-separated output widths with optional formats, largest is the '
+             'main output, e.g. "1200:jpg,600:webp,256:webp" (default: 1200 in the '
+             'source format). Each image is decoded once.'
+    )
+    parser.add_argument(
+        '--profile', choices=sorted(ENCODER_PROFILES), default=None,
+        help='Encoder settings per output format: fast (low CPU), balanced, or '
+             'smallest (most CPU, smallest files). Default: each script\'s own '
+             'settings. Combine with --sizes (e.g. 1200:webp) to transcode and '
+             'with --metrics to see encode time and bytes per format. Animated GIFs '
+             'are written frame by frame without it; their stills in other formats use it.'
+    )
+    parser.add_argument(
+        '--resampler', choices=('pillow', 'numpy'), default='pillow',
+        help='LANCZOS implementation: Pillow (default) or NumPy with filter weights '
+             'cached per source/target size (see lanczosBatch.py; faster on the '
+             'fixed Midjourney sizes, within 2 levels of Pillow; images with alpha '
+             'use Pillow). Needs NumPy.'
+    )
+    parser.add_argument(
+        '--split-grid', action='store_true',
+        help='Split Midjourney 2x2 grids into four images, saved with _1 to _4 '
+             'appended to the output name. Each grid is decoded once. An image '
+             'is a grid when its quarters have the size of a single Midjourney '
+             'image (e.g. 2912x1632 for 16:9); others, such as a 1456x816 '
+             'upscale, are resized whole. 2x upscales have a grid\'s size and '
+             'are split too.'
+    )
+    parser.add_argument(
+        '--manifest', action='store_true',
+        help='Keep a content-hash manifest in the output folder and skip images '
+             'that were already processed, even under another name.'
+    )
+    parser.add_argument(
+        '--watch', action='store_true',
+        help='Keep running and process new images as they arrive (stop with Ctrl+C).'
+    )
+    parser.add_argument(
+        '--memory-budget', default=None,
+        help='Approximate memory for images being resized at once, e.g. "2G" or '
+             '"1500M". Jobs wait while the budget is used up; a single image over '
+             'the budget runs alone and is resized in strips.'
+    )
+    parser.add_argument(
+        '--dedupe', choices=('mark', 'skip'), default=None,
+        help='Look every output up in a perceptual-hash index of the output folder '
+             '(see imageDedupe.py). Near-duplicates of an earlier output get _dup '
+             'appended to their name (mark) or are not written (skip). Animated GIFs '
+             'are looked up by their first frame. Needs NumPy.'
+    )
+    parser.add_argument(
+        '--catalog', action='store_true',
+        help='Record every output with the prompt, parameters and job ID embedded '
+             'in its source in .metadata-catalog.sqlite in the output folder '
+             '(see metadataCatalog.py).'
+    )
+    parser.add_argument(
+        '--pipeline', action='store_true',
+        help='Overlap reading, resizing and writing: sources are read ahead and '
+             'outputs and done/failed moves are written behind by thread pools '
+             '(see resizePipeline.py). For slow or network storage; runs one '
+             'compute stage, so --workers is ignored.'
+    )
+    parser.add_argument(
+        '--read-ahead', type=int, default=resizePipeline.DEFAULT_READ_AHEAD, metavar='N',
+        help=f'--pipeline: files read ahead of the resize (default: {resizePipeline.DEFAULT_READ_AHEAD})'
+    )
+    parser.add_argument(
+        '--write-behind', type=int, default=resizePipeline.DEFAULT_WRITE_BEHIND, metavar='N',
+        help=f'--pipeline: outputs waiting to be written before the resize waits '
+             f'(default: {resizePipeline.DEFAULT_WRITE_BEHIND})'
+    )
+    parser.add_argument(
+        '--metrics', metavar='TRACE.jsonl', default=None,
+        help='Time every file per stage (list, decode, resize, encode, move), append '
+             'the records to this JSONL file and print a summary table at the end.'
+    )
+    parser.add_argument(
+        '--prometheus', metavar='FILE.prom', default=None,
+        help='Write file counters and stage latency histograms to this Prometheus '
+             'textfile (node_exporter textfile collector format).'
+    )
+
+
+def resize_options(args):
+    """Turn parsed arguments from add_resize_arguments into process_images kwargs."""
+    return {
+        'workers': args.workers,
+        'fast_decode': args.fast_decode,
+        'sizes': parse_sizes(args.sizes) if args.sizes else None,
+        'profile': args.profile,
+        'split_grid': args.split_grid,
+        'watch': args.watch,
+        'manifest': args.manifest,
+        'memory_budget': parse_bytes(args.memory_budget) if args.memory_budget else None,
+        'dedupe': args.dedupe,
+        'catalog': args.catalog,
+        'resampler': args.resampler,
+        'pipeline': (args.read_ahead, args.write_behind) if args.pipeline else None,
+        'metrics': args.metrics,
+        'prometheus': args.prometheus,
+    }
+
+
+def parse_sizes(spec):
+    """
+    Parse a --sizes value such as "1200:jpg,600:webp,256" into a list of
+    (width, extension) tuples, largest first. extension is None where the
+    output keeps the source's format.
+    """
+    sizes = []
+    for part in spec.split(','):
+        width, _, fmt = part.strip().partition(':')
+        if not width.isdigit() or int(width) <= 0:
+            raise ValueError(f"Invalid width in --sizes: {part!r}")
+        extension = None
+        if fmt:
+            extension = '.' + fmt.lower().lstrip('.')
+            if extension not in Image.registered_extensions():
+                raise ValueError(f"Unknown image format in --sizes: {part!r}")
+        sizes.append((int(width), extension))
+    return sorted(sizes, key=lambda size: size[0], reverse=True)
+
+
+def parse_bytes(text):
+    """Parse a size such as "2G", "1500M", "512MB" or "1048576" into bytes."""
+    units = {'': 1, 'K': 2**10, 'M': 2**20, 'G': 2**30, 'T': 2**40}
+    number = text.strip().upper().rstrip('B')
+    unit = number[-1:] if number[-1:] in units else ''
+    number = number[:len(number) - len(unit)]
+    try:
+        value = float(number) * units[unit]
+    except ValueError:
+        raise ValueError(f"Invalid size: {text!r}") from None
+    if value <= 0:
+        raise ValueError(f"Invalid size: {text!r}")
+    return int(value)
+
+
+def main_output_path(output_path, sizes):
+    """output_path with the extension of the main (largest) size, if one was given."""
+    extension = sizes[0][1]
+    if extension:
+        return os.path.splitext(output_path)[0] + extension
+    return output_path
+
+
+def passthrough_size(path, sizes, tolerance=0):
+    """
+    Decides from the header alone whether the image at path needs any work.
+    Returns its (width, height) when the width is within tolerance of the
+    main size and no other size or format is asked for, so the file can be
+    passed on with copy_output(); None when it has to be decoded and resized.
+    With --dedupe every output is decoded, as it is hashed from the pixels.
+    """
+    if len(sizes) > 1 or _dedupe:
+        return None
+    width, extension = sizes[0]
+    with open_source(path) as img:
+        if extension and Image.registered_extensions().get(extension) != img.format:
+            return None
+        if abs(img.width - width) <= tolerance:
+            return img.size
+    return None
+
+
+def copy_output(src, dst):
+    """
+    Puts the source file at dst as it is, as a hard link where the file system
+    allows it and as a byte copy otherwise. Like save_image() it appears at
+    dst in one step. With --pipeline the copy is written behind. With
+    --catalog, dst is recorded with the metadata in the source's header.
+    """
+    if not resizePipeline.write_behind(_copy_file, src, dst):
+        _copy_file(src, dst)
+    if _catalog:
+        fields = metadataCatalog.read_metadata(src) or {}
+        record_outputs([dst], fields=fields)
+
+
+def _copy_file(src, dst):
+    folder, name = os.path.split(dst)
+    temp_path = os.path.join(folder, f".{name}.{uuid.uuid4().hex[:8]}.tmp")
+    with resizeMetrics.stage('copy'):
+        try:
+            os.link(src, temp_path)
+        except OSError:
+            shutil.copyfile(src, temp_path)
+        try:
+            os.replace(temp_path, dst)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+    resizeMetrics.add('bytes', os.path.getsize(dst))
+
+
+@contextmanager
+def atomic_file(path):
+    """
+    Opens a temporary file in path's folder for binary writing. It is renamed
+    over path when the with-block succeeds and removed when it fails, so no
+    one ever sees a half-written output.
+    With --pipeline the with-block writes to memory and the file is written
+    by the write-behind stage.
+    """
+    if resizePipeline.current_job():
+        buffer = io.BytesIO()
+        yield buffer
+        resizePipeline.write_behind(write_file, path, buffer.getvalue())
+        return
+    folder, name = os.path.split(path)
+    temp_path = os.path.join(folder, f".{name}.{uuid.uuid4().hex[:8]}.tmp")
+    # Same permissions as a file created by img.save(path) would get
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            yield f
+            resizeMetrics.add('bytes', f.tell())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_file(path, data):
+    """Write data to path with atomic_file(); the write-behind stage of --pipeline."""
+    with resizeMetrics.stage('write'):
+        with atomic_file(path) as f:
+            f.write(data)
+
+
+def open_source(path):
+    """
+    Image.open(path); with --pipeline from the bytes the read-ahead stage
+    already loaded.
+    """
+    data = resizePipeline.source_bytes(path)
+    if data is None:
+        return Image.open(path)
+    try:
+        return Image.open(io.BytesIO(data))
+    except Image.UnidentifiedImageError:
+        # Name the file, as Image.open(path) does
+        raise Image.UnidentifiedImageError(f"cannot identify image file {path!r}") from None
+
+
+def encoder_params(format, profile, params):
+    """The save() options for format: the profile's if one is chosen, else params."""
+    if not profile:
+        return params
+    return dict(ENCODER_PROFILES[profile].get(format, {}))
+
+
+def save_image(img, path, format=None, profile=None, **params):
+    """
+    img.save() that converts modes the target format cannot store, e.g. RGBA
+    or palette images saved as JPEG, and writes atomically via atomic_file().
+    With an encoder profile its options for the format replace params.
+    The prompt metadata of the source (kept in img.info) is written to the
+    output, see metadataCatalog.output_metadata().
+    """
+    format = format or Image.registered_extensions().get(os.path.splitext(path)[1].lower())
+    if format == 'JPEG' and img.mode not in ('RGB', 'L', 'CMYK'):
+        img = img.convert('RGB')
+    params = {**metadataCatalog.output_metadata(img.info, format), **encoder_params(format, profile, params)}
+    start = time.perf_counter()
+    with resizeMetrics.stage('encode'):
+        with atomic_file(path) as f:
+            img.save(f, format=format, **params)
+            size = f.tell()
+    resizeMetrics.add_output(format, time.perf_counter() - start, size)
+
+
+def save_sizes(img, output_path, sizes, format=None, **params):
+    """
+    Saves img, already sized for the main output, to output_path and writes the
+    remaining sizes next to it as {name}_{width}{ext}. Each smaller size is
+    resized from the previous one instead of from the source, so the source is
+    decoded once and every step works on fewer pixels.
+    Animated GIFs (an AnimatedResize from resize_to(), or the opened source
+    itself) are written frame by frame with save_animation().
+    With --dedupe, img (the first frame of an animation) is first looked up
+    with imageDedupe.check_duplicate().
+    With --catalog, the paths written are recorded in the output folder's
+    metadata catalog.
+    Returns the list of paths written.
+    """
+    if not isinstance(img, AnimatedResize) and animatedGif.is_animated_gif(img):
+        img = AnimatedResize(img, img.size)
+    if _dedupe:
+        output_path = check_duplicate(img, output_path)
+        if output_path is None:
+            return []
+    if isinstance(img, AnimatedResize):
+        paths = save_animation(img, output_path, sizes, format=format, **params)
+        if _catalog:
+            record_outputs(paths, img.source.info)
+        return paths
+    save_image(img, output_path, format=format, **params)
+    paths = [output_path] + save_smaller_sizes(img, output_path, sizes, format=format, **params)
+    if _catalog:
+        record_outputs(paths, img.info)
+    return paths
+
+
+def check_duplicate(img, output_path):
+    """
+    The --dedupe lookup of save_sizes(): the path to write img to (with _dup
+    appended in 'mark' mode), or None to skip it. An animation is looked up
+    by its first frame.
+    """
+    # NumPy is only imported when --dedupe is used
+    import imageDedupe
+    with resizeMetrics.stage('dedupe'):
+        still = img.still() if isinstance(img, AnimatedResize) else img
+        output_path, duplicate_of = imageDedupe.check_duplicate(still, output_path, _dedupe)
+    if duplicate_of:
+        action = "skipped" if output_path is None else "marked"
+        print(f"\nNear-duplicate of {duplicate_of} {action}")
+    return output_path
+
+
+def record_outputs(paths, info=None, fields=None):
+    """Record outputs in their folder's metadata catalog (see Catalog.record_outputs())."""
+    catalog = metadataCatalog.open_catalog(os.path.dirname(paths[0]) or '.')
+    # The catalog reads the outputs' headers, so with --pipeline it waits for them
+    if not resizePipeline.after_writes(catalog.record_outputs, paths, info, fields):
+        catalog.record_outputs(paths, info, fields)
+
+
+def save_smaller_sizes(img, output_path, sizes, format=None, **params):
+    """The part of save_sizes() after the main output; returns the extra paths."""
+    paths = []
+    base, ext = os.path.splitext(output_path)
+    for width, extension in sizes[1:]:
+        height = max(1, int(img.height * width / img.width))
+        img = resize_to(img, (width, height))
+        path = f"{base}_{width}{extension or ext}"
+        save_image(img, path, format=None if extension else format, **params)
+        paths.append(path)
+    return paths
+
+
+def save_animation(animation, output_path, sizes, format=None, **params):
+    """
+    save_sizes() for an AnimatedResize. The source frames are read once; each
+    one is resized to every size (each from the previous one) and appended to
+    all outputs at the same time. Outputs in a format other than GIF get the
+    first frame as a still image. GifWriter takes no encoder options, so a
+    --profile only applies to those stills. Returns the list of paths written.
+    """
+    global _profile_noted
+    base, ext = os.path.splitext(output_path)
+    targets = [(output_path, animation.size, format)]
+    for width, extension in sizes[1:]:
+        height = max(1, int(animation.height * width / animation.width))
+        targets.append((f"{base}_{width}{extension or ext}", (width, height), None if extension else format))
+
+    animations = []
+    for path, size, path_format in targets:
+        path_format = path_format or Image.registered_extensions().get(os.path.splitext(path)[1].lower())
+        if path_format == 'GIF':
+            animations.append((path, size))
+        else:
+            still = animation.still()
+            save_image(still if still.size == size else resize_to(still, size), path, format=path_format, **params)
+    if animations and params.get('profile') and not _profile_noted:
+        _profile_noted = True
+        print("\nNote: --profile does not apply to animated GIF frames")
+
+    with ExitStack() as outputs:
+        writers = [(animatedGif.GifWriter(outputs.enter_context(atomic_file(path)), animation.source.info.get('loop')),
+                    size) for path, size in animations]
+        encode_seconds = [0.0] * len(writers)
+        source_frames = animatedGif.frames(animation.source)
+        while writers:
+            with resizeMetrics.stage('decode'):
+                source_frame = next(source_frames, None)
+            if source_frame is None:
+                break
+            frame, duration, disposal = source_frame
+            for index, (writer, size) in enumerate(writers):
+                with resizeMetrics.stage('resize'):
+                    if frame.size != size:
+                        if index == 0 and animation.fast_decode:
+                            frame = reduce_for_size(frame, size)
+                        resizeMetrics.add('pixels', frame.width * frame.height)
+                        frame = frame.resize(size, Image.LANCZOS)
+                start = time.perf_counter()
+                with resizeMetrics.stage('encode'):
+                    writer.add_frame(frame, duration, disposal)
+                encode_seconds[index] += time.perf_counter() - start
+        for (writer, _), seconds in zip(writers, encode_seconds):
+            writer.close()
+            resizeMetrics.add_output('GIF', seconds, writer.fp.tell())
+    return [path for path, _, _ in targets]
+
+
+class AnimatedResize:
+    """
+    What resize_to() returns for an animated GIF instead of resizing only the
+    first frame: the source and the target size. save_sizes() streams the
+    frames from it; size, width and height work as on an Image.
+    """
+
+    def __init__(self, source, size, fast_decode=False):
+        self.source = source
+        self.size = size
+        self.width, self.height = size
+        self.fast_decode = fast_decode
+
+    def still(self):
+        """The first frame at the target size."""
+        self.source.seek(0)
+        frame = self.source.convert('RGBA')
+        if frame.size == self.size:
+            return frame
+        return resize_to(frame, self.size, self.fast_decode)
+
+
+def grid_boxes(img):
+    """
+    The boxes of the four quadrants of a Midjourney 2x2 grid in reading order,
+    or None if img is animated or not a grid: each quadrant has to be one of
+    GRID_TILE_SIZES, and img not one itself (a single upscaled image). The
+    aspect ratio alone cannot tell, as halving both sides keeps it. Only the
+    header is needed.
+    """
+    if animatedGif.is_animated_gif(img) or img.size in GRID_TILE_SIZES:
+        return None
+    width, height = img.width // 2, img.height // 2
+    if (width * 2, height * 2) != img.size or (width, height) not in GRID_TILE_SIZES:
+        return None
+    return [(left, top, left + width, top + height) for top in (0, height) for left in (0, width)]
+
+
+def save_grid(img, output_path, width, sizes, fast_decode=False, **params):
+    """
+    --split-grid: resizes each quadrant of the grid img to width and saves it
+    with save_sizes() as {name}_1{ext} to {name}_4{ext}. The grid is decoded
+    once. Quadrants are cropped one at a time just before they are resized;
+    resizing the whole grid with a box would blend the neighbouring quadrant
+    into the edges.
+    Returns the size of each output, or None if img is not a grid.
+    """
+    boxes = grid_boxes(img)
+    if not boxes:
+        return None
+    left, top, right, bottom = boxes[0]
+    size = (width, max(1, int((bottom - top) * width / (right - left))))
+    with resizeMetrics.stage('decode'):
+        full_width = img.width
+        if fast_decode:
+            img = reduce_for_size(img, (size[0] * 2, size[1] * 2))
+        img.load()
+        if img.width != full_width:
+            # Decoded at a reduced scale; the quadrants shrink along
+            scale = img.width / full_width
+            boxes = [tuple(round(edge * scale) for edge in box) for box in boxes]
+    base, ext = os.path.splitext(output_path)
+    for number, box in enumerate(boxes, 1):
+        with resizeMetrics.stage('decode'):
+            quadrant = img.crop(box)
+        save_sizes(resize_to(quadrant, size), f"{base}_{number}{ext}", sizes, **params)
+    return size
+
+
+def reduce_for_size(img, size):
+    """
+    Returns img decoded at the smallest power-of-two scale that is still at least
+    `size`, so the following LANCZOS pass has less to do.
+
+    JPEGs use draft(), which makes libjpeg decode at 1/2, 1/4 or 1/8 scale; it
+    has to be called before the pixel data is loaded. Other formats are decoded
+    in full and shrunk with reduce(), which is a fast box filter.
+    """
+    if img.format == 'JPEG':
+        img.draft(None, size)
+        return img
+    factor = 1
+    while img.width // (factor * 2) >= size[0] and img.height // (factor * 2) >= size[1]:
+        factor *= 2
+    if factor > 1:
+        return img.reduce(factor)
+    return img
+
+
+def resize_to(img, size, fast_decode=False):
+    """
+    Resize img to size with LANCZOS, optionally via reduce_for_size first.
+    For an animated GIF this returns an AnimatedResize for save_sizes().
+    """
+    if animatedGif.is_animated_gif(img):
+        return AnimatedResize(img, size, fast_decode)
+    if _memory_budget and image_memory(img) > _memory_budget:
+        return resize_in_strips(img, size)
+    # Load explicitly so decoding and resizing show up as separate stages
+    with resizeMetrics.stage('decode'):
+        if fast_decode:
+            img = reduce_for_size(img, size)
+        img.load()
+    with resizeMetrics.stage('resize'):
+        resizeMetrics.add('pixels', img.width * img.height)
+        return lanczos_resize(img, size)
+
+
+def lanczos_resize(img, size):
+    """img.resize(size, Image.LANCZOS), with lanczosBatch for --resampler numpy."""
+    if _resampler == 'numpy':
+        # NumPy is only imported when --resampler numpy is used
+        import lanczosBatch
+        resized = lanczosBatch.resize(img, size)
+        if resized is not None:
+            return resized
+    return img.resize(size, Image.LANCZOS)
+
+
+def resize_in_strips(img, size):
+    """
+    resize_to() for images over the memory budget. JPEGs are decoded at a
+    reduced scale with draft(). The LANCZOS pass then runs on horizontal strips
+    of the output, so its buffers hold a strip instead of the whole image.
+    Each strip is resized from a band of source rows that includes the
+    filter's reach, so the result matches a single resize of the same source
+    (up to rounding of the last bit).
+    """
+    with resizeMetrics.stage('decode'):
+        if img.format == 'JPEG':
+            img.draft(None, size)
+        img.load()
+    with resizeMetrics.stage('resize'):
+        resizeMetrics.add('pixels', img.width * img.height)
+        resized = Image.new(img.mode, size)
+        # Image.new() starts without the source's info, which holds its metadata
+        resized.info = dict(img.info)
+        scale = img.height / size[1]
+        # Source rows the LANCZOS filter reads around a strip (support 3, scaled)
+        margin = 3 * max(scale, 1) + 2
+        rows = max(1, int(STRIP_PIXELS / (img.width * scale)))
+        for top in range(0, size[1], rows):
+            bottom = min(size[1], top + rows)
+            # Resize a band cropped from the source rather than the source with a
+            # box: modes with alpha are premultiplied into a copy of the whole
+            # input on every resize() call
+            band_top = max(0, int(top * scale - margin))
+            band_bottom = min(img.height, math.ceil(bottom * scale + margin))
+            band = img.crop((0, band_top, img.width, band_bottom))
+            strip = band.resize((size[0], bottom - top), Image.LANCZOS,
+                                box=(0, top * scale - band_top, img.width, bottom * scale - band_top))
+            resized.paste(strip, (0, top))
+        if img.mode == 'P':
+            resized.putpalette(img.getpalette())
+        return resized
+
+
+def image_memory(img):
+    """Estimated bytes needed to resize an opened (not necessarily loaded) image."""
+    # Pillow stores 1, L and P images with a byte per pixel, other modes with four
+    bytes_per_pixel = 1 if img.mode in ('1', 'L', 'P') else 4
+    if animatedGif.is_animated_gif(img):
+        # Only the current frame is held, but as RGBA
+        bytes_per_pixel = 4
+    return img.width * img.height * bytes_per_pixel * WORKING_SET_FACTOR
+
+
+def estimate_memory(path):
+    """image_memory() from the file header only; 0 for files that cannot be opened."""
+    try:
+        with Image.open(path) as img:
+            return image_memory(img)
+    except Exception:
+        return 0
+
+
+def source_path(folder):
+    """A run_jobs() source function for file names in folder."""
+    return lambda name: os.path.join(folder, name)
+
+
+def image_cost(folder):
+    """A run_jobs() cost function for file names in folder."""
+    return lambda name: estimate_memory(os.path.join(folder, name))
+
+
+def set_memory_budget(budget):
+    """Images estimated above budget bytes are resized with resize_in_strips()."""
+    global _memory_budget
+    _memory_budget = budget
+
+
+def set_dedupe(mode):
+    """--dedupe for save_sizes(): None, 'mark' or 'skip'."""
+    global _dedupe
+    _dedupe = mode
+
+
+def set_catalog(enabled):
+    """--catalog for save_sizes(): record outputs in metadataCatalog."""
+    global _catalog
+    _catalog = enabled
+
+
+def set_resampler(name):
+    """--resampler for resize_to(): 'pillow' (or None) or 'numpy'."""
+    global _resampler
+    _resampler = name
+
+
+def _init_worker(memory_budget, dedupe, catalog, resampler):
+    set_memory_budget(memory_budget)
+    set_dedupe(dedupe)
+    set_catalog(catalog)
+    set_resampler(resampler)
+
+
+def move_file(src, dst, claim=False):
+    """
+    os.rename() counted as the 'move' stage of the current file. With
+    --pipeline, moves after a job's first output wait for its outputs to be
+    written (see resizePipeline.defer_move()). claim marks the rename that
+    takes a leased source (to its -PROCESSING- name); it is recorded in the
+    lease, so the file gets its name back if the run dies (see workLease.moved()).
+    """
+    if claim:
+        workLease.moved(src, dst)
+    if resizePipeline.defer_move(src, dst):
+        return
+    with resizeMetrics.stage('move'):
+        os.rename(src, dst)
+
+
+def scan_images(folder, accept):
+    """
+    Yields the names of regular files in folder for which accept(name) is true.
+
+    Built on os.scandir so the file-type check reuses the information returned
+    by the directory listing instead of a stat() per entry, and names are handed
+    out as they are found, so processing starts before a large listing is done.
+    Each name is yielded at most once, even if a script renames a file back to
+    its original name while the scan is still running.
+    """
+    seen = set()
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.name in seen:
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+            except OSError:
+                continue
+            if accept(entry.name):
+                seen.add(entry.name)
+                yield entry.name
+
+
+def find_images(folder, accept, watch=False):
+    """
+    Images to process: scan_images() for a single run, watch_folder() for
+    --watch. Files left behind by a process that died holding their lease get
+    their original name back first (with --watch, also while watching).
+    """
+    workLease.recover(folder)
+    if watch:
+        workLease.recover_periodically(folder)
+        return watch_folder(folder, accept)
+    return scan_images(folder, accept)
+
+
+_NO_ITEM = object()
+
+
+def run_jobs(func, items, args=(), kwargs=None, workers=1, desc="Processing images", unit="it",
+             metrics=None, prometheus=None, memory_budget=None, cost=None, dedupe=None, catalog=False,
+             resampler=None, pipeline=None, source=None, claim_folder=None):
+    """
+    Calls func(item, *args, **kwargs) for every item and drives one tqdm progress bar.
+
+    With workers > 1 the calls are spread over a process pool. func must then be
+    a module-level function so it can be pickled. Items are consumed lazily and
+    at most two jobs per worker are in flight at any time.
+
+    With memory_budget (bytes) and cost, a function returning the estimated
+    bytes one item needs (see image_cost), a job is only started while the
+    estimates of the running jobs leave room for it. An item over the budget
+    on its own waits until nothing else runs. Images over the budget are also
+    resized in strips, see resize_in_strips().
+
+    dedupe ('mark' or 'skip') turns on the near-duplicate check of save_sizes(),
+    catalog the metadata catalog of its outputs; resampler picks the LANCZOS
+    implementation of resize_to().
+
+    pipeline, a (read_ahead, write_behind) pair, runs the jobs in this process
+    with reading and writing overlapped, see resizePipeline. source(item) is
+    the path of the file to read ahead for item (see source_path).
+
+    With claim_folder, items are names of files in that folder and each one's
+    lease is taken before func runs (see workLease), so several runs, on this
+    machine or others sharing the folder, can drain it together. An item
+    leased by another run, or already gone, returns "taken".
+
+    Every call is traced per stage (see resizeMetrics). metrics is a JSONL file
+    the traces are appended to, followed by a summary table on stdout;
+    prometheus is a textfile that gets counters and latency histograms.
+
+    Returns a Counter of the values returned by func (e.g. "done", "failed").
+    """
+    kwargs = kwargs or {}
+    if workers is not None and workers <= 0:
+        workers = os.cpu_count() or 1
+    counts = Counter()
+    total = len(items) if hasattr(items, '__len__') else None
+    report = resizeMetrics.Metrics(metrics, prometheus) if metrics or prometheus else None
+    # The pipeline times the listing on its own feeder thread
+    items = _timed_items(items, None if pipeline else report)
+
+    def finish(result):
+        status, trace = result
+        counts[status] += 1
+        if report:
+            report.add_trace(trace)
+            report.write_periodically()
+        progress.update(1)
+
+    try:
+        # Nothing to do: return before tqdm and the process pool are imported
+        first = next(items, _NO_ITEM)
+        if first is _NO_ITEM:
+            return counts
+        items = itertools.chain([first], items)
+
+        from tqdm import tqdm
+        with tqdm(total=total, desc=desc, unit=unit) as progress:
+            if pipeline:
+                _init_worker(memory_budget, dedupe, catalog, resampler)
+                read_ahead, write_behind = pipeline
+                with resizePipeline.Pipeline(read_ahead, write_behind, report) as stages:
+                    for result in stages.run(lambda item: _traced_call(func, item, args, kwargs, claim_folder), items, source):
+                        finish(result)
+                return counts
+
+            if not workers or workers == 1:
+                _init_worker(memory_budget, dedupe, catalog, resampler)
+                for item in items:
+                    finish(_traced_call(func, item, args, kwargs, claim_folder))
+                return counts
+
+            from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+            max_in_flight = workers * 2
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(memory_budget, dedupe, catalog, resampler)) as pool:
+                pending = {}
+                in_use = 0
+                for item in items:
+                    needed = cost(item) if memory_budget and cost else 0
+                    while pending and (len(pending) >= max_in_flight
+                                       or memory_budget and in_use + needed > memory_budget):
+                        finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            in_use -= pending.pop(future)
+                            finish(_job_result(future))
+                    pending[pool.submit(_traced_call, func, item, args, kwargs, claim_folder)] = needed
+                    in_use += needed
+                for future in pending:
+                    finish(_job_result(future))
+        return counts
+    finally:
+        if report:
+            report.close()
+            if metrics:
+                report.print_summary()
+
+
+def _timed_items(items, report):
+    # Time spent getting the next name is the directory listing (or, with
+    # --watch, waiting for new files)
+    items = iter(items)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(items)
+        except StopIteration:
+            return
+        if report:
+            report.add_listing(time.perf_counter() - start)
+        yield item
+
+
+def _traced_call(func, item, args, kwargs, claim_folder=None):
+    # Runs in the worker process; the trace travels back with the status
+    resizeMetrics.begin(item)
+    status = "failed"
+    lease = None
+    try:
+        if claim_folder:
+            with resizeMetrics.stage('claim'):
+                lease = workLease.claim(os.path.join(claim_folder, item))
+        if claim_folder and lease is None:
+            status = "taken"
+        else:
+            status = func(item, *args, **kwargs)
+    finally:
+        # With --pipeline the lease is kept until the job's moves are done
+        if lease and not resizePipeline.after_job(lease.release):
+            lease.release()
+        trace = resizeMetrics.end(status)
+    return status, trace
+
+
+def _job_result(future):
+    # A worker crashing outside func's own error handling must not abort the
+    # remaining jobs, so report it the same way the scripts report failures.
+    try:
+        return future.result()
+    except Exception as e:
+        print(f"\nWorker error: {e}")
+        return "failed", None
@@ -0,0 +1,125 @@
+"""
+On-disk manifest of images the imageResize scripts have already processed.
+
+The manifest is a SQLite file in the output folder. It maps the SHA-256 of
+each source image to its status, output path and output dimensions, so a
+re-run or a re-downloaded copy of the same image is skipped with one indexed
+lookup instead of a decode and re-encode.
+
+Hashing is avoided for files that were seen before: a second table maps
+(name, size, mtime) to the digest, so an unchanged file only costs a stat().
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import resizeMetrics
+import resizePipeline
+
+MANIFEST_NAME = '.resize-manifest.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    output_path TEXT,
+    width INTEGER,
+    height INTEGER,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stat_cache (
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (name, size, mtime_ns)
+) WITHOUT ROWID;
+"""
+
+# One connection per process and output folder, see open_manifest
+_manifests = {}
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """
+    Return the hex SHA-256 of a file, read in chunks, or of the bytes the
+    --pipeline read-ahead already loaded.
+    """
+    data = resizePipeline.source_bytes(path)
+    if data is not None:
+        return hashlib.sha256(data).hexdigest()
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Manifest:
+    def __init__(self, output_folder):
+        self.path = os.path.join(output_folder, MANIFEST_NAME)
+        # Several worker processes share the file; wait for their writes
+        # instead of failing with "database is locked".
+        self.db = sqlite3.connect(self.path, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    def lookup(self, path, name):
+        """
+        Look up the image at path, originally called name.
+
+        Returns (key, output_path). key is passed back to record(); output_path
+        is the existing output if this content was already processed
+        successfully and that output still exists, otherwise None.
+        """
+        st = os.stat(path)
+        row = self.db.execute(
+            "SELECT digest FROM stat_cache WHERE name = ? AND size = ? AND mtime_ns = ?",
+            (name, st.st_size, st.st_mtime_ns)
+        ).fetchone()
+        if row:
+            digest = row[0]
+        else:
+            with resizeMetrics.stage('hash'):
+                digest = file_digest(path)
+        key = (name, st.st_size, st.st_mtime_ns, digest)
+
+        row = self.db.execute(
+            "SELECT status, output_path FROM images WHERE digest = ?", (digest,)
+        ).fetchone()
+        if row and row[0] == 'done' and row[1] and os.path.exists(row[1]):
+            with self.db:
+                self._remember_stat(key)
+            return key, row[1]
+        return key, None
+
+    def record(self, key, status, output_path=None, dimensions=(None, None)):
+        """
+        Store the outcome for an image looked up with lookup(). With
+        --pipeline this waits until the job's outputs are written.
+        """
+        if resizePipeline.after_writes(self.record, key, status, output_path, dimensions):
+            return
+        name, size, mtime_ns, digest = key
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (digest, size, status, output_path, dimensions[0], dimensions[1], time.time())
+            )
+            self._remember_stat(key)
+
+    def _remember_stat(self, key):
+        self.db.execute("INSERT OR IGNORE INTO stat_cache VALUES (?, ?, ?, ?)", key)
+
+    def close(self):
+        self.db.close()
+
+
+def open_manifest(output_folder):
+    """Return this process's Manifest for output_folder, opening it on first use."""
+    folder = os.path.abspath(output_folder)
+    if folder not in _manifests:
+        _manifests[folder] = Manifest(folder)
+    return _manifests[folder]
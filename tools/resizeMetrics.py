@@ -0,0 +1,217 @@
+"""
+Per-file, per-stage timing for the imageResize scripts.
+
+run_jobs() opens a trace around every process_file call. While it is open,
+the shared helpers add to it: time spent in each stage (decode, resize,
+encode, move), the number of pixels resized, the bytes written and, per
+output format, the files written with their encode time and size. The
+finished trace is a plain dict, so it travels back from worker processes
+together with the job's status.
+
+A Metrics object collects the traces in the parent process. It can write
+them as JSONL, print a summary table per stage and write a Prometheus
+textfile (for node_exporter's textfile collector) with status counters and
+stage latency histograms.
+"""
+
+import os
+import json
+import time
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+# Upper bounds, in seconds, of the Prometheus stage latency histogram buckets
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# How often the Prometheus textfile is rewritten while a run (e.g. --watch) is going
+PROMETHEUS_INTERVAL = 15.0
+
+_local = threading.local()
+
+
+def begin(item):
+    """Start the trace of one job in the current thread."""
+    _local.trace = {
+        'file': str(item),
+        'pid': os.getpid(),
+        'start': time.time(),
+        'stages': defaultdict(float),
+        'pixels': 0,
+        'bytes': 0,
+        'outputs': {},
+    }
+    _local.started = time.perf_counter()
+
+
+def end(status):
+    """Finish the current trace and return it as a dict."""
+    trace = getattr(_local, 'trace', None)
+    if trace is None:
+        return None
+    trace['status'] = status
+    trace['seconds'] = time.perf_counter() - _local.started
+    trace['stages'] = dict(trace['stages'])
+    _local.trace = None
+    return trace
+
+
+@contextmanager
+def stage(name):
+    """Add the time spent in the with-block to stage `name` of the current trace."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace = getattr(_local, 'trace', None)
+        if trace is not None:
+            trace['stages'][name] += time.perf_counter() - start
+
+
+def add(key, amount):
+    """Add to a counter ('pixels', 'bytes') of the current trace."""
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace[key] += amount
+
+
+def add_output(format, seconds, size):
+    """Count one output file of format that took seconds to encode and has size bytes."""
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        files, total_seconds, total_bytes = trace['outputs'].get(format, (0, 0.0, 0))
+        trace['outputs'][format] = (files + 1, total_seconds + seconds, total_bytes + size)
+
+
+def merge(trace, other):
+    """Add the stages, counters and outputs of trace other to trace."""
+    if trace is None or other is None:
+        return
+    stages = trace['stages']
+    for name, seconds in other['stages'].items():
+        stages[name] = stages.get(name, 0.0) + seconds
+    trace['pixels'] += other['pixels']
+    trace['bytes'] += other['bytes']
+    for format, (files, seconds, size) in other['outputs'].items():
+        total_files, total_seconds, total_size = trace['outputs'].get(format, (0, 0.0, 0))
+        trace['outputs'][format] = (total_files + files, total_seconds + seconds, total_size + size)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))]
+
+
+class Metrics:
+    """Collects traces in the parent process and writes the reports."""
+
+    def __init__(self, trace_path=None, prometheus_path=None):
+        self.trace_path = trace_path
+        self.prometheus_path = prometheus_path
+        self.trace_file = open(trace_path, 'a', encoding='utf-8') if trace_path else None
+        self.statuses = Counter()
+        self.stage_times = defaultdict(list)
+        self.pixels = 0
+        self.bytes = 0
+        self.list_seconds = 0.0
+        self.outputs = defaultdict(lambda: [0, 0.0, 0])
+        self.started = time.perf_counter()
+        self.last_written = self.started
+
+    def add_listing(self, seconds):
+        """Time spent waiting for the next file name from the folder scan."""
+        self.list_seconds += seconds
+
+    def add_trace(self, trace):
+        if trace is None:
+            return
+        self.statuses[trace['status']] += 1
+        for name, seconds in trace['stages'].items():
+            self.stage_times[name].append(seconds)
+        self.stage_times['total'].append(trace['seconds'])
+        self.pixels += trace['pixels']
+        self.bytes += trace['bytes']
+        for format, values in trace['outputs'].items():
+            totals = self.outputs[format]
+            for i, value in enumerate(values):
+                totals[i] += value
+        if self.trace_file:
+            self.trace_file.write(json.dumps(trace) + '\n')
+
+    def write_periodically(self):
+        """Refresh the Prometheus textfile if PROMETHEUS_INTERVAL has passed."""
+        now = time.perf_counter()
+        if self.prometheus_path and now - self.last_written >= PROMETHEUS_INTERVAL:
+            self.write_prometheus(self.prometheus_path)
+            self.last_written = now
+        if self.trace_file:
+            self.trace_file.flush()
+
+    def close(self):
+        if self.trace_file:
+            self.trace_file.close()
+        if self.prometheus_path:
+            self.write_prometheus(self.prometheus_path)
+
+    def print_summary(self):
+        wall = time.perf_counter() - self.started
+        counts = ', '.join(f"{status}: {n}" for status, n in sorted(self.statuses.items()))
+        print(f"\nFiles: {counts or 'none'} in {wall:.2f}s "
+              f"(listing {self.list_seconds:.2f}s, {self.pixels / 1e6:.1f} MP resized, "
+              f"{self.bytes / 2**20:.1f} MB written)")
+        print(f"{'stage':10} {'count':>7} {'total s':>9} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+        for name in sorted(self.stage_times, key=lambda n: (n == 'total', n)):
+            times = self.stage_times[name]
+            print(f"{name:10} {len(times):7d} {sum(times):9.2f} {sum(times) / len(times) * 1000:9.1f} "
+                  f"{percentile(times, 0.5) * 1000:9.1f} {percentile(times, 0.95) * 1000:9.1f}")
+        if self.outputs:
+            print(f"\n{'format':10} {'files':>7} {'encode s':>9} {'ms/file':>9} {'MB':>9} {'KB/file':>9}")
+            for format, (files, seconds, size) in sorted(self.outputs.items()):
+                print(f"{format:10} {files:7d} {seconds:9.2f} {seconds / files * 1000:9.1f} "
+                      f"{size / 2**20:9.1f} {size / files / 1024:9.1f}")
+
+    def write_prometheus(self, path):
+        lines = [
+            '# HELP imageresize_files_total Files handled by the imageResize scripts, by outcome.',
+            '# TYPE imageresize_files_total counter',
+        ]
+        for status in sorted(set(self.statuses) | {'done', 'failed', 'skipped'}):
+            lines.append(f'imageresize_files_total{{status="{status}"}} {self.statuses[status]}')
+        lines += [
+            '# HELP imageresize_pixels_total Pixels passed through the resizer.',
+            '# TYPE imageresize_pixels_total counter',
+            f'imageresize_pixels_total {self.pixels}',
+            '# HELP imageresize_bytes_written_total Bytes written to output files.',
+            '# TYPE imageresize_bytes_written_total counter',
+            f'imageresize_bytes_written_total {self.bytes}',
+            '# HELP imageresize_output_bytes_total Bytes written per output format.',
+            '# TYPE imageresize_output_bytes_total counter',
+        ]
+        for format, (files, seconds, size) in sorted(self.outputs.items()):
+            lines.append(f'imageresize_output_bytes_total{{format="{format}"}} {size}')
+        lines += [
+            '# HELP imageresize_encode_seconds_total Time spent encoding per output format.',
+            '# TYPE imageresize_encode_seconds_total counter',
+        ]
+        for format, (files, seconds, size) in sorted(self.outputs.items()):
+            lines.append(f'imageresize_encode_seconds_total{{format="{format}"}} {seconds}')
+        lines += [
+            '# HELP imageresize_stage_seconds Time spent per file in each processing stage.',
+            '# TYPE imageresize_stage_seconds histogram',
+        ]
+        for name in sorted(self.stage_times):
+            times = self.stage_times[name]
+            for bound in HISTOGRAM_BUCKETS:
+                count = sum(1 for t in times if t <= bound)
+                lines.append(f'imageresize_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+            lines.append(f'imageresize_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {len(times)}')
+            lines.append(f'imageresize_stage_seconds_sum{{stage="{name}"}} {sum(times)}')
+            lines.append(f'imageresize_stage_seconds_count{{stage="{name}"}} {len(times)}')
+
+        # The textfile collector may read at any time; never show it half-written
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(temp_path, path)
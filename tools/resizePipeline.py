@@ -0,0 +1,292 @@
+"""
+Read-ahead / compute / write-behind pipeline for the imageResize scripts
+(--pipeline).
+
+On network storage a serial run leaves the CPU idle while a source is read
+and while outputs are written and sources renamed, and leaves the storage
+idle while an image is resized. With --pipeline run_jobs() splits each job
+over three stages that run at the same time:
+
+    read-ahead    a feeder thread takes names from the folder scan and a pool
+                  of read threads loads each source's bytes, up to read_ahead
+                  files ahead of the compute stage
+    compute       the main thread runs process_file as before; open_source()
+                  reads the prefetched bytes and atomic_file() and
+                  copy_output() hand their output to the write-behind stage
+    write-behind  a pool of threads writes the outputs, then does the job's
+                  done/failed moves
+
+Both queues are bounded. The compute stage waits when read-ahead has nothing
+ready, the feeder waits when read_ahead files are ready, and the compute
+stage waits for a slot when write_behind outputs are still being written, so
+memory stays bounded by about read_ahead + write_behind files.
+
+A job's moves and its bookkeeping (manifest and catalog records, see
+after_writes()) are held back until its outputs are written, so nothing
+claims an output that is not on disk. If an output fails to write, the job
+counts as failed, the held-back moves are dropped and the source is renamed
+back to the name it had before the job, so the next run picks it up again.
+The job's lease (see workLease) is given back after either.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+import resizeMetrics
+
+# Files read ahead of the compute stage, and outputs waiting to be written
+DEFAULT_READ_AHEAD = 4
+DEFAULT_WRITE_BEHIND = 8
+# Threads writing outputs and moving sources
+WRITE_THREADS = 4
+# Seconds between checks for finished jobs while the compute stage waits for a file
+FINISH_POLL = 0.1
+
+# The job running on the compute thread, see current_job()
+_local = threading.local()
+# The Pipeline run_jobs() is driving in this process
+_pipeline = None
+_END = object()
+
+
+class Job:
+    """What the pipeline holds for one process_file call."""
+
+    def __init__(self, item, path, source):
+        self.item = item
+        # path -> Future of the source's bytes
+        self.sources = {path: source} if source else {}
+        self.writes = []
+        # (src, dst) moves and (func, args) records held back until the writes are done
+        self.moves = []
+        self.callbacks = []
+        # (func, args) run when the job is finished either way, see after_job()
+        self.cleanups = []
+        # (first src, last dst) of the moves done right away, to undo them on a write error
+        self.claimed = None
+
+
+class Pipeline:
+    def __init__(self, read_ahead=DEFAULT_READ_AHEAD, write_behind=DEFAULT_WRITE_BEHIND, report=None):
+        self.read_ahead = max(1, read_ahead)
+        self.report = report
+        self.readers = ThreadPoolExecutor(max_workers=self.read_ahead, thread_name_prefix='read-ahead')
+        self.writers = ThreadPoolExecutor(max_workers=WRITE_THREADS, thread_name_prefix='write-behind')
+        self.ready = queue.Queue(maxsize=self.read_ahead)
+        self.write_slots = threading.BoundedSemaphore(max(1, write_behind))
+
+    def run(self, call, items, source=None):
+        """
+        Runs call(item) on this thread for every item and yields each job's
+        (status, trace) once its outputs are written. source(item) is the
+        path of the file to read ahead for item.
+        """
+        threading.Thread(target=self._feed, args=(iter(items), source), daemon=True).start()
+        finishing = {}
+        while True:
+            # Jobs whose writes finished while the last one was computed
+            yield from self._finished(finishing)
+            try:
+                entry = self.ready.get(timeout=FINISH_POLL if finishing else None)
+            except queue.Empty:
+                continue
+            if entry is _END:
+                break
+            item, seconds, path, data = entry
+            if isinstance(item, BaseException):
+                raise item
+            if self.report:
+                self.report.add_listing(seconds)
+            job = Job(item, path, data)
+            _local.job = job
+            try:
+                status, trace = call(item)
+            finally:
+                _local.job = None
+            # The bytes are not needed any more; only outputs wait for the writers
+            job.sources = {}
+            finishing[self.writers.submit(self._finish, job)] = (job, status, trace)
+        while finishing:
+            wait(finishing)
+            yield from self._finished(finishing)
+
+    def _feed(self, items, source):
+        # Pulls names on its own thread, so waiting for the scan (or, with
+        # --watch, for new files) never holds up the compute stage
+        try:
+            while True:
+                start = time.perf_counter()
+                item = next(items, _END)
+                if item is _END:
+                    break
+                path = source(item) if source else None
+                data = self.readers.submit(read_file, path) if path else None
+                self.ready.put((item, time.perf_counter() - start, path, data))
+        except BaseException as e:
+            self.ready.put((e, 0.0, None, None))
+        finally:
+            self.ready.put(_END)
+
+    def write(self, func, args):
+        """Queue func(*args) as one output write; waits while write_behind writes are pending."""
+        self.write_slots.acquire()
+        future = self.writers.submit(_traced, func, args)
+        future.add_done_callback(lambda _: self.write_slots.release())
+        return future
+
+    def _finish(self, job):
+        # Runs on a write-behind thread once the job's writes were queued, so
+        # every write of the job was taken by a thread before this
+        wait(job.writes)
+        error = next((w.exception() for w in job.writes if w.exception()), None)
+        if error:
+            return error, None
+        return None, _traced(self._move_all, (job.moves,))
+
+    @staticmethod
+    def _move_all(moves):
+        for src, dst in moves:
+            try:
+                with resizeMetrics.stage('move'):
+                    os.rename(src, dst)
+            except OSError as e:
+                print(f"\nError moving {src} to {dst}: {e}")
+
+    def _finished(self, finishing):
+        # Called on the compute thread: the records of held back callbacks
+        # use the same connections as the rest of the job
+        for future in [f for f in finishing if f.done()]:
+            job, status, trace = finishing.pop(future)
+            error, move_trace = future.result()
+            for write in job.writes:
+                if not write.exception():
+                    resizeMetrics.merge(trace, write.result())
+            if error:
+                print(f"\nError writing the outputs of {job.item}: {error}")
+                status = "failed"
+                if job.claimed:
+                    src, dst = job.claimed
+                    try:
+                        os.rename(dst, src)
+                    except OSError:
+                        pass
+            else:
+                resizeMetrics.merge(trace, move_trace)
+                for func, args in job.callbacks:
+                    func(*args)
+            for func, args in job.cleanups:
+                func(*args)
+            if trace is not None:
+                trace['status'] = status
+            yield status, trace
+
+    def close(self):
+        self.readers.shutdown(wait=False, cancel_futures=True)
+        self.writers.shutdown(wait=True)
+
+    def __enter__(self):
+        global _pipeline
+        _pipeline = self
+        return self
+
+    def __exit__(self, *exc):
+        global _pipeline
+        _pipeline = None
+        self.close()
+
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _traced(func, args):
+    # Writes and moves run on other threads; their stage times and bytes are
+    # collected in a trace of their own and added to the job's trace later
+    resizeMetrics.begin('write-behind')
+    try:
+        func(*args)
+    finally:
+        trace = resizeMetrics.end('done')
+    return trace
+
+
+def current_job():
+    """The pipeline Job of the process_file call running on this thread, or None."""
+    return getattr(_local, 'job', None)
+
+
+def source_bytes(path):
+    """The bytes the read-ahead stage loaded for path, or None to read it directly."""
+    job = current_job()
+    future = job.sources.get(path) if job else None
+    if future is None:
+        return None
+    try:
+        return future.result()
+    except OSError:
+        # Read it again directly, so the error is reported where it happens
+        return None
+
+
+def write_behind(func, *args):
+    """
+    Hand an output write (func(*args)) of the current job to the write-behind
+    stage. Returns False when no pipeline runs, and the caller writes now.
+    """
+    job = current_job()
+    if job is None:
+        return False
+    job.writes.append(_pipeline.write(func, args))
+    return True
+
+
+def defer_move(src, dst):
+    """
+    Called by move_file(). Moves after the first output write of a job are
+    held back until its outputs are written (returns True). Earlier moves,
+    such as renaming a source to mark it as taken, happen right away; the
+    prefetched bytes follow the file to its new name.
+    """
+    job = current_job()
+    if job is None:
+        return False
+    if job.writes:
+        job.moves.append((src, dst))
+        return True
+    future = job.sources.pop(src, None)
+    if future is not None:
+        # Windows cannot rename a file that a read-ahead thread still has open
+        wait([future])
+        job.sources[dst] = future
+    job.claimed = (job.claimed[0] if job.claimed else src, dst)
+    return False
+
+
+def after_writes(func, *args):
+    """
+    Hold back func(*args), a record that an output exists, until the current
+    job's outputs are written. Returns False when nothing is pending, and the
+    caller records now.
+    """
+    job = current_job()
+    if job is None or not job.writes:
+        return False
+    job.callbacks.append((func, args))
+    return True
+
+
+def after_job(func, *args):
+    """
+    Hold back func(*args) until the current job is finished, whether its
+    outputs were written or not (after its moves, or after its source was
+    renamed back). Returns False when no pipeline runs, and the caller runs
+    it now.
+    """
+    job = current_job()
+    if job is None:
+        return False
+    job.cleanups.append((func, args))
+    return True
@@ -0,0 +1,354 @@
+"""
+Leases that let several processes, or several machines sharing a folder,
+drain one input folder together without processing a file twice.
+
+Before a job starts on a file, run_jobs() (with claim_folder) takes the
+file's lease: a small JSON file in the .leases folder next to it, created
+with O_CREAT | O_EXCL, which succeeds for exactly one process even on
+network file systems. The lease holds the owner (host, process and a random
+ID), the path the file is being worked on under and a heartbeat timestamp.
+A thread in every process holding leases rewrites the heartbeat every
+HEARTBEAT_SECONDS; a lease not renewed for LEASE_SECONDS belongs to a
+process that died or hung, and may be taken over.
+
+A lease is given back once the file was moved to its done/failed name or
+folder, so a file keeps its original name only while nobody else can take
+it, and a name listed by a slower scan after that is found gone. Leases of
+files that were renamed while they were worked on (the -PROCESSING- names)
+are recovered by recover(): when a run starts, and with --watch every
+LEASE_SECONDS, expired leases are taken over and their files renamed back
+to their original name, to be picked up again instead of being left behind.
+
+Taking over an expired lease renames it to a name of the taker's own first,
+which only one process can do; a taker that finds it moved a lease renewed
+in the meantime puts it back with a hard link, which never overwrites a lease
+another process created there in between. Hosts need reasonably synchronized
+clocks (e.g. NTP) compared to LEASE_SECONDS.
+
+Usage (throughput of N processes draining one folder):
+    python workLease.py demo --processes 1 2 4 --count 60
+    python workLease.py demo --variant o3mini-high --io-latency 30
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+
+# Folder inside the input folder that holds the lease files
+LEASE_FOLDER = '.leases'
+LEASE_SUFFIX = '.lease'
+# A lease not renewed for this long may be taken over
+LEASE_SECONDS = 120
+HEARTBEAT_SECONDS = 20
+
+# Leases this process holds: lease path -> Lease
+_held = {}
+_lock = threading.Lock()
+# (pid, owner ID) of this process; worker processes get their own
+_owner = (None, None)
+_heartbeat = None
+
+
+class Lease:
+    """A claim on one file, see claim()."""
+
+    def __init__(self, lease_path, path):
+        self.lease_path = lease_path
+        # The name the file had when it was claimed, and where it is now
+        self.original = path
+        self.path = path
+        self.claimed = time.time()
+
+    def record(self):
+        return json.dumps({'owner': owner_id(), 'host': socket.gethostname(), 'pid': os.getpid(),
+                           'original': self.original, 'path': self.path,
+                           'claimed': self.claimed, 'heartbeat': time.time()})
+
+    def write(self):
+        """Rewrite the lease in place; False if it is no longer ours."""
+        record = read_lease(self.lease_path)
+        if record is not None and record.get('owner') != owner_id():
+            return False
+        try:
+            fd = os.open(self.lease_path, os.O_WRONLY)
+        except FileNotFoundError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            f.write(self.record())
+            f.truncate()
+        return True
+
+    def release(self):
+        """Give the lease back, unless it was taken over in the meantime."""
+        with _lock:
+            _held.pop(self.lease_path, None)
+            record = read_lease(self.lease_path)
+            if record is None or record.get('owner') == owner_id():
+                try:
+                    os.remove(self.lease_path)
+                except FileNotFoundError:
+                    pass
+
+
+def owner_id():
+    """host:pid:random, unique to this process."""
+    global _owner
+    if _owner[0] != os.getpid():
+        _owner = (os.getpid(), f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}")
+    return _owner[1]
+
+
+def lease_path(path):
+    folder, name = os.path.split(path)
+    return os.path.join(folder, LEASE_FOLDER, name + LEASE_SUFFIX)
+
+
+def read_lease(path):
+    """The lease record at path, None if there is none, {} if it is being written."""
+    try:
+        with open(path) as f:
+            text = f.read()
+    except FileNotFoundError:
+        return None
+    try:
+        return json.loads(text)
+    except ValueError:
+        return {}
+
+
+def expired(path, record, now=None):
+    """Whether the lease at path was not renewed for LEASE_SECONDS."""
+    now = now or time.time()
+    heartbeat = record.get('heartbeat')
+    if heartbeat is None:
+        # Half written (or a crash while writing): judge by the file's age
+        try:
+            heartbeat = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return False
+    return now - heartbeat > LEASE_SECONDS
+
+
+def claim(path):
+    """
+    Take the lease of the file at path. Returns the Lease, or None when
+    another process holds it or the file is gone (already done elsewhere).
+    """
+    lease = Lease(lease_path(path), path)
+    os.makedirs(os.path.dirname(lease.lease_path), exist_ok=True)
+    for _ in range(2):
+        try:
+            fd = os.open(lease.lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            record = read_lease(lease.lease_path)
+            if record is None:
+                continue
+            if not expired(lease.lease_path, record) or not take_over(lease.lease_path, record):
+                return None
+            continue
+        with os.fdopen(fd, 'w') as f:
+            f.write(lease.record())
+        if not os.path.exists(path):
+            lease.release()
+            return None
+        with _lock:
+            _held[lease.lease_path] = lease
+        _start_heartbeat()
+        return lease
+    return None
+
+
+def take_over(path, record):
+    """
+    Remove the expired lease at path (read as record), putting its file back
+    under its original name. False if another process got there first.
+    """
+    taken = f"{path}.{owner_id().replace(':', '-')}"
+    try:
+        os.rename(path, taken)
+    except FileNotFoundError:
+        return False
+    if read_lease(taken) != record:
+        # Renewed, or replaced by another taker, after it was read: put it back
+        restore(taken, path)
+        return False
+    original, current = record.get('original'), record.get('path')
+    if current and current != original and os.path.exists(current) and not os.path.exists(original):
+        try:
+            os.rename(current, original)
+        except OSError as e:
+            print(f"\nError recovering {current}: {e}")
+    os.remove(taken)
+    return True
+
+
+def restore(taken, path):
+    """
+    Move a lease moved aside by take_over() back to path, unless a new lease
+    was created there in the meantime; that one stays and this one is dropped
+    (its owner finds it lost at its next heartbeat).
+    """
+    try:
+        os.link(taken, path)
+    except FileExistsError:
+        pass
+    except OSError:
+        # No hard links on this file system: copy it, also never over a lease
+        with open(taken, 'rb') as f:
+            data = f.read()
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+    os.remove(taken)
+
+
+def moved(src, dst):
+    """
+    Called by move_file(claim=True) before it renames a claimed file to mark
+    it as taken (its -PROCESSING- name). The new name is recorded in the
+    lease, so recover() can rename it back. Only renames within the file's
+    folder are: a move into done/ or failed/ ends the job, and undoing it
+    after a crash would process the file again.
+    """
+    with _lock:
+        lease = _held.get(lease_path(src))
+        if lease is None or lease.path != src or src != lease.original:
+            return
+        if os.path.dirname(os.path.abspath(src)) != os.path.dirname(os.path.abspath(dst)):
+            return
+        lease.path = dst
+        lease.write()
+
+
+def recover(folder):
+    """Take over the expired leases in folder; returns the number taken over."""
+    leases = os.path.join(folder, LEASE_FOLDER)
+    try:
+        names = [name for name in os.listdir(leases) if name.endswith(LEASE_SUFFIX)]
+    except FileNotFoundError:
+        return 0
+    now = time.time()
+    recovered = 0
+    for name in names:
+        path = os.path.join(leases, name)
+        record = read_lease(path)
+        if record and expired(path, record, now) and take_over(path, record):
+            recovered += 1
+    return recovered
+
+
+def recover_periodically(folder):
+    """recover() every LEASE_SECONDS on a daemon thread, for --watch."""
+    def loop():
+        while True:
+            time.sleep(LEASE_SECONDS)
+            try:
+                recover(folder)
+            except OSError as e:
+                print(f"\nError recovering leases in {folder}: {e}")
+    threading.Thread(target=loop, name='lease-recovery', daemon=True).start()
+
+
+def _start_heartbeat():
+    global _heartbeat
+    if _heartbeat is not None and _heartbeat[0] == os.getpid():
+        return
+    thread = threading.Thread(target=_renew_leases, name='lease-heartbeat', daemon=True)
+    _heartbeat = (os.getpid(), thread)
+    thread.start()
+
+
+def _renew_leases():
+    while True:
+        time.sleep(HEARTBEAT_SECONDS)
+        with _lock:
+            for path, lease in list(_held.items()):
+                try:
+                    if not lease.write():
+                        print(f"\nLost the lease of {lease.original}")
+                        del _held[path]
+                except OSError as e:
+                    print(f"\nError renewing the lease of {lease.original}: {e}")
+
+
+def run_worker(variant, input_folder, output_folder, io_latency):
+    """One demo process: a variant draining input_folder, with simulated storage latency."""
+    import benchmarkResize
+    module = benchmarkResize.load_variant(variant)
+    with benchmarkResize.simulated_latency(io_latency / 1000):
+        module.process_images(input_folder, output_folder)
+
+
+def check_outputs(count, input_folder, output_folder):
+    """(outputs, sources processed more than once, sources not processed) of a demo run."""
+    outputs = [name for name in os.listdir(output_folder) if os.path.isfile(os.path.join(output_folder, name))]
+    seen = {}
+    for name in outputs:
+        source = name.split('-')[0]
+        seen[source] = seen.get(source, 0) + 1
+    twice = sum(1 for n in seen.values() if n > 1)
+    return len(outputs), twice, count - len(seen)
+
+
+def demo(processes, count, variant, io_latency, seed=0):
+    """Drain a synthetic folder with 1, 2, ... processes and print throughput per process count."""
+    import benchmarkResize
+    path = benchmarkResize.find_variants([variant]).get(variant)
+    if not path:
+        print(f"Error: No variant named '{variant}'.")
+        sys.exit(1)
+    with tempfile.TemporaryDirectory(prefix='work-lease-') as scratch:
+        corpus = os.path.join(scratch, 'corpus')
+        benchmarkResize.make_corpus(corpus, count, seed)
+        print(f"{count} images, {variant}, {io_latency} ms storage latency")
+        print(f"{'processes':>9} {'seconds':>8} {'img/s':>7} {'speedup':>8} {'outputs':>8} {'twice':>6} {'missed':>7}")
+        baseline = None
+        for n in processes:
+            input_folder = os.path.join(scratch, f'in-{n}')
+            output_folder = os.path.join(scratch, f'out-{n}')
+            shutil.copytree(corpus, input_folder, ignore=shutil.ignore_patterns('corpus.json'))
+            os.makedirs(output_folder)
+            command = [sys.executable, os.path.abspath(__file__), '--run-worker', path,
+                       input_folder, output_folder, str(io_latency)]
+            start = time.perf_counter()
+            workers = [subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                       for _ in range(n)]
+            for worker in workers:
+                worker.wait()
+            seconds = time.perf_counter() - start
+            rate = count / seconds
+            baseline = baseline or rate
+            outputs, twice, missed = check_outputs(count, input_folder, output_folder)
+            print(f"{n:>9} {seconds:8.2f} {rate:7.2f} {rate / baseline:7.2f}x {outputs:>8} {twice:>6} {missed:>7}")
+
+
+def main():
+    if len(sys.argv) == 6 and sys.argv[1] == '--run-worker':
+        run_worker(sys.argv[2], sys.argv[3], sys.argv[4], float(sys.argv[5]))
+        return
+    parser = argparse.ArgumentParser(description='Work leases for draining one folder from several processes.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('demo', help='Throughput of N processes draining one synthetic folder')
+    run.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4])
+    run.add_argument('--count', type=int, default=60, help='Images in the folder (default: 60)')
+    run.add_argument('--variant', default='qwen25max-q1', help='imageResize variant (default: qwen25max-q1)')
+    run.add_argument('--io-latency', type=float, default=0, metavar='MS',
+                     help='Delay added to every file open, rename and link, as on network storage')
+    args = parser.parse_args()
+    demo(args.processes, args.count, args.variant, args.io_latency)
+
+
+if __name__ == "__main__":
+    main()